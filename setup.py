@@ -199,7 +199,10 @@ setuptools.setup(
     packages=setuptools.find_packages(where="src"),
     entry_points={
         "console_scripts": [
-            "virt-scenario=virtscenario.main:main",
+            "virt-scenario=virtscenario.cli:main",
+            "virt-scenario-batch=virtscenario.batch:main",
+            "virt-scenario-bench=virtscenario.bench:main",
+            "virt-scenario-fleet=virtscenario.fleet:main",
         ]
     },
     classifiers=[
@@ -219,6 +222,6 @@ setuptools.setup(
                 ("share/virt-scenario/", glob("src/virt-scenario/*.py")),
                 (("share/virt-scenario", ["src/virtscenario.yaml"])),
                 ],
-    extras_require={"dev": ["pylint"]},
-    install_requires=['PyYAML', 'pyudev'],
+    extras_require={"dev": ["pylint"], "validate": ["lxml"], "libvirt": ["libvirt-python"]},
+    install_requires=['PyYAML'],
 )
@@ -19,7 +19,6 @@ virt scenario
 """
 
 import gettext
-import virtscenario.main
 
 gettext.bindtextdomain("virtscenario", "/usr/share/locale")
 gettext.textdomain("virtscenario")
@@ -31,3 +30,5 @@ except IOError:
     builtins.__dict__["_"] = str
 
 __version__ = "0.6.0"
+# all scenarios of the terminal, batch and fleet modes
+SCENARIOS = ['computation', 'desktop', 'securevm', 'softrtvm']
@@ -18,11 +18,11 @@
 runpy entry point allowing to run the tool with python3 -m pvirsh
 """
 
-import virtscenario.main
+import virtscenario.cli
 
 if __name__ == "__main__":
     try:
-        virtscenario.main.main()
+        exit(virtscenario.cli.main())
     except KeyboardInterrupt:
         print('Cancelled by user.')
         exit(1)
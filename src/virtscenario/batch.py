@@ -0,0 +1,377 @@
+# Authors: Antoine Ginies <aginies@suse.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Batch mode: render many guests XML config from one manifest
+
+Manifest example:
+conf: /etc/virtscenario.yaml
+output: /var/lib/virt-scenario/xml
+guests:
+  - scenario: computation
+    name: compute
+    count: 100
+    vcpu: 4
+    memory: 8
+    disk:
+      capacity: 40
+    pinning: false
+  - scenario: desktop
+    name: desk01
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import virtscenario
+import virtscenario.util as util
+
+# incremental mode: inputs hash of each guest rendered in the output directory
+STATE_FILE = ".virt-scenario-state.json"
+# NUMA plan of all guests, stored in the output directory
+PLAN_FILE = "numa-plan.json"
+
+def load_manifest(file):
+    """
+    read the manifest and expand all guests entries
+    return None if two guests have the same name (same XML file)
+    """
+    manifest = util.load_yaml(file)
+    if isinstance(manifest, list):
+        manifest = {'guests': manifest}
+
+    guests = []
+    for entry in manifest.get('guests', []):
+        if entry.get('scenario') not in virtscenario.SCENARIOS:
+            util.print_error("Unknow scenario: "+str(entry.get('scenario')))
+            continue
+        name = entry.get('name', entry['scenario'])
+        count = int(entry.get('count', 1))
+        for index in range(1, count+1):
+            todo = dict(entry)
+            todo.pop('count', None)
+            if count > 1:
+                todo['name'] = name+"-"+str(index)
+            else:
+                todo['name'] = name
+            guests.append(todo)
+
+    names = set()
+    duplicates = set()
+    for guest in guests:
+        if guest['name'] in names:
+            duplicates.add(guest['name'])
+        names.add(guest['name'])
+    if duplicates:
+        util.print_error("Duplicate guest names in "+file+": "+", ".join(sorted(duplicates)))
+        return None
+    set_macaddresses(guests)
+    return guests
+
+def set_macaddresses(guests):
+    """
+    a mac address for each guest, unique in the manifest: the stable one of
+    its name, derived again on collision (24 bits: likely with many guests)
+    the guests are done by name, the order of the manifest does not matter
+    """
+    used = set(guest['mac'].upper() for guest in guests if guest.get('mac'))
+    for guest in sorted(guests, key=lambda guest: guest['name']):
+        if guest.get('mac'):
+            continue
+        retry = 0
+        mac = util.stable_macaddress(guest['name'])
+        while mac in used:
+            retry += 1
+            mac = util.stable_macaddress(guest['name'], retry)
+        used.add(mac)
+        guest['mac'] = mac
+
+def manifest_option(file, option):
+    """
+    return a top level option of the manifest (conf, output)
+    """
+    manifest = util.load_yaml(file)
+    if isinstance(manifest, dict):
+        return manifest.get(option)
+    return None
+
+def guest_prompt(conffile, entry):
+    """
+    a non interactive prompt set up for one manifest entry
+    """
+    import virtscenario.main as main
+    prompt = main.MyPrompt()
+    prompt.conffile = conffile
+    prompt.mode = "guest"
+    prompt.interactive = False
+    prompt.dataprompt = {
+        'name': entry['name'],
+        'vcpu': entry.get('vcpu'),
+        'memory': entry.get('memory'),
+        'machine': entry.get('machine'),
+        'bootdev': entry.get('bootdev'),
+        'path': entry.get('path', '/var/libvirt/images'),
+        }
+    prompt.listosdef = dict(main.MyPrompt.listosdef)
+    prompt.storage_override = dict(entry.get('disk') or {})
+    prompt.macaddress = entry.get('mac')
+    # guests are rendered independently: pinning only on request, a real
+    # time guest is always pinned
+    prompt.numa_pinning = entry.get('pinning', entry['scenario'] == "softrtvm")
+    if 'planned' in entry:
+        # NUMA plan of all guests: a guest not placed is not pinned
+        prompt.planned = entry['planned']
+        prompt.numa_pinning = entry['planned'] is not None
+    return prompt
+
+def render_guest(conffile, entry):
+    """
+    render one guest XML config, called in a worker process
+    """
+    start = time.perf_counter()
+    result = {
+        'name': entry['name'],
+        'scenario': entry['scenario'],
+        'error': None,
+    }
+    prompt = guest_prompt(conffile, entry)
+
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            getattr(prompt, "do_"+entry['scenario'])("")
+        result['error'] = prompt.failed
+        result['filename'] = os.path.abspath(prompt.filename)
+        result['hugepages'] = prompt.hugepages_guest
+    except Exception as exc:
+        result['error'] = str(exc)
+    result['log'] = output.getvalue()
+    result['time'] = time.perf_counter() - start
+    return result
+
+def inputs_hash(config, entry):
+    """
+    hash of everything used to render a guest: version, templates,
+    configuration file and manifest entry
+    """
+    import virtscenario
+    import virtscenario.template as template
+    with open(template.__file__, 'rb') as file_h:
+        templates = hashlib.sha256(file_h.read()).hexdigest()
+    inputs = {
+        'version': virtscenario.__version__,
+        'templates': templates,
+        'config': config,
+        'entry': entry,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode('UTF-8')).hexdigest()
+
+def load_state(outdir):
+    """
+    guests rendered in outdir by a previous run
+    """
+    try:
+        with open(os.path.join(outdir, STATE_FILE)) as file_h:
+            return json.load(file_h)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(outdir, state):
+    """
+    store the guests rendered in outdir
+    """
+    with open(os.path.join(outdir, STATE_FILE), 'w') as file_h:
+        json.dump(state, file_h, indent=1, sort_keys=True)
+
+def run_batch(guests, conffile, outdir, jobs=None, quiet=False, incremental=False):
+    """
+    render all guests through a process pool
+    incremental: only the guests with changed inputs
+    return the list of result and the throughput (guests/s)
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    conffile = os.path.abspath(conffile)
+    os.makedirs(outdir, exist_ok=True)
+
+    # parse the configuration once: forked workers inherit it
+    import virtscenario.main as main
+    config = main.read_conffile(conffile)
+
+    skipped = {}
+    todo = guests
+    if incremental is True:
+        state = load_state(outdir)
+        hashes = {guest['name']: inputs_hash(config, guest) for guest in guests}
+        todo = []
+        for guest in guests:
+            previous = state.get(guest['name'], {})
+            if previous.get('hash') == hashes[guest['name']] and os.path.isfile(previous.get('filename', "")):
+                skipped[guest['name']] = {
+                    'name': guest['name'],
+                    'scenario': guest['scenario'],
+                    'error': None,
+                    'skipped': True,
+                    'filename': previous['filename'],
+                    'hugepages': previous.get('hugepages'),
+                    'log': "",
+                    'time': 0.0,
+                    }
+            else:
+                todo.append(guest)
+    chunksize = max(1, len(todo) // (jobs * 4))
+
+    start = time.perf_counter()
+    rendered = []
+    if todo:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=os.chdir,
+                                 initargs=(os.path.abspath(outdir),)) as executor:
+            rendered = list(executor.map(render_guest, [conffile] * len(todo), todo,
+                                         chunksize=chunksize))
+    elapsed = time.perf_counter() - start
+    throughput = len(todo) / elapsed if elapsed > 0 else 0.0
+    # keep the manifest order
+    byname = {res['name']: res for res in rendered}
+    byname.update(skipped)
+    results = [byname[guest['name']] for guest in guests]
+
+    if incremental is True:
+        newstate = {}
+        for res in results:
+            if res['error'] is None:
+                newstate[res['name']] = {
+                    'hash': hashes[res['name']],
+                    'filename': res['filename'],
+                    'hugepages': res.get('hugepages'),
+                    }
+        save_state(outdir, newstate)
+
+    if quiet is False:
+        errors = 0
+        for res in results:
+            if res['error'] is not None:
+                errors += 1
+                util.print_error(res['name']+": "+res['error'])
+        util.print_summary("\nBatch rendering")
+        print("Guests: "+str(len(guests))+" Errors: "+str(errors)+" Jobs: "+str(jobs))
+        if incremental is True:
+            print("Rendered: "+str(len(todo))+" Unchanged: "+str(len(skipped)))
+        print("Output: "+os.path.abspath(outdir))
+        util.print_ok("{:.2f}s, {:.1f} guests/s".format(elapsed, throughput))
+    return results, throughput
+
+def benchmark(guests, conffile, jobs=None):
+    """
+    throughput benchmark: serial VS process pool rendering
+    """
+    util.print_summary("\nBatch benchmark ("+str(len(guests))+" guests)")
+    bench = {}
+    for todo in [1, jobs or os.cpu_count() or 1]:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _, throughput = run_batch(guests, conffile, tmpdir, todo, quiet=True)
+        bench[todo] = throughput
+        print("jobs {:>3d}: {:8.1f} guests/s".format(todo, throughput))
+    return bench
+
+def show_hugepages(results):
+    """
+    hugepages pools needed on this host by all rendered guests
+    """
+    import virtscenario.host as host
+    import virtscenario.hugepages as hp
+    guests = [res['hugepages'] for res in results if res.get('hugepages') is not None]
+    util.print_summary("\nHuge Pages pools for "+str(len(guests))+" guests")
+    hp.show_plan(hp.plan_pages(guests, host.host_facts()))
+
+def numa_plan(guests, outdir):
+    """
+    place all guests on the NUMA nodes of this host, each rendered guest
+    is pinned on the cpus planned for it
+    """
+    import virtscenario.host as host
+    import virtscenario.planner as planner
+    facts = host.host_facts()
+    plan = planner.plan_guests(facts, planner.guest_requests(guests, facts))
+    planner.show_plan(plan)
+    placements = planner.plan_placements(plan)
+    for guest in guests:
+        guest['planned'] = placements.get(guest['name'])
+    os.makedirs(outdir, exist_ok=True)
+    with open(os.path.join(outdir, PLAN_FILE), 'w') as file_h:
+        json.dump(plan, file_h, indent=1)
+    return plan
+
+def define_results(results, uri=None):
+    """
+    define all rendered guests over one libvirt connection
+    """
+    import virtscenario.libvirtconn as libvirtconn
+    files = [res['filename'] for res in results if res['error'] is None]
+    defined = libvirtconn.define_domains(files, uri)
+    if defined is None:
+        util.print_error("No libvirt connection, the guests are not defined")
+        return False
+    libvirtconn.show_define(defined)
+    return all(res['error'] is None for res in defined)
+
+def main():
+    """
+    virt-scenario-batch
+    """
+    parser = argparse.ArgumentParser(description="Render guests XML config from a manifest")
+    parser.add_argument("manifest", help="YAML manifest of guests to render")
+    parser.add_argument("-c", "--conf", help="virt-scenario configuration file")
+    parser.add_argument("-o", "--output", help="directory to store the XML files")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker process")
+    parser.add_argument("--benchmark", action="store_true", help="show throughput (guests/s)")
+    parser.add_argument("-i", "--incremental", action="store_true",
+                        help="only render the guests with changed inputs")
+    parser.add_argument("--numa-plan", action="store_true",
+                        help="place all guests on the host NUMA nodes and pin them")
+    parser.add_argument("--hugepages", action="store_true",
+                        help="show the hugepages pools needed by all guests")
+    parser.add_argument("--define", action="store_true",
+                        help="define all rendered guests through libvirt")
+    parser.add_argument("--connect", metavar="URI", help="libvirt URI (default: libvirt default)")
+    args = parser.parse_args()
+
+    guests = load_manifest(args.manifest)
+    if guests is None:
+        return 1
+    conffile = args.conf or manifest_option(args.manifest, 'conf') or "/etc/virtscenario.yaml"
+    if os.path.isfile(conffile) is False:
+        util.print_error(conffile+" configuration Yaml file Not found!")
+        return 1
+    if args.benchmark is True:
+        benchmark(guests, conffile, args.jobs)
+        return 0
+    outdir = args.output or manifest_option(args.manifest, 'output') or os.getcwd()
+    if args.numa_plan is True:
+        numa_plan(guests, outdir)
+    results, _ = run_batch(guests, conffile, outdir, args.jobs, incremental=args.incremental)
+    if args.hugepages is True:
+        show_hugepages(results)
+    if args.define is True and define_results(results, args.connect) is False:
+        return 1
+    return int(any(res['error'] is not None for res in results))
+
+if __name__ == "__main__":
+    exit(main())
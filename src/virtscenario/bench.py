@@ -0,0 +1,547 @@
+# Authors: Antoine Ginies <aginies@suse.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmarks: XML rendering and host probes, against a fake host
+(/proc, /sys and a stub virsh), libvirt API against test:///default,
+results stored as JSON
+
+virt-scenario-bench -o 0.6.json
+virt-scenario-bench -o new.json --compare 0.6.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+import virtscenario
+import virtscenario.util as util
+
+# fake host: 2 NUMA nodes of 4 cores / 8 threads
+FAKE_NODES = 2
+FAKE_CORES = 4
+FAKE_FLAGS = "fpu vme de pse tsc msr pae mce cx8 apic sep mtrr pge mca cmov pat pse36 \
+clflush mmx fxsr sse sse2 ht syscall nx mmxext fxsr_opt pdpe1gb rdtscp lm svm sev sev_es"
+
+FAKE_DOMCAPABILITIES = """<domainCapabilities>
+  <path>/usr/bin/qemu-system-x86_64</path>
+  <domain>kvm</domain>
+  <features>
+    <sev supported='yes'>
+      <cbitpos>51</cbitpos>
+      <reducedPhysBits>1</reducedPhysBits>
+      <maxGuests>15</maxGuests>
+      <maxESGuests>494</maxESGuests>
+    </sev>
+  </features>
+</domainCapabilities>
+"""
+
+# NUMA planner: a big host and a set of guests of all scenarios
+PLANNER_NODES = 8
+PLANNER_CORES = 64
+PLANNER_GUESTS = 5000
+
+FAKE_BLOCK = [
+    ('nvme0n1', "259:0", "0", "[none] mq-deadline kyber"),
+    ('sda', "8:0", "1", "[mq-deadline] kyber bfq none"),
+    ('dm-0', "254:0", "0", "none"),
+]
+
+FAKE_CONF = """emulator:
+  - emulator: /usr/bin/qemu-system-x86_64
+input:
+  - keyboard: virtio
+  - mouse: virtio
+architecture:
+  - arch: x86_64
+STORAGE_DATA:
+  - disk_type: file
+  - disk_target: vda
+  - disk_bus: virtio
+  - path: ${path}
+  - unit: G
+  - capacity: 20
+  - cluster_size: 2M
+  - compression_type: zlib
+"""
+
+def write(root, path, data):
+    """
+    write a file of the fake host
+    """
+    file = os.path.join(root, path.lstrip('/'))
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    with open(file, 'w') as file_h:
+        file_h.write(data)
+    return file
+
+def stub_command(root, name, output):
+    """
+    executable in root/bin printing output
+    """
+    file = write(root, "/bin/"+name, "#!/bin/sh\ncat <<'EOF'\n"+output+"EOF\n")
+    os.chmod(file, os.stat(file).st_mode | stat.S_IXUSR)
+
+def make_fake_root(root):
+    """
+    create a fake /proc, /sys, stub commands and a config file
+    """
+    threads = FAKE_NODES * FAKE_CORES * 2
+    cpuinfo = ""
+    for cpu in range(threads):
+        cpuinfo += "processor\t: "+str(cpu)+"\nflags\t\t: "+FAKE_FLAGS+"\n\n"
+    write(root, "/proc/cpuinfo", cpuinfo)
+    write(root, "/proc/meminfo", "MemTotal: 67108864 kB\nMemFree: 60000000 kB\n"
+          "MemAvailable: 62000000 kB\nHugePages_Total: 0\nHugepagesize: 2048 kB\n")
+    write(root, "/proc/sys/kernel/random/boot_id", "00000000-0000-0000-0000-000000000000\n")
+    write(root, "/sys/module/kvm_amd/parameters/sev", "Y\n")
+    write(root, "/sys/devices/system/cpu/online", "0-"+str(threads-1)+"\n")
+
+    for node in range(FAKE_NODES):
+        # thread siblings: cpu N and N + number of cores
+        cpus = []
+        for core in range(node * FAKE_CORES, (node + 1) * FAKE_CORES):
+            siblings = [core, core + FAKE_NODES * FAKE_CORES]
+            cpus += siblings
+            for cpu in siblings:
+                path = "/sys/devices/system/cpu/cpu"+str(cpu)+"/topology/"
+                write(root, path+"physical_package_id", str(node)+"\n")
+                write(root, path+"core_id", str(core)+"\n")
+                write(root, path+"thread_siblings_list", util.cpulist_to_str(siblings)+"\n")
+        path = "/sys/devices/system/node/node"+str(node)
+        write(root, path+"/cpulist", util.cpulist_to_str(sorted(cpus))+"\n")
+        write(root, path+"/meminfo", "Node "+str(node)+" MemTotal: 33554432 kB\n"
+              "Node "+str(node)+" MemFree: 30000000 kB\n")
+        for size in ["2048", "1048576"]:
+            write(root, path+"/hugepages/hugepages-"+size+"kB/nr_hugepages", "0\n")
+            write(root, path+"/hugepages/hugepages-"+size+"kB/free_hugepages", "0\n")
+
+    # nvme0n1p1 under dm-0, a rotational sda
+    for name, dev, rotational, scheduler in FAKE_BLOCK:
+        path = "/sys/block/"+name
+        write(root, path+"/dev", dev+"\n")
+        write(root, path+"/queue/rotational", rotational+"\n")
+        write(root, path+"/queue/scheduler", scheduler+"\n")
+    write(root, "/sys/block/nvme0n1/nvme0n1p1/partition", "1\n")
+    write(root, "/sys/block/dm-0/slaves/nvme0n1p1", "")
+
+    stub_command(root, "virsh", FAKE_DOMCAPABILITIES)
+    stub_command(root, "systemd-detect-virt", "none\n")
+    os.makedirs(os.path.join(root, "images"), exist_ok=True)
+    return write(root, "/virtscenario.yaml",
+                 FAKE_CONF.replace("${path}", os.path.join(root, "images")))
+
+@contextlib.contextmanager
+def fake_host(root):
+    """
+    point the host probes to the fake root, stub commands first in PATH
+    """
+    import virtscenario.host as host
+    import virtscenario.hostfacts as hostfacts
+    import virtscenario.placement as placement
+    import virtscenario.libvirtconn as libvirtconn
+    paths = ['BOOT_ID', 'CPUINFO', 'MEMINFO', 'NODE_PATH', 'CPU_PATH', 'KVM_AMD_SEV', 'BLOCK_PATH']
+    saved = {name: getattr(hostfacts, name) for name in paths}
+    saved_qemu = placement.LIBVIRT_QEMU
+    saved_path = os.environ.get('PATH', '')
+    for name in paths:
+        setattr(hostfacts, name, os.path.join(root, getattr(hostfacts, name).lstrip('/')))
+    placement.LIBVIRT_QEMU = os.path.join(root, "etc/libvirt/qemu")
+    # the host probes must use the stub virsh, not the libvirt of this host
+    libvirtconn.USE_API = False
+    os.environ['PATH'] = os.path.join(root, "bin")+os.pathsep+saved_path
+    # no cache file: each probe really reads the fake host
+    host.FACTS = hostfacts.HostFacts(cachefile=None)
+    try:
+        yield host.FACTS
+    finally:
+        for name, value in saved.items():
+            setattr(hostfacts, name, value)
+        placement.LIBVIRT_QEMU = saved_qemu
+        libvirtconn.USE_API = True
+        os.environ['PATH'] = saved_path
+        host.FACTS = None
+
+def timeit(func, number, setup=None):
+    """
+    call func number times, setup is called before each call (not timed)
+    """
+    times = []
+    for _ in range(number):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    total = sum(times)
+    return {
+        'calls': number,
+        'total': total,
+        'mean': total / number,
+        'min': min(times),
+        'per_s': number / total if total > 0 else 0.0,
+    }
+
+def bench_scenarios(conffile, number):
+    """
+    end to end rendering of each scenario, and create_xml_config alone
+    """
+    import virtscenario.batch as batch
+    import virtscenario.main as main
+    results = {}
+    for scenario in virtscenario.SCENARIOS:
+        entry = {'scenario': scenario, 'name': "bench-"+scenario, 'pinning': True}
+        prompt = batch.guest_prompt(conffile, entry)
+        todo = getattr(prompt, "do_"+scenario)
+        with contextlib.redirect_stdout(io.StringIO()):
+            results["scenario."+scenario] = timeit(lambda: todo(""), number)
+            results["create_xml_config."+scenario] = timeit(lambda: main.create_xml_config(prompt),
+                                                            number)
+    return results
+
+def bench_fragments(number):
+    """
+    cost of the guest.create_* fragments, cold (empty cache) and warm
+    """
+    import virtscenario.guest as guest
+    import virtscenario.scenario as s
+    import virtscenario.configuration as c
+    computation = s.Scenarios().computation()
+    data = c.BasicConfiguration()
+    storage = {'disk_type': 'file', 'disk_cache': 'none', 'disk_target': 'vda',
+               'disk_bus': 'virtio', 'format': 'qcow2', 'path': '/tmp',
+               'storage_name': 'bench', 'iothread': 1, 'queues': 4}
+    fragments = {
+        'name': lambda: guest.create_name(computation.name),
+        'cpumode': lambda: guest.create_cpumode_pass(computation.cpumode),
+        'power': lambda: guest.create_power(computation.power),
+        'ondef': lambda: guest.create_ondef(computation.ondef),
+        'watchdog': lambda: guest.create_watchdog(computation.watchdog),
+        'interface': lambda: guest.create_interface(computation.network),
+        'features': lambda: guest.create_features(computation.features),
+        'clock': lambda: guest.create_clock(computation.clock),
+        'video': lambda: guest.create_video(computation.video),
+        'disk': lambda: guest.create_disk(storage),
+        'iothreads': lambda: guest.create_iothreads(data.iothreads(2)),
+        'cputune': lambda: guest.create_cputune(data.cputune([0, 1, 2, 3], "4-7")),
+        'numatune': lambda: guest.create_numatune(data.numatune("strict", "0")),
+        'hugepages': lambda: guest.create_hugepages(data.hugepages(2048, "0")),
+        'memballoon': lambda: guest.create_memballoon(data.memballoon("virtio", "on", "on", "10")),
+    }
+    results = {}
+    for name, func in fragments.items():
+        results["fragment."+name+".cold"] = timeit(func, number, setup=guest.render_items.cache_clear)
+        results["fragment."+name] = timeit(func, number)
+    return results
+
+def bench_xmlutil(conffile, number):
+    """
+    parse, patch and serialize a complete domain
+    """
+    import virtscenario.batch as batch
+    import virtscenario.main as main
+    import virtscenario.xmlutil as xmlutil
+    prompt = batch.guest_prompt(conffile, {'scenario': 'computation', 'name': 'bench-xml'})
+    with contextlib.redirect_stdout(io.StringIO()):
+        prompt.do_computation("")
+        root = main.create_xml_config(prompt)
+    xml_all = xmlutil.to_string(root)
+    return {
+        'xmlutil.from_string': timeit(lambda: xmlutil.from_string(xml_all), number),
+        'xmlutil.add_loader_nvram': timeit(lambda: xmlutil.add_loader_nvram(
+            xmlutil.from_string(xml_all), "loader.bin", "nvram.VARS"), number),
+        'xmlutil.to_string': timeit(lambda: xmlutil.to_string(root), number),
+    }
+
+def bench_host(facts, number):
+    """
+    host probes latency: cold (probe the fake host) and warm (facts known)
+    """
+    import virtscenario.host as host
+    import virtscenario.sev as sev
+    import virtscenario.blockdev as blockdev
+    results = {
+        'host.check_cpu_flag.cold': timeit(lambda: host.check_cpu_flag("sev"), number,
+                                           setup=lambda: facts.invalidate('cpu_flags')),
+        'host.check_cpu_flag': timeit(lambda: host.check_cpu_flag("sev"), number),
+        'host.sev_info.cold': timeit(host.sev_info, number, setup=lambda: facts.invalidate('sev')),
+        'host.sev_info': timeit(host.sev_info, number),
+        'sev.host_detect': timeit(lambda: sev.SevInfo().host_detect(), number),
+        'hostfacts.numa': timeit(facts.collect_numa, number),
+        'hostfacts.cpu_topology': timeit(facts.collect_cpu_topology, number),
+        'host.list_all_disk.cold': timeit(host.list_all_disk, number,
+                                          setup=lambda: facts.invalidate('disks')),
+        'host.list_all_disk': timeit(host.list_all_disk, number),
+        'blockdev.plan_knobs': timeit(lambda: blockdev.plan_knobs(
+            host.list_all_disk(), "computation", blockdev.device_stack("dm-0", host.list_all_disk())),
+                                      number),
+    }
+    return results
+
+def planner_facts():
+    """
+    facts of a big host (not probed): PLANNER_NODES nodes of PLANNER_CORES
+    cores / 2 threads, 512 GiB per node
+    """
+    import virtscenario.hostfacts as hostfacts
+    facts = hostfacts.HostFacts(cachefile=None, root=tempfile.gettempdir())
+    threads = PLANNER_NODES * PLANNER_CORES
+    topology = []
+    numa = []
+    for node in range(PLANNER_NODES):
+        cpus = []
+        for core in range(node * PLANNER_CORES, (node + 1) * PLANNER_CORES):
+            siblings = [core, core + threads]
+            cpus += siblings
+            for cpu in siblings:
+                topology.append({'cpu': cpu, 'package': node, 'core': core, 'siblings': siblings})
+        numa.append({
+            'id': node,
+            'cpus': sorted(cpus),
+            'mem_total': 512 * 1024**2,
+            'mem_free': 500 * 1024**2,
+            'hugepages': {'1048576': {'nr': 64, 'free': 64}},
+            })
+    facts.facts = {
+        'cpu_flags': FAKE_FLAGS.split(),
+        'numa': numa,
+        'cpu_topology': sorted(topology, key=lambda cpu: cpu['cpu']),
+        }
+    return facts
+
+def bench_planner(number):
+    """
+    NUMA planner: PLANNER_GUESTS guests of all scenarios on a big host
+    """
+    import virtscenario.planner as planner
+    facts = planner_facts()
+    scenarios = ['computation', 'desktop', 'securevm', 'softrtvm']
+    entries = []
+    for index in range(PLANNER_GUESTS):
+        entries.append({
+            'name': "guest"+str(index),
+            'scenario': scenarios[index % len(scenarios)],
+            'vcpu': [1, 2, 4, 6][index % 4],
+            'memory': [1, 2, 4, 8, 16][index % 5],
+            })
+    guests = planner.guest_requests(entries, facts)
+    return {
+        'planner.guest_requests': timeit(lambda: planner.guest_requests(entries, facts), number),
+        'planner.plan_guests': timeit(lambda: planner.plan_guests(facts, guests, used=set()), number),
+    }
+
+def bench_libvirt(conffile, number):
+    """
+    libvirt API VS virsh subprocess, with the test driver (no libvirtd)
+    return the results and the errors (define or list failed)
+    """
+    import shutil
+    import virtscenario.batch as batch
+    import virtscenario.libvirtconn as libvirtconn
+    import virtscenario.main as main
+    import virtscenario.xmlutil as xmlutil
+    if libvirtconn.available() is False:
+        util.print_warning("libvirt-python not available: libvirt benchmarks skipped")
+        return {}, []
+    uri = libvirtconn.TEST_URI
+    files = []
+    for count in range(10):
+        name = "bench-define"+str(count)
+        prompt = batch.guest_prompt(conffile, {'scenario': 'computation', 'name': name})
+        with contextlib.redirect_stdout(io.StringIO()):
+            prompt.do_computation("")
+            root = main.create_xml_config(prompt)
+        # the test driver only knows the 'test' domain type
+        root.set('type', 'test')
+        xmlutil.write_xml(name+".xml", root)
+        files.append(os.path.abspath(name+".xml"))
+    # the API must really work, not only be fast
+    defined = libvirtconn.define_domains(files, uri)
+    if defined is None:
+        return {}, ["Can't connect to "+uri]
+    errors = [res['file']+": "+res['error'] for res in defined if res['error'] is not None]
+    names = set(dom['name'] for dom in libvirtconn.domains_usage(uri))
+    errors += [res['name']+" defined but not listed" for res in defined
+               if res['error'] is None and res['name'] not in names]
+    if errors:
+        libvirtconn.close_all()
+        return {}, errors
+    results = {
+        'libvirt.connect': timeit(lambda: libvirtconn.connect(uri), number),
+        'libvirt.define_10': timeit(lambda: libvirtconn.define_domains(files, uri), number),
+        'libvirt.domains_usage': timeit(lambda: libvirtconn.domains_usage(uri), number),
+    }
+    # not implemented by old test drivers
+    if libvirtconn.domain_capabilities(uri) is not None:
+        results['libvirt.domain_capabilities'] = timeit(
+            lambda: libvirtconn.domain_capabilities(uri), number)
+    if shutil.which("virsh") is not None:
+        cmd = ["virsh", "-q", "-c", uri, "define", files[0]]
+        results['virsh.define_1'] = timeit(lambda: subprocess.run(cmd, stdout=subprocess.DEVNULL,
+                                                                  check=True), min(number, 10))
+    libvirtconn.close_all()
+    return results, []
+
+# modules which must not be loaded by the one-shot command line before
+# the options are parsed
+# start time budget of virt-scenario --help (ms, python start excluded)
+STARTUP_BUDGET = 100.0
+STARTUP_LAZY = ['yaml', 'virtscenario.main', 'virtscenario.host', 'pyudev', 'psutil']
+STARTUP_CHECK = """
+import sys
+import virtscenario.cli
+print(','.join(name for name in sys.argv[1:] if name in sys.modules))
+"""
+
+def bench_startup(number):
+    """
+    start of a new python: import virtscenario, virt-scenario --help
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    cmds = {
+        'startup.python': [sys.executable, "-c", "pass"],
+        'startup.import': [sys.executable, "-c", "import virtscenario"],
+        'startup.help': [sys.executable, "-m", "virtscenario", "--help"],
+    }
+    results = {}
+    for name, cmd in cmds.items():
+        results[name] = timeit(lambda: subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL,
+                                                      check=True), number)
+    out = subprocess.run([sys.executable, "-c", STARTUP_CHECK]+STARTUP_LAZY, env=env,
+                         stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+    loaded = [name for name in out.strip().split(',') if name]
+    if loaded:
+        util.print_error("Loaded at start: "+", ".join(loaded))
+    return results, loaded
+
+def check_startup(report, budget):
+    """
+    start time of the command line (ms, without the python start) in the budget
+    """
+    results = report['results']
+    startup = (results['startup.help']['min'] - results['startup.python']['min']) * 1000
+    util.print_summary("\nStartup budget")
+    line = "virt-scenario --help: {:.1f}ms (budget {:.1f}ms)".format(startup, budget)
+    if startup > budget or report['startup_loaded']:
+        util.print_error(line)
+        return False
+    util.print_ok(line)
+    return True
+
+def run(number):
+    """
+    run all benchmarks in a fake host, return the report
+    """
+    results, loaded = bench_startup(min(number, 10))
+    with tempfile.TemporaryDirectory() as root:
+        conffile = make_fake_root(root)
+        cwd = os.getcwd()
+        os.chdir(root)
+        try:
+            with fake_host(root) as facts:
+                results.update(bench_fragments(number))
+                results.update(bench_xmlutil(conffile, number))
+                results.update(bench_host(facts, number))
+                results.update(bench_scenarios(conffile, number))
+            results.update(bench_planner(min(number, 10)))
+            libvirt_results, errors = bench_libvirt(conffile, number)
+            results.update(libvirt_results)
+        finally:
+            os.chdir(cwd)
+    return {
+        'version': virtscenario.__version__,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'date': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'number': number,
+        'startup_loaded': loaded,
+        'errors': errors,
+        'results': results,
+    }
+
+def show_report(report):
+    """
+    show the mean time of each benchmark
+    """
+    util.print_summary("\nBenchmark virt-scenario "+report['version']+" (python "
+                       +report['python']+", "+str(report['number'])+" calls)")
+    for name, res in sorted(report['results'].items()):
+        print("{:<40s} {:>12.1f}us {:>12.1f}/s".format(name, res['mean']*1e6, res['per_s']))
+
+def compare(old, new, threshold=0.2):
+    """
+    compare two reports (min time), return the regressions
+    """
+    util.print_summary("\nCompare "+old['version']+" -> "+new['version'])
+    regressions = []
+    for name, res in sorted(new['results'].items()):
+        if name not in old['results']:
+            print("{:<40s} {:>12s}".format(name, "new"))
+            continue
+        before = old['results'][name]['min']
+        ratio = res['min'] / before if before > 0 else 1.0
+        line = "{:<40s} {:>11.2f}x".format(name, ratio)
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            util.print_error(line)
+        else:
+            print(line)
+    return regressions
+
+def main():
+    """
+    virt-scenario-bench
+    """
+    parser = argparse.ArgumentParser(description="Benchmark virt-scenario on a fake host")
+    parser.add_argument("-n", "--number", type=int, default=50, help="calls per benchmark")
+    parser.add_argument("-o", "--output", help="store the results in this JSON file")
+    parser.add_argument("--compare", help="JSON results of a previous release")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="slowdown reported as a regression (0.2: 20%%)")
+    parser.add_argument("--startup-budget", type=float, default=STARTUP_BUDGET, metavar="MS",
+                        help="fail if virt-scenario --help takes more, python start excluded "
+                        "(default %(default)s, 0: no check)")
+    args = parser.parse_args()
+
+    report = run(args.number)
+    show_report(report)
+    for error in report['errors']:
+        util.print_error(error)
+    if args.output:
+        with open(args.output, 'w') as file_h:
+            json.dump(report, file_h, indent=2)
+        util.print_ok("Results stored in "+args.output)
+    if report['errors']:
+        return 1
+    if args.startup_budget > 0 and check_startup(report, args.startup_budget) is False:
+        return 1
+    if args.compare:
+        with open(args.compare) as file_h:
+            old = json.load(file_h)
+        if compare(old, report, args.threshold):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,207 @@
+# Authors: Antoine Ginies <aginies@suse.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Block devices tuning by class: scheduler and queue settings
+https://docs.kernel.org/block/queue-sysfs.html
+"""
+
+import os
+import virtscenario.filesystem as filesystem
+
+SYS_DEV_BLOCK = "/sys/dev/block"
+
+# devices never tuned
+SKIP_PREFIX = ['loop', 'ram', 'zram', 'sr', 'fd', 'nbd']
+
+# queue settings of each class, None: not changed
+# nr_requests is limited by the hardware queue depth without scheduler
+BLOCK_PROFILES = {
+    'nvme': {
+        'scheduler': ['none'],
+        'nr_requests': None,
+        'read_ahead_kb': 128,
+        # complete the request on the cpu which submitted it
+        'rq_affinity': 2,
+        # only the simple merges: lowest latency
+        'nomerges': 1,
+    },
+    'ssd': {
+        'scheduler': ['mq-deadline', 'none'],
+        'nr_requests': 256,
+        'read_ahead_kb': 128,
+        'rq_affinity': 2,
+        'nomerges': 0,
+    },
+    'hdd': {
+        'scheduler': ['mq-deadline'],
+        'nr_requests': 256,
+        'read_ahead_kb': 512,
+        'rq_affinity': 1,
+        'nomerges': 0,
+    },
+    # nested virtualization: the host below does the scheduling
+    'virtio': {
+        'scheduler': ['none'],
+        'nr_requests': None,
+        'read_ahead_kb': 128,
+        'rq_affinity': 1,
+        'nomerges': 0,
+    },
+    # stacked devices: no scheduler, the read ahead is the one of the filesystem
+    'dm': {
+        'scheduler': [],
+        'nr_requests': None,
+        'read_ahead_kb': None,
+        'rq_affinity': None,
+        'nomerges': None,
+    },
+}
+BLOCK_PROFILES['md'] = BLOCK_PROFILES['dm']
+
+# interactive guests: bfq gives the fairness on rotational disks
+SCENARIO_SCHEDULER = {
+    'desktop': {'hdd': ['bfq', 'mq-deadline']},
+}
+
+QUEUE_KNOBS = ['nr_requests', 'read_ahead_kb', 'rq_affinity', 'nomerges']
+
+def classify(disk):
+    """
+    class of a block device: nvme, ssd, hdd, virtio, dm, md or None (not tuned)
+    """
+    name = disk['name']
+    if any(name.startswith(prefix) for prefix in SKIP_PREFIX):
+        return None
+    if name.startswith("dm-"):
+        return "dm"
+    if name.startswith("md"):
+        return "md"
+    if name.startswith("nvme"):
+        return "nvme"
+    if name.startswith("vd"):
+        return "virtio"
+    if disk['rotational'] is True:
+        return "hdd"
+    return "ssd"
+
+def parent_disks(disks):
+    """
+    partition name -> disk name
+    """
+    parents = {}
+    for disk in disks:
+        for part in disk['partitions']:
+            parents[part] = disk['name']
+    return parents
+
+def device_of_path(path, mounts=filesystem.MOUNTS):
+    """
+    name of the block device storing path, None if unknown
+    """
+    try:
+        dev = os.stat(filesystem.existing_path(path)).st_dev
+    except OSError:
+        return None
+    if os.major(dev) != 0:
+        link = os.path.join(SYS_DEV_BLOCK, str(os.major(dev))+":"+str(os.minor(dev)))
+        if os.path.exists(link):
+            return os.path.basename(os.path.realpath(link))
+    # btrfs, overlay...: anonymous device, use the mount source
+    source, _ = filesystem.find_mount(path, mounts)
+    if source is None or not source.startswith("/dev/"):
+        return None
+    return os.path.basename(os.path.realpath(source))
+
+def device_stack(name, disks):
+    """
+    all whole devices under name: partition -> disk, dm / md -> slaves
+    """
+    bydisk = {disk['name']: disk for disk in disks}
+    parents = parent_disks(disks)
+    stack = []
+    todo = [name]
+    while todo:
+        current = todo.pop(0)
+        current = parents.get(current, current)
+        if current in stack or current not in bydisk:
+            continue
+        stack.append(current)
+        todo += bydisk[current]['slaves']
+    return stack
+
+def pick_scheduler(disk, dclass, scenario):
+    """
+    first scheduler of the class (scenario) available on the device
+    """
+    wanted = SCENARIO_SCHEDULER.get(scenario, {}).get(dclass, BLOCK_PROFILES[dclass]['scheduler'])
+    for scheduler in wanted:
+        if scheduler in disk['schedulers']:
+            return scheduler
+    return None
+
+def read_ahead(name, disks):
+    """
+    read ahead of a device, a stacked one use the biggest of its devices
+    """
+    bydisk = {disk['name']: disk for disk in disks}
+    values = []
+    for lower in device_stack(name, disks):
+        dclass = classify(bydisk[lower])
+        if dclass is not None and BLOCK_PROFILES[dclass]['read_ahead_kb'] is not None:
+            values.append(BLOCK_PROFILES[dclass]['read_ahead_kb'])
+    return max(values) if values else None
+
+def plan_knobs(disks, scenario, backing=None):
+    """
+    knobs of all devices: the scheduler of each class, the queue settings
+    only for the devices storing the images (backing: their device stack)
+    return the knobs and a description of each device
+    """
+    knobs = []
+    devices = []
+    for disk in disks:
+        dclass = classify(disk)
+        if dclass is None:
+            continue
+        queue = "/sys/block/"+disk['name']+"/queue/"
+        scheduler = pick_scheduler(disk, dclass, scenario)
+        if scheduler is not None:
+            knobs.append((queue+"scheduler", scheduler))
+        images = backing is not None and disk['name'] in backing
+        if images is True:
+            profile = dict(BLOCK_PROFILES[dclass])
+            if dclass in ['dm', 'md']:
+                profile['read_ahead_kb'] = read_ahead(disk['name'], disks)
+            for knob in QUEUE_KNOBS:
+                if profile[knob] is not None:
+                    knobs.append((queue+knob, profile[knob]))
+        devices.append({
+            'name': disk['name'],
+            'class': dclass,
+            'scheduler': scheduler,
+            'images': images,
+            })
+    return knobs, devices
+
+def show_devices(devices):
+    """
+    class and scheduler of each device
+    """
+    for dev in devices:
+        line = "{:<12s} {:<7s} scheduler: {}".format(dev['name'], dev['class'], dev['scheduler'] or "-")
+        if dev['images'] is True:
+            line += " (VM images)"
+        print(line)
@@ -0,0 +1,118 @@
+# Authors: Antoine Ginies <aginies@suse.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+virt-scenario command line: interactive terminal without option, or one-shot
+
+virt-scenario --scenario computation --mode guest --name compute01 --vcpu 8
+
+Only argparse is loaded before the options are parsed: the scenarios,
+the host probes and yaml are imported when they are used.
+"""
+
+import argparse
+import os
+import sys
+import virtscenario
+
+MODES = ['guest', 'host', 'both']
+
+def parse_args(argv):
+    """
+    one-shot options
+    """
+    import virtscenario.qemulist as qemulist
+    parser = argparse.ArgumentParser(prog="virt-scenario",
+                                     description="Prepare a libvirt XML guest config and the host")
+    parser.add_argument("-s", "--scenario", choices=virtscenario.SCENARIOS, required=True)
+    parser.add_argument("-m", "--mode", choices=MODES, default="guest",
+                        help="prepare the guest, the host or both (default: guest)")
+    parser.add_argument("-c", "--conf", default="/etc/virtscenario.yaml",
+                        help="configuration file (default: /etc/virtscenario.yaml)")
+    parser.add_argument("-n", "--name", help="Virtual Machine name")
+    parser.add_argument("--vcpu", type=int)
+    parser.add_argument("--memory", type=int, help="memory in GiB")
+    parser.add_argument("--machine", choices=qemulist.LIST_MACHINETYPE, metavar="MACHINE")
+    parser.add_argument("--bootdev", choices=qemulist.LIST_BOOTDEV)
+    parser.add_argument("--diskpath", help="directory to store the Virtual Machine image")
+    parser.add_argument("-o", "--output", help="directory to store the XML file")
+    parser.add_argument("--plan", action="store_true",
+                        help="host: show the differences with the scenario, change nothing")
+    parser.add_argument("--define", action="store_true",
+                        help="define the guest through libvirt")
+    parser.add_argument("--connect", metavar="URI", help="libvirt URI (default: libvirt default)")
+    return parser.parse_args(argv)
+
+def one_shot(args):
+    """
+    render one scenario with the user settings, like the terminal would do
+    """
+    if os.path.isfile(args.conf) is False:
+        print(args.conf+" configuration Yaml file Not found!", file=sys.stderr)
+        return 1
+    if args.diskpath is not None and os.path.isdir(args.diskpath) is False:
+        print(args.diskpath+" is not a directory", file=sys.stderr)
+        return 1
+    import virtscenario.main as main
+    prompt = main.MyPrompt()
+    # no XML dump, no password prompt
+    prompt.interactive = False
+    prompt.conffile = os.path.abspath(args.conf)
+    prompt.mode = args.mode
+    prompt.dataprompt = dict(main.MyPrompt.dataprompt)
+    prompt.listosdef = dict(main.MyPrompt.listosdef)
+    for option in ['name', 'vcpu', 'memory', 'machine', 'bootdev']:
+        value = getattr(args, option)
+        if value is not None:
+            prompt.dataprompt[option] = str(value)
+    if args.diskpath is not None:
+        prompt.dataprompt['path'] = args.diskpath
+
+    if args.plan is True:
+        import virtscenario.host as host
+        host.set_plan()
+    if args.output is not None:
+        os.makedirs(args.output, exist_ok=True)
+        os.chdir(args.output)
+    getattr(prompt, "do_"+args.scenario)("")
+    if prompt.failed is not None:
+        return 1
+    if args.mode == "host":
+        return 0
+    # the XML of this run, not one left by a previous run
+    if prompt.rendered is None or os.path.isfile(prompt.rendered) is False:
+        return 1
+    if args.define is True:
+        import virtscenario.libvirtconn as libvirtconn
+        results = libvirtconn.define_domains([prompt.rendered], args.connect)
+        if results is None:
+            return 1
+        libvirtconn.show_define(results)
+        return int(results[0]['error'] is not None)
+    return 0
+
+def main(argv=None):
+    """
+    virt-scenario
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv:
+        import virtscenario.main as main
+        return main.main()
+    return one_shot(parse_args(argv))
+
+if __name__ == "__main__":
+    exit(main())
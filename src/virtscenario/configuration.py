@@ -44,6 +44,10 @@ class BasicConfiguration:
         self.iothreads_data = None
         self.security_data = None
         self.video_data = None
+        self.cputune_data = None
+        self.numatune_data = None
+        self.hugepages_data = None
+        self.memballoon_data = None
 
     def name(self, name):
         """
@@ -63,6 +67,41 @@ class BasicConfiguration:
         }
         return self.vcpu_data
 
+    def cputune(self, vcpupin, emulatorpin, iothreadpin=None, vcpusched=None):
+        """
+        vcpu pinning: list of host cpu (one per vcpu), emulator cpuset
+        iothreadpin: cpuset of each iothread, vcpusched: scheduler and priority
+        """
+        self.cputune_data = {
+            'vcpupin': vcpupin,
+            'emulatorpin': emulatorpin,
+            'iothreadpin': iothreadpin or [],
+            'vcpusched': vcpusched,
+        }
+        return self.cputune_data
+
+    def numatune(self, mode, nodeset):
+        """
+        memory placement on NUMA nodes
+        """
+        self.numatune_data = {
+            'mode': mode,
+            'nodeset': nodeset,
+        }
+        return self.numatune_data
+
+    def hugepages(self, size, nodeset, locked=False):
+        """
+        hugepages page size (kB) for the guest NUMA nodes
+        locked: memory locked in RAM and not shared
+        """
+        self.hugepages_data = {
+            'size': size,
+            'nodeset': nodeset,
+            'locked': locked,
+        }
+        return self.hugepages_data
+
     def cpumode_pass(self, migratable, extra):
         """
         cpumode def
@@ -121,6 +160,19 @@ class BasicConfiguration:
         }
         return self.watchdog_data
 
+    def memballoon(self, model, autodeflate="", free_page_reporting="", period=""):
+        """
+        memory balloon, model none: no balloon
+        period: statistics refresh (s)
+        """
+        self.memballoon_data = {
+            'model': model,
+            'autodeflate': autodeflate,
+            'free_page_reporting': free_page_reporting,
+            'period': period,
+        }
+        return self.memballoon_data
+
     def emulator(self, emulator):
         """
         emulator to use
@@ -243,14 +295,16 @@ class ComplexConfiguration:
         }
         return self.disk_data
 
-    def network(self, mac, network, intertype):
+    def network(self, mac, network, intertype, queues=1, iommu=""):
         """
-        network
+        network, iommu: on for a guest with encrypted memory
         """
         self.network_data = {
             'mac_address': mac,
             'network': network,
             'type': intertype,
+            'queues': queues,
+            'iommu': iommu,
             }
         return self.network_data
 
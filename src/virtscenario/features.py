@@ -20,6 +20,35 @@ Features
 import virtscenario.util as util
 import virtscenario.configuration as c
 
+def iothreads_number(vcpu, disks):
+    """
+    one iothread per disk, but not more than half of the vcpu
+    """
+    return max(1, min(int(disks), int(vcpu) // 2))
+
+def disk_iothread(index, iothreads):
+    """
+    iothread id (from 1) of the disk number index: round robin
+    """
+    return index % int(iothreads) + 1
+
+# rough relative packet rate of a network model, e1000 emulation is 1
+NET_PACKET_RATE = {
+    'rtl8139': 0.5,
+    'e1000': 1,
+    'e1000e': 1,
+    'virtio': 5,
+}
+
+def net_packet_rate(model, queues):
+    """
+    expected packet rate compared to e1000 (vhost queues scale with flows)
+    """
+    rate = NET_PACKET_RATE.get(model, 1)
+    if model == "virtio":
+        rate *= int(queues)
+    return rate
+
 class MemoryUnit:
     """
     useful to avoid repetition of mem unit
@@ -70,6 +99,7 @@ class Features():
         self.access_host_fs = None
         self.iothreads = None
         self.security = None
+        self.memballoon = None
 
     def cpu_perf(self):
         """
@@ -103,6 +133,14 @@ class Features():
         self.memory = c.BasicConfiguration.memory(self, unit, "8192", "8192")
         return self.memory
 
+    def memory_density(self):
+        """
+        memory density: the guest gives back its free pages to the host
+        """
+        # autodeflate: the guest can use all its memory before an OOM
+        self.memballoon = c.BasicConfiguration.memballoon(self, "virtio", "on", "on", "10")
+        return self.memballoon
+
     def storage_perf(self):
         """
         storage performance
@@ -110,7 +148,7 @@ class Features():
         # Disk
         diskdata = Disk("file", "none", "vda", "virtio", "/tmp", self.name['VM_name'], "raw")
         self.disk = c.ComplexConfiguration.disk(self, diskdata)
-        self.iothreads = c.BasicConfiguration.iothreads(self, "4")
+        self.iothreads = c.BasicConfiguration.iothreads(self, iothreads_number(self.vcpu['vcpu'], 1))
         return self
 
     def video_perf(self):
@@ -120,12 +158,14 @@ class Features():
         self.video = c.BasicConfiguration.video(self, "virtio")
         return self.video
 
-    def network_perf(self):
+    def network_perf(self, iommu=""):
         """
         network performance
+        iommu: on for SEV, the guest needs VIRTIO_F_ACCESS_PLATFORM
         """
         macaddress = util.macaddress()
-        self.network = c.ComplexConfiguration.network(self, macaddress, "default", "virtio")
+        self.network = c.ComplexConfiguration.network(self, macaddress, "default", "virtio",
+                                                      iommu=iommu)
         return self.network
 
     def clock_perf(self):
@@ -138,6 +178,28 @@ class Features():
         self.clock = c.BasicConfiguration.clock(self, "utc", dataclock)
         return self.clock
 
+    def realtime_perf(self):
+        """
+        soft real time: no migration, no PMU, stable timers
+        """
+        self.vcpu = c.BasicConfiguration.vcpu(self, "4")
+        extra = "\n    <feature policy='require' name='tsc-deadline'/>"
+        self.cpumode = c.BasicConfiguration.cpumode_pass(self, "off", extra)
+        self.power = c.BasicConfiguration.power(self, "no", "no")
+        # guest perf counters cost a vmexit on each context switch
+        datafeatures = "<acpi/>\n    <apic/>\n    <pae/>\n    <pmu state='off'/>"
+        self.features = c.BasicConfiguration.features(self, datafeatures)
+        unit = MemoryUnit("Mib", "Mib")
+        self.memory = c.BasicConfiguration.memory(self, unit, "4096", "4096")
+        dataclock = "<timer name=\'rtc\' tickpolicy=\'catchup\'/>"
+        dataclock += "\n    <timer name=\'pit\' tickpolicy=\'delay\'/>"
+        dataclock += "\n    <timer name=\'hpet\' present=\'no\'/>"
+        dataclock += "\n    <timer name=\'kvmclock\' present=\'yes\'/>"
+        self.clock = c.BasicConfiguration.clock(self, "utc", dataclock)
+        # the balloon would change the guest memory behind its back
+        self.memballoon = c.BasicConfiguration.memballoon(self, "none")
+        return self
+
     def host_hardware(self):
         """
         host hardware
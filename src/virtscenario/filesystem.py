@@ -0,0 +1,118 @@
+# Authors: Antoine Ginies <aginies@suse.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Adapt the image creation to the filesystem storing it
+"""
+
+import os
+import virtscenario.util as util
+
+MOUNTS = "/proc/mounts"
+
+# filesystem supporting fallocate(): falloc is as good as full, and faster
+FS_FALLOC = ['xfs', 'ext4', 'btrfs']
+# scenarios keeping full preallocation: no unwritten extent to convert on
+# the first write of the guest (latency)
+FULL_PREALLOC_SCENARIOS = ['softrtvm']
+# copy on write filesystem: disable COW (nocow) for images
+FS_COW = ['btrfs']
+# smallest cluster size on a COW filesystem (limit fragmentation)
+COW_CLUSTER_SIZE = "2M"
+
+def unescape_mount(path):
+    """
+    /proc/mounts escape space, tab, newline and backslash in octal
+    """
+    for code, char in [('\\040', ' '), ('\\011', '\t'), ('\\012', '\n'), ('\\134', '\\')]:
+        path = path.replace(code, char)
+    return path
+
+def existing_path(path):
+    """
+    path could not exist yet, use the first existing parent
+    """
+    path = os.path.realpath(path)
+    while not os.path.exists(path) and path != os.path.dirname(path):
+        path = os.path.dirname(path)
+    return path
+
+def find_mount(path, mounts=MOUNTS):
+    """
+    mount containing path (the longest mount point): source and type
+    """
+    path = existing_path(path)
+    source = fstype = None
+    found = ""
+    try:
+        with open(mounts) as file_h:
+            for line in file_h:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mountpoint = unescape_mount(fields[1])
+                if path != mountpoint and not path.startswith(mountpoint.rstrip('/')+'/'):
+                    continue
+                # stacked mount: the last one wins
+                if len(mountpoint) >= len(found):
+                    found = mountpoint
+                    source = unescape_mount(fields[0])
+                    fstype = fields[2]
+    except OSError:
+        return None, None
+    return source, fstype
+
+def find_filesystem(path, mounts=MOUNTS):
+    """
+    filesystem type of path
+    """
+    return find_mount(path, mounts)[1]
+
+def size_to_kib(size):
+    """
+    qemu-img size (512k, 2M) to KiB
+    """
+    size = str(size).strip()
+    if size and size[-1].isalpha():
+        return util.memory_to_kib(size[:-1], size[-1])
+    return util.memory_to_kib(size, 'b')
+
+def tune_storage(storage_data, fstype, scenario=None):
+    """
+    return the storage data to use on this filesystem, and the changes done
+    """
+    tuned = dict(storage_data)
+    changes = []
+    if (fstype in FS_FALLOC and tuned['preallocation'] == "full"
+            and scenario not in FULL_PREALLOC_SCENARIOS):
+        tuned['preallocation'] = "falloc"
+        changes.append("preallocation: full -> falloc")
+    if fstype in FS_COW:
+        tuned['nocow'] = True
+        changes.append("nocow: on")
+        if tuned['format'] == "qcow2" and size_to_kib(tuned['cluster_size']) < size_to_kib(COW_CLUSTER_SIZE):
+            changes.append("cluster_size: "+str(tuned['cluster_size'])+" -> "+COW_CLUSTER_SIZE)
+            tuned['cluster_size'] = COW_CLUSTER_SIZE
+    return tuned, changes
+
+def set_nocow(path):
+    """
+    set the No_COW attribute on a directory: inherited by new files only
+    """
+    out, errs = util.system_command(["chattr", "+C", path])
+    if errs:
+        util.print_error(errs)
+        return False
+    return True
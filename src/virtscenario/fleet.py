@@ -0,0 +1,195 @@
+# Authors: Antoine Ginies <aginies@suse.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Fleet mode: compute the host tuning of many hypervisors offline, from
+snapshots of their facts
+
+On each hypervisor:
+virt-scenario-fleet --capture snapshots/$(hostname)
+Then on one system:
+virt-scenario-fleet snapshots -s computation -m manifest.yaml -o plans
+plans/<host>/ contains the files to install, commands.sh and plan.log
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import virtscenario
+import virtscenario.util as util
+import virtscenario.hostfacts as hostfacts
+
+PLAN_LOG = "plan.log"
+
+def find_snapshots(path):
+    """
+    all host snapshots in path (a directory with a proc/cpuinfo)
+    """
+    snapshots = []
+    for name in sorted(os.listdir(path)):
+        snapshot = os.path.join(path, name)
+        if os.path.isfile(os.path.join(snapshot, hostfacts.CPUINFO.lstrip('/'))):
+            snapshots.append(snapshot)
+    return snapshots
+
+def planned_guests(plan):
+    """
+    memory and hugepages needs of the guests planned on one host, on their
+    NUMA node (the guests which do not fit on the host are not counted)
+    """
+    guests = []
+    for guest in plan['guests']:
+        if guest['placement'] is None and guest.get('floating') is not True:
+            continue
+        guests.append({
+            'name': guest['name'],
+            'memory': guest['memory'],
+            'size': guest['size'],
+            # spanning or floating: the node with most free memory
+            'node': None if guest['placement'] is None else guest['placement']['node'],
+            })
+    return guests
+
+def realtime_guest(plan):
+    """
+    cpus isolated for the real time guests placed on one host and their
+    housekeeping pinning (see host.realtime()), None without such guest
+    """
+    import virtscenario.realtime as rt
+    isolated = []
+    pins = []
+    for guest in plan['guests']:
+        todo = guest['placement']
+        if guest['realtime'] is False or todo is None:
+            continue
+        isolated += todo['isolated']
+        housekeeping = util.parse_cpulist(todo['emulatorpin'])
+        pins += [(guest['name'], pin, housekeeping) for pin in rt.HOUSEKEEPING_PINS]
+    if not isolated:
+        return None
+    return {
+        'name': None,
+        'isolated': sorted(isolated),
+        'pins': pins,
+        }
+
+def plan_host(snapshot, outdir, scenario, entries, plan=False, ksm_budget=None):
+    """
+    tuning of one host, called in a worker process
+    """
+    import virtscenario.host as host
+    import virtscenario.planner as planner
+    start = time.perf_counter()
+    name = os.path.basename(os.path.normpath(snapshot))
+    hostout = os.path.abspath(os.path.join(outdir, name))
+    result = {
+        'name': name,
+        'output': hostout,
+        'error': None,
+    }
+    os.makedirs(hostout, exist_ok=True)
+    # a new plan replace the previous one
+    commands = os.path.join(hostout, host.COMMANDS_FILE)
+    if os.path.isfile(commands):
+        os.remove(commands)
+
+    host.set_host_root(os.path.abspath(snapshot), hostout)
+    host.set_plan(plan)
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            facts = host.host_facts()
+            plan = planner.plan_guests(facts, planner.guest_requests(entries, facts, scenario))
+            planner.show_plan(plan)
+            guests = planned_guests(plan)
+            host.scenario_tuning(scenario, guests, rt_guest=realtime_guest(plan),
+                                 ksm_budget=ksm_budget)
+    except Exception as exc:
+        result['error'] = str(exc)
+    finally:
+        host.set_host_root()
+    with open(os.path.join(hostout, PLAN_LOG), 'w') as file_h:
+        file_h.write(output.getvalue())
+    result['time'] = time.perf_counter() - start
+    return result
+
+def run_fleet(snapshots, outdir, scenario, entries, jobs=None, plan=False, ksm_budget=None):
+    """
+    compute the plans of all hosts through a process pool
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(plan_host, snapshots, [outdir] * len(snapshots),
+                                    [scenario] * len(snapshots), [entries] * len(snapshots),
+                                    [plan] * len(snapshots), [ksm_budget] * len(snapshots)))
+    elapsed = time.perf_counter() - start
+
+    errors = 0
+    for res in results:
+        if res['error'] is not None:
+            errors += 1
+            util.print_error(res['name']+": "+res['error'])
+    util.print_summary("\nFleet host tuning ("+scenario+")")
+    print("Hosts: "+str(len(snapshots))+" Errors: "+str(errors)+" Jobs: "+str(jobs))
+    print("Output: "+os.path.abspath(outdir))
+    util.print_ok("{:.2f}s".format(elapsed))
+    return results
+
+def main():
+    """
+    virt-scenario-fleet
+    """
+    parser = argparse.ArgumentParser(description="Compute host tuning from host snapshots")
+    parser.add_argument("snapshots", nargs="?", help="directory of host snapshots")
+    parser.add_argument("--capture", metavar="DIR", help="store a snapshot of this host in DIR")
+    parser.add_argument("-s", "--scenario", choices=virtscenario.SCENARIOS, default="computation")
+    parser.add_argument("-m", "--manifest", help="guests planned on each host (batch manifest)")
+    parser.add_argument("-o", "--output", default="plans", help="output tree of all hosts")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker process")
+    parser.add_argument("--plan", action="store_true",
+                        help="only show the differences in plan.log, write no file")
+    parser.add_argument("--ksm-cpu-budget", type=float, default=None, metavar="PERCENT",
+                        help="cpu budget of ksmd in percent of one cpu (default 5)")
+    args = parser.parse_args()
+
+    if args.capture:
+        hostfacts.capture(args.capture)
+        util.print_ok("Host snapshot stored in "+args.capture)
+        return 0
+    if args.snapshots is None or not os.path.isdir(args.snapshots):
+        parser.error("a directory of host snapshots is needed")
+    snapshots = find_snapshots(args.snapshots)
+    if not snapshots:
+        util.print_error("No host snapshot found in "+args.snapshots)
+        return 1
+    if args.manifest:
+        import virtscenario.batch as batch
+        entries = batch.load_manifest(args.manifest)
+        if entries is None:
+            return 1
+    else:
+        entries = [{'scenario': args.scenario}]
+    ksm_budget = None if args.ksm_cpu_budget is None else args.ksm_cpu_budget / 100
+    results = run_fleet(snapshots, args.output, args.scenario, entries, args.jobs, args.plan,
+                        ksm_budget)
+    return int(any(res['error'] is not None for res in results))
+
+if __name__ == "__main__":
+    exit(main())
@@ -18,20 +18,42 @@ Create some XML section for the XML Guest definition
 The template are filed with data from scenario and user
 """
 
-import uuid
+import functools
 from string import Template
 import virtscenario.template as template
+import virtscenario.util as util
+
+@functools.lru_cache(maxsize=None)
+def get_template(name):
+    """
+    compile a template from template.py only once
+    """
+    return Template(getattr(template, name))
+
+@functools.lru_cache(maxsize=1024)
+def render_items(name, items):
+    """
+    memoized rendering of a fragment, items is a sorted tuple of the dict
+    """
+    return get_template(name).substitute(dict(items))
+
+def render(name, xml_data):
+    """
+    fill the template with data, same input gives the cached fragment
+    dont use it for data with UUID or MAC address
+    """
+    return render_items(name, tuple(sorted(xml_data.items())))
 
 def create_name(name_data):
     """
     name and uuid
     """
-    xml_template = template.NAME_TEMPLATE
     xml_name = {
         'VM_name': name_data['VM_name'],
-        'VM_uuid': str(uuid.uuid4()),
+        # stable identity: a new rendering of the guest does not change it
+        'VM_uuid': name_data.get('VM_uuid') or util.stable_uuid(name_data['VM_name']),
     }
-    xml = Template(xml_template).substitute(xml_name)
+    xml = get_template('NAME_TEMPLATE').substitute(xml_name)
     return xml
 
 def create_metadata(): #metadata_data):
@@ -57,116 +79,155 @@ def create_memory(memory_data):
     """
     memory
     """
-    xml_template = template.MEMORY_TEMPLATE
     xml_mem = {
         'mem_unit': memory_data['mem_unit'],
         'max_memory': memory_data['max_memory'],
         'current_mem_unit': memory_data['current_mem_unit'],
         'memory': memory_data['memory'],
     }
-    xml = Template(xml_template).substitute(xml_mem)
+    xml = render('MEMORY_TEMPLATE', xml_mem)
     return xml
 
 def create_cpu(cpu_data):
     """
     cpu
     """
-    xml_template = template.CPU_TEMPLATE
     xml_cpu = {
         'vcpu': cpu_data['vcpu'],
     }
-    xml = Template(xml_template).substitute(xml_cpu)
+    xml = render('CPU_TEMPLATE', xml_cpu)
+    return xml
+
+def create_cputune(cputune_data):
+    """
+    cputune: vcpupin and emulatorpin
+    """
+    vcpupin = ""
+    for vcpu, cpu in enumerate(cputune_data['vcpupin']):
+        vcpupin += render('VCPUPIN_TEMPLATE', {'vcpu': vcpu, 'cpuset': cpu})
+    iothreadpin = ""
+    # iothread id start at 1
+    for iothread, cpuset in enumerate(cputune_data.get('iothreadpin', []), start=1):
+        iothreadpin += render('IOTHREADPIN_TEMPLATE', {'iothread': iothread, 'cpuset': cpuset})
+    vcpusched = ""
+    if cputune_data.get('vcpusched') is not None:
+        vcpusched = render('VCPUSCHED_TEMPLATE', {
+            'vcpus': "0-"+str(len(cputune_data['vcpupin'])-1),
+            'scheduler': cputune_data['vcpusched']['scheduler'],
+            'priority': cputune_data['vcpusched']['priority'],
+            })
+    xml_cputune = {
+        'vcpupin': vcpupin,
+        'emulatorpin': cputune_data['emulatorpin'],
+        'iothreadpin': iothreadpin,
+        'vcpusched': vcpusched,
+    }
+    xml = render('CPUTUNE_TEMPLATE', xml_cputune)
+    return xml
+
+def create_numatune(numatune_data):
+    """
+    numatune
+    """
+    xml_numatune = {
+        'mode': numatune_data['mode'],
+        'nodeset': numatune_data['nodeset'],
+    }
+    xml = render('NUMATUNE_TEMPLATE', xml_numatune)
+    return xml
+
+def create_cpu_topology(topology_data):
+    """
+    guest cpu topology (inside the cpu element)
+    """
+    xml_topology = {
+        'cores': topology_data['cores'],
+        'threads': topology_data['threads'],
+    }
+    xml = render('CPU_TOPOLOGY_TEMPLATE', xml_topology)
     return xml
 
 def create_osdef(os_data):
     """
     os
     """
-    xml_template = template.OS_TEMPLATE
     xml_os = {
         'arch': os_data['arch'],
         'machine': os_data['machine'],
         'boot_dev': os_data['boot_dev'],
     }
-    xml = Template(xml_template).substitute(xml_os)
+    xml = render('OS_TEMPLATE', xml_os)
     return xml
 
 def create_features(features_data):
     """
     features
     """
-    xml_template = template.FEATURES_TEMPLATE
     xml_features = {
         'features': features_data['features'],
     }
-    xml = Template(xml_template).substitute(xml_features)
+    xml = render('FEATURES_TEMPLATE', xml_features)
     return xml
 
 def create_cpumode_pass(cpumode_data):
     """
     cpumode
     """
-    xml_template = template.CPUMODE_PASS_TEMPLATE
     xml_cpumode = {
         'migratable': cpumode_data['migratable'],
         'extra': cpumode_data['extra'],
     }
-    xml = Template(xml_template).substitute(xml_cpumode)
+    xml = render('CPUMODE_PASS_TEMPLATE', xml_cpumode)
     return xml
 
 def create_clock(clock_data):
     """
     clock
     """
-    xml_template = template.CLOCK_TEMPLATE
     xml_clock = {
         'clock_offset': clock_data['clock_offset'],
         'clock': clock_data['clock'],
     }
-    xml = Template(xml_template).substitute(xml_clock)
+    xml = render('CLOCK_TEMPLATE', xml_clock)
     return xml
 
 def create_ondef(on_data):
     """
     on power etc...
     """
-    xml_template = template.ON_TEMPLATE
     xml_ondef = {
         'on_poweroff': on_data['on_poweroff'],
         'on_reboot': on_data['on_reboot'],
         'on_crash': on_data['on_crash'],
     }
-    xml = Template(xml_template).substitute(xml_ondef)
+    xml = render('ON_TEMPLATE', xml_ondef)
     return xml
 
 def create_power(power_data):
     """
     power
     """
-    xml_template = template.POWER_TEMPLATE
     xml_power = {
         'suspend_to_mem': power_data['suspend_to_mem'],
         'suspend_to_disk': power_data['suspend_to_disk'],
     }
-    xml = Template(xml_template).substitute(xml_power)
+    xml = render('POWER_TEMPLATE', xml_power)
     return xml
 
 def create_emulator(power_data):
     """
     power
     """
-    xml_template = template.EMULATOR_TEMPLATE
     xml_emulator = {
         'emulator': power_data['emulator'],
         }
-    xml = Template(xml_template).substitute(xml_emulator)
+    xml = render('EMULATOR_TEMPLATE', xml_emulator)
     return xml
 
 def create_disk(disk_data):
     """
     disk
     """
-    xml_template = template.DISK_TEMPLATE
     source_file = disk_data['path']+"/"+disk_data['storage_name']+"."+disk_data['format']
     xml_disk = {
         'disk_type': disk_data['disk_type'],
@@ -176,20 +237,32 @@ def create_disk(disk_data):
         'format': disk_data['format'],
         'source_file': source_file,
     }
-    xml = Template(xml_template).substitute(xml_disk)
+    if disk_data.get('iothread') is not None:
+        xml_disk['iothread'] = disk_data['iothread']
+        xml_disk['queues'] = disk_data['queues']
+        xml = render('DISK_VIRTIO_TEMPLATE', xml_disk)
+    else:
+        xml = render('DISK_TEMPLATE', xml_disk)
     return xml
 
 def create_interface(interface_data):
     """
     interface
     """
-    xml_template = template.INTERFACE_TEMPLATE
     xml_interface = {
         'mac_address': interface_data['mac_address'],
         'network': interface_data['network'],
         'type': interface_data['type'],
     }
-    xml = Template(xml_template).substitute(xml_interface)
+    if interface_data['type'] == "virtio":
+        xml_interface['queues'] = interface_data.get('queues', 1)
+        xml_interface['rx_queue_size'] = 1024
+        xml_interface['options'] = ""
+        if interface_data.get('iommu'):
+            xml_interface['options'] = " iommu='"+interface_data['iommu']+"'"
+        xml = get_template('INTERFACE_VIRTIO_TEMPLATE').substitute(xml_interface)
+    else:
+        xml = get_template('INTERFACE_TEMPLATE').substitute(xml_interface)
     return xml
 
 def create_channel(): #channel_data):
@@ -201,12 +274,19 @@ def create_channel(): #channel_data):
     #xml = Template(xml_template).substitute(xml_channel)
     return xml_template
 
-def create_hugepages():
+def create_hugepages(hugepages_data=None):
     """
-    hugepages
+    hugepages, with the page size if known
     """
-    xml_template = template.HUGEPAGES_TEMPLATE
-    return xml_template
+    if hugepages_data is None:
+        return template.HUGEPAGES_TEMPLATE
+    xml_hugepages = {
+        'size': hugepages_data['size'],
+        'nodeset': hugepages_data['nodeset'],
+        'options': template.MEMORYBACKING_LOCKED if hugepages_data.get('locked') else "",
+    }
+    xml = render('HUGEPAGES_PAGE_TEMPLATE', xml_hugepages)
+    return xml
 
 def create_console(): #console_data):
     """
@@ -221,12 +301,11 @@ def create_input(input_data):
     """
     input
     """
-    xml_template = template.INPUT_TEMPLATE
     xml_input = {
         'type': input_data['type'],
         'bus': input_data['bus'],
     }
-    xml = Template(xml_template).substitute(xml_input)
+    xml = render('INPUT_TEMPLATE', xml_input)
     return xml
 
 def create_graphics(): #graphics_data):
@@ -242,22 +321,20 @@ def create_audio(audio_data):
     """
     audio
     """
-    xml_template = template.AUDIO_TEMPLATE
     xml_audio = {
         'model': audio_data['model'],
     }
-    xml = Template(xml_template).substitute(xml_audio)
+    xml = render('AUDIO_TEMPLATE', xml_audio)
     return xml
 
 def create_usb(usb_data):
     """
     audio
     """
-    xml_template = template.USB_TEMPLATE
     xml_usb = {
         'model': usb_data['model'],
     }
-    xml = Template(xml_template).substitute(xml_usb)
+    xml = render('USB_TEMPLATE', xml_usb)
     return xml
 
 def create_video(video_data):
@@ -265,11 +342,10 @@ def create_video(video_data):
     video
     """
     if video_data['type'] != "virtio":
-        xml_template = template.VIDEO_TEMPLATE
         xml_video = {
             'type': video_data['type'],
             }
-        xml = Template(xml_template).substitute(xml_video)
+        xml = render('VIDEO_TEMPLATE', xml_video)
     else:
         xml = template.VIDEO_VIRTIO_TEMPLATE
     return xml
@@ -278,22 +354,37 @@ def create_watchdog(watchdog_data):
     """
     watchdog
     """
-    xml_template = template.WATCHDOG_TEMPLATE
     xml_watchdog = {
         'model': watchdog_data['model'],
         'action': watchdog_data['action'],
     }
-    xml = Template(xml_template).substitute(xml_watchdog)
+    xml = render('WATCHDOG_TEMPLATE', xml_watchdog)
     return xml
 
-def create_memballoon(): #memballoon_data):
-    """
-    memballoon
-    """
-    xml_template = template.MEMBALLOON_TEMPLATE
-    #xml_memballoon = { }
-    #xml = Template(xml_template).substitute(xml_memballoon)
-    return xml_template
+def create_memballoon(memballoon_data=None):
+    """
+    memballoon, model none: no balloon at all (libvirt adds one by default)
+    free page reporting: the freed guest pages are returned to the host
+    """
+    if memballoon_data is None:
+        memballoon_data = {'model': "virtio"}
+    if memballoon_data['model'] == "none":
+        return template.MEMBALLOON_NONE_TEMPLATE
+    options = ""
+    if memballoon_data.get('autodeflate'):
+        options += " autodeflate='"+memballoon_data['autodeflate']+"'"
+    if memballoon_data.get('free_page_reporting'):
+        options += " freePageReporting='"+memballoon_data['free_page_reporting']+"'"
+    stats = ""
+    if memballoon_data.get('period'):
+        stats = render('MEMBALLOON_STATS_TEMPLATE', {'period': memballoon_data['period']})
+    xml_memballoon = {
+        'model': memballoon_data['model'],
+        'options': options,
+        'stats': stats,
+    }
+    xml = render('MEMBALLOON_TEMPLATE', xml_memballoon)
+    return xml
 
 def create_rng(): #rng_data):
     """
@@ -313,34 +404,32 @@ def create_tpm(tpm_data):
         'tpm_type': tpm_data['tpm_type'],
     }
     if tpm_data['tpm_type'] == "emulator":
-        xml_template = template.TPM_TEMPLATE_EMULATED
+        xml_template = 'TPM_TEMPLATE_EMULATED'
         xml_tpm['version'] = tpm_data['version']
     else:
-        xml_template = template.TPM_TEMPLATE
+        xml_template = 'TPM_TEMPLATE'
         xml_tpm['device_path'] = tpm_data['device_path']
 
-    xml = Template(xml_template).substitute(xml_tpm)
+    xml = render(xml_template, xml_tpm)
     return xml
 
 def create_iothreads(iothreads_data):
     """
     iothreads
     """
-    xml_template = template.IOTHREADS_TEMPLATE
     xml_iothreads = {
         'iothreads': iothreads_data['iothreads'],
         }
-    xml = Template(xml_template).substitute(xml_iothreads)
+    xml = render('IOTHREADS_TEMPLATE', xml_iothreads)
     return xml
 
 def create_security(security_data):
     """
     security
     """
-    xml_template = template.SECURITY_TEMPLATE
     xml_security = {
         'sectype': security_data['sectype'],
         'secdata': security_data['secdata'],
     }
-    xml = Template(xml_template).substitute(xml_security)
+    xml = render('SECURITY_TEMPLATE', xml_security)
     return xml
@@ -19,11 +19,124 @@ Prepare the Host system
 
 import uuid
 import os
+import json
 from string import Template
-import pyudev
 import virtscenario.template as template
 import virtscenario.util as util
-import virtscenario.sev as sev
+import virtscenario.hostfacts as hostfacts
+import virtscenario.sysfs as sysfs
+import virtscenario.hugepages as hp
+import virtscenario.filesystem as filesystem
+
+# host facts, probed once per run
+FACTS = None
+# host to tune: facts are read from HOST_ROOT (a snapshot directory for an
+# offline host), changes are written in OUTPUT_ROOT instead of the live system
+HOST_ROOT = "/"
+OUTPUT_ROOT = None
+# commands to run on an offline host, stored in the output tree
+COMMANDS_FILE = "commands.sh"
+# plan mode: show what would change, change nothing
+PLAN = False
+
+def host_facts():
+    """
+    return the HostFacts of this host
+    """
+    global FACTS
+    if FACTS is None:
+        if HOST_ROOT == "/":
+            FACTS = hostfacts.HostFacts()
+        else:
+            FACTS = hostfacts.HostFacts(cachefile=None, root=HOST_ROOT)
+    return FACTS
+
+def refresh_facts():
+    """
+    read again the free memory, hugepages pools and disks of the host
+    """
+    if FACTS is not None:
+        FACTS.refresh()
+
+def set_host_root(root="/", output=None):
+    """
+    select the host to tune (snapshot directory) and the output tree
+    """
+    global FACTS, HOST_ROOT, OUTPUT_ROOT
+    HOST_ROOT = root
+    OUTPUT_ROOT = output
+    FACTS = None
+
+def set_plan(plan=True):
+    """
+    plan mode: only show the differences between the host and the scenario
+    """
+    global PLAN
+    PLAN = plan
+
+def output_path(path):
+    """
+    path of a file to change on the host
+    """
+    if OUTPUT_ROOT is None:
+        return path
+    return os.path.join(OUTPUT_ROOT, path.lstrip('/'))
+
+def write_config(path, data):
+    """
+    create a configuration file on the host, if its content differs
+    """
+    file = output_path(path)
+    if hostfacts.read_file(host_facts().path(path), None) == data:
+        print(file+" (unchanged)")
+        return
+    if PLAN is True:
+        util.print_warning("Would create "+file+": "+data.strip())
+        return
+    print("Creating "+file)
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    with open(file, "w") as file_h:
+        file_h.write(data)
+
+def apply_knobs(knobs):
+    """
+    read the sysfs / procfs knobs of the host, show the differences and
+    write only the knobs which differ (on the host, or in the output tree)
+    nothing is written in plan mode
+    """
+    diff = sysfs.diff_knobs(knobs, lambda path: sysfs.read_knob(host_facts().path(path)))
+    sysfs.show_diff(diff)
+    todo = [(knob['path'], knob['value']) for knob in diff if knob['change'] is True]
+    if PLAN is True:
+        return []
+    if OUTPUT_ROOT is None:
+        return sysfs.apply_knobs(todo)
+    return sysfs.apply_knobs([(output_path(path), value) for path, value in todo], create=True)
+
+def service_state(service):
+    """
+    enabled and active state of a systemd service, None if unknown (offline host)
+    """
+    if OUTPUT_ROOT is not None:
+        return None
+    _, enabled, _ = util.run_command(["systemctl", "is-enabled", service])
+    _, active, _ = util.run_command(["systemctl", "is-active", service])
+    return enabled.strip(), active.strip()
+
+def host_command(cmd):
+    """
+    run a command on the host, for an offline host add it in the
+    commands file of the output tree, only show it in plan mode
+    """
+    if PLAN is True:
+        util.print_warning("Would run: "+util.cmd_to_str(cmd))
+        return "", ""
+    if OUTPUT_ROOT is None:
+        return util.system_command(cmd)
+    os.makedirs(OUTPUT_ROOT, exist_ok=True)
+    with open(os.path.join(OUTPUT_ROOT, COMMANDS_FILE), "a") as file_h:
+        file_h.write(util.cmd_to_str(cmd)+"\n")
+    return util.cmd_to_str(cmd), ""
 
 def create_net_xml(file, net_data):
     """
@@ -69,24 +182,53 @@ def create_storage_vol_xml(file, storage_data):
     with open(file, 'w') as file_h:
         file_h.write(xml)
 
-def create_storage_image(storage_data):
+def create_storage_image(storage_data, scenario=None):
     """
     Create the storage image
+    scenario: the image of a latency scenario stays fully preallocated
     """
     # TOFIX: prealloc metadata only for qcow2 image
     util.print_summary("\nCreating the Virtual Machine image")
-    encryption = ""
+    encryption = []
     #ie: qemu-img create -f qcow2 Win2k.img 20G
     if os.path.isdir(storage_data['path']):
         print(storage_data['path'])
+    elif PLAN is True:
+        util.print_warning("Would create the "+storage_data['path']+" directory")
     else:
         util.print_warning(storage_data['path']+" Doesnt exist, creating it")
         try:
             os.makedirs(storage_data['path'], exist_ok=True)
         except Exception:
             util.print_error("Can't create "+storage_data['path']+" directory")
+
+    # adapt preallocation, cluster size and COW to the filesystem
+    fstype = filesystem.find_filesystem(storage_data['path'])
+    storage_data, changes = filesystem.tune_storage(storage_data, fstype, scenario)
+    if changes:
+        util.print_warning("Filesystem "+str(fstype)+": "+", ".join(changes))
+    nocow = ""
+    if storage_data.get('nocow') is True:
+        # must be set before the image is created
+        if PLAN is True:
+            util.print_warning("Would run: chattr +C "+storage_data['path'])
+        else:
+            filesystem.set_nocow(storage_data['path'])
+        nocow = ",nocow=on"
+
     filename = storage_data['path']+"/"+storage_data['storage_name']+"."+storage_data['format']
-    cmd = "qemu-img create"
+    # never overwrite an existing image
+    if os.path.exists(filename):
+        differences = image_differences(storage_data, image_info(filename))
+        if differences == []:
+            util.print_ok(filename+" already exists with the same settings, skipping")
+        elif differences is None:
+            util.print_error("Can't read "+filename+" information, it will not be overwritten")
+        else:
+            util.print_error(filename+" already exists with other settings: "+", ".join(differences))
+            print("Remove it or select another name, it will not be overwritten")
+        return
+    cmd = ["qemu-img", "create"]
 
     # preallocation: off / metadata / falloc, full
     if storage_data['preallocation'] is False:
@@ -111,46 +253,82 @@ def create_storage_image(storage_data):
         if storage_data['encryption'] is True:
         # qemu-img create --object secret,id=sec0,data=123456 -f qcow2
         # -o encrypt.format=luks,encrypt.key-secret=sec0 base.qcow2 1G
-            encryption = " --object secret,id=sec0,data="+storage_data['password']
-            encryption += " -o "+"encrypt.format=luks,encrypt.key-secret=sec0"
+            encryption = ["--object", "secret,id=sec0,data="+storage_data['password']]
+            encryption += ["-o", "encrypt.format=luks,encrypt.key-secret=sec0"]
 
-        cmdall = cmd+" -o "+lazyref+","+clustersize+","+preallocation+","+compression_type
-        cmdall += " -f "+storage_data['format']
-        cmdall += encryption+" "+filename+" "+str(storage_data['capacity'])+storage_data['unit']
+        cmdall = cmd+["-o", lazyref+","+clustersize+","+preallocation+","+compression_type+nocow]
+        cmdall += ["-f", storage_data['format']]
+        cmdall += encryption+[filename, str(storage_data['capacity'])+storage_data['unit']]
     else:
         # this is not a qcow2 format
-        cmdoptions = " -o "+preallocation
-        cmdoptions += " -f "+storage_data['format']+" "+filename
-        cmdoptions += " "+str(storage_data['capacity'])+storage_data['unit']
-        cmdall = cmd+" "+cmdoptions
+        cmdoptions = ["-o", preallocation+nocow]
+        cmdoptions += ["-f", storage_data['format'], filename]
+        cmdoptions += [str(storage_data['capacity'])+storage_data['unit']]
+        cmdall = cmd+cmdoptions
 
-    print(cmdall)
-    out, errs = util.system_command(cmdall)
+    # dont show the password
+    print(util.cmd_to_str(cmdall).replace("data="+str(storage_data.get('password')), "data=****"))
+    if PLAN is True:
+        util.print_warning("Would create "+filename)
+        return
+    # preallocation can be long: no deadline, output is shown as it comes
+    out, errs = util.system_command(cmdall, timeout=None, stream=print)
     if errs:
-        print(errs)
+        util.print_error(errs)
     if not out:
         print(' No output... seems weird...')
-    else:
-        print(out)
+
+def image_info(filename):
+    """
+    qemu-img info of an image (could be used by a running guest), None on error
+    """
+    out, errs = util.system_command(["qemu-img", "info", "-U", "--output=json", filename])
+    if errs:
+        util.print_error(errs)
+        return None
+    try:
+        return json.loads(out)
+    except ValueError:
+        return None
+
+def image_differences(storage_data, info):
+    """
+    settings of an existing image which differ from the storage data
+    """
+    if info is None:
+        return None
+    differences = []
+    expected = [('format', storage_data['format'], info.get('format')),
+                ('size', util.memory_to_kib(storage_data['capacity'], storage_data['unit'])*1024,
+                 info.get('virtual-size'))]
+    if storage_data['format'] == "qcow2":
+        qcow2 = info.get('format-specific', {}).get('data', {})
+        if storage_data.get('cluster_size'):
+            expected.append(('cluster_size',
+                             filesystem.size_to_kib(storage_data['cluster_size'])*1024,
+                             info.get('cluster-size')))
+        expected.append(('lazy_refcounts', storage_data['lazy_refcounts'] is True,
+                         qcow2.get('lazy-refcounts', False)))
+        expected.append(('compression_type', storage_data['compression_type'],
+                         qcow2.get('compression-type', 'zlib')))
+        expected.append(('encryption', storage_data['encryption'] is True,
+                         info.get('encrypted', False)))
+    for name, wanted, current in expected:
+        if wanted != current:
+            differences.append(name+" "+str(current)+" (expected "+str(wanted)+")")
+    return differences
 
 def check_cpu_flag(flag):
     """
     check if a CPU flag is present
     """
-    cpuinfo = open("/proc/cpuinfo")
-    data = cpuinfo.read()
-    test = data.find(flag)
-    cpuinfo.close()
-    return test
+    return host_facts().cpu_flag(flag)
 
 def sev_info():
     """
     grab the SEV information
     """
-    sev_info = sev.SevInfo()
-    sev_info.host_detect()
-
-    return sev_info
+    return host_facts().sev_info()
 
 def check_libvirt_sev(sev_info):
     """
@@ -166,12 +344,7 @@ def check_sev_enable():
     """
     check that sev is enable on this system
     """
-    sevinfo = open("/sys/module/kvm_amd/parameters/sev")
-    #sevinfo = open("/sys/module/kvm/supported")
-    data = sevinfo.read()
-    test = data.find("Y")
-    sevinfo.close()
-    return test
+    return host_facts().sev_enabled()
 
 def check_in_container():
     """
@@ -179,10 +352,7 @@ def check_in_container():
     """
 #    if os.environ['container'] != "":
 #        return True
-    out, errs = util.system_command("systemd-detect-virt -c")
-    if errs:
-        print(errs)
-    if out.find("none") == -1:
+    if host_facts().in_container() is True:
         print("You are inside a container, you should do some stuff on the host system....")
         return True
 
@@ -194,125 +364,182 @@ def enable_sev():
         print("Create: /etc/modprobe.d/sev.conf")
         print("options mem_encrypt=on kvm_amd sev=1 sev_es=1")
     else:
-        sevconf = open("/etc/modprobe.d/sev.conf", "w")
-        sevconf.write("options mem_encrypt=on kvm_amd sev=1 sev_es=1")
-        sevconf.close()
+        write_config("/etc/modprobe.d/sev.conf", "options mem_encrypt=on kvm_amd sev=1 sev_es=1")
 
-def hugepages_enable():
+def hugepages_enable(plan):
     """
-    check that vm.nr_hugepages is not 0
-    reserve 1 GB (1,048,576 KB) for your VM Guest (2M hugepages)
+    allocate the hugepages pools of the plan on each NUMA node
+    and keep the default page size pool after reboot
     """
     hpconf = "/etc/sysctl.d/hugepages.conf"
+    facts = host_facts()
+    default_size = facts.get('memory')['hugepagesize']
+    total_default = hp.total_pages(plan, default_size)
     if check_in_container() is True:
-        print("Create: /etc/sysctl.d/hugepages.conf")
-        print("sysctl vm.nr_hugepages=512")
+        sysfs.show_knobs(hp.plan_knobs(plan))
+        if total_default > 0:
+            print("Create: "+hpconf)
+            print("vm.nr_hugepages="+str(total_default))
+        hp.show_plan(plan)
+        return
+
+    util.print_summary("\nAllocating the Huge Pages pools")
+    if PLAN is True:
+        # pools already big enough are not in the knobs
+        sysfs.show_diff(sysfs.diff_knobs(hp.plan_knobs(plan), lambda path: str(
+            next(pool['current'] for pool in plan if pool['path'] == path))))
+    elif OUTPUT_ROOT is None:
+        sysfs.show_results(hp.allocate(plan))
     else:
-        if os.path.isfile(hpconf):
-            print(hpconf+" Already exist")
-            return True
-        else:
-            print("Creating "+hpconf)
-            fdhp = open(hpconf, "w")
-            fdhp.write("vm.nr_hugepages=512")
-            fdhp.close()
-            out, errs = util.system_command("sysctl vm.nr_hugepages=512")
-            util.print_summary("\nSetting vm.nr_hugepages=512")
-            if errs:
-                print(errs)
-            print(out)
+        # offline host: nothing to read back
+        sysfs.show_results(apply_knobs(hp.plan_knobs(plan)))
+    hp.show_plan(plan)
+    facts.invalidate('numa')
+    facts.invalidate('memory')
+    # sysctl only handle the default page size, spread on all nodes at boot
+    if total_default > 0:
+        write_config(hpconf, "vm.nr_hugepages="+str(total_default)+"\n")
+    for size in sorted(set(pool['size'] for pool in plan)):
+        if size != default_size:
+            print("Add to the kernel command line to keep them after reboot: hugepagesz="
+                  +hp.size_to_str(size)+" hugepages="+str(hp.total_pages(plan, size)))
 
 def reprobe_kvm_amd_module():
     """
     reload the module
     """
-    cmd = "modprobe -vr kvm_amd ; modprobe -v kvm_amd"
+    cmds = [["modprobe", "-vr", "kvm_amd"], ["modprobe", "-v", "kvm_amd"]]
     if check_in_container() is True:
-        print(cmd)
+        for cmd in cmds:
+            print(util.cmd_to_str(cmd))
     else:
-        out, errs = util.system_command(cmd)
         util.print_summary("\nReprobe the KVM module")
-        if errs:
-            print(errs)
-        print(out)
+        # unload then load: must be done in sequence
+        for cmd in cmds:
+            out, errs = host_command(cmd)
+            if errs:
+                print(errs)
+            print(out)
+        host_facts().invalidate('sev')
+
+def ksm_knobs(merge_across, guests, budget):
+    """
+    ksmd settings sized from the guests memory, only merge_across_nodes
+    without guests
+    """
+    import virtscenario.ksm as ksm
+    facts = host_facts()
+    # ksmd never scans the hugetlbfs pages
+    guests = [guest for guest in guests or [] if guest.get('size') is None]
+    # the other domains of a live host are scanned too (an offline host
+    # is planned with all its guests)
+    if guests and OUTPUT_ROOT is None:
+        import virtscenario.libvirtconn as libvirtconn
+        names = set(guest['name'] for guest in guests)
+        guests += [dom for dom in libvirtconn.domains_usage()
+                   if dom['hugepages'] is False and dom['name'] not in names]
+    if not guests:
+        return [(ksm.KSM_PATH+"/merge_across_nodes", "1" if merge_across == "enable" else "0")]
+    memory = sum(guest['memory'] for guest in guests)
+    plan = ksm.plan_ksm(memory, len(guests), len(facts.get('numa')), merge_across == "enable", budget)
+    ksm.show_plan(plan)
+    advisor = os.path.exists(facts.path(ksm.KSM_PATH+"/advisor_mode"))
+    knobs = ksm.plan_knobs(plan, advisor)
+    # EBUSY while pages are shared: they must be unmerged first
+    shared = sysfs.read_knob(facts.path(ksm.KSM_PATH+"/pages_shared"))
+    if shared not in [None, "0"]:
+        for path, value in list(knobs):
+            name = os.path.basename(path)
+            current = sysfs.read_knob(facts.path(path))
+            if name in ksm.SHARED_ONLY_KNOBS and current is not None and current != str(value):
+                knobs.remove((path, value))
+                util.print_warning(name+": "+current+" -> "+str(value)+" needs no shared pages: "
+                                   "echo 2 > "+ksm.KSM_PATH+"/run first (unmerge all pages)")
+    return knobs
 
-def manage_ksm(todo, merge_across):
+def manage_ksm(todo, merge_across, guests=None, budget=None):
     """
     manage ksm
+    guests: the guests planned on this host (memory KiB) to size the scan
+    budget: fraction of one cpu for ksmd
     """
     if todo == "enable":
         action = "start"
+        wanted = ("enabled", "active")
     else:
         action = "stop"
-    cmd1 = "systemctl "+todo+" ksm"
-    cmd2 = "systemctl "+action+" ksm"
-    if merge_across == "enable":
-        cmd3 = "echo 1 > /sys/kernel/mm/ksm/merge_across_nodes"
-    elif merge_across == "disable":
-        cmd3 = "echo 0 > /sys/kernel/mm/ksm/merge_across_nodes"
-    else:
-        cmd3 = ""
+        wanted = ("disabled", "inactive")
+    cmd1 = ["systemctl", todo, "ksm"]
+    cmd2 = ["systemctl", action, "ksm"]
     util.print_summary("\nManaging KSM")
+    knobs = []
+    if todo == "enable" and merge_across in ["enable", "disable"]:
+        knobs = ksm_knobs(merge_across, guests, budget)
     if check_in_container() is True:
-        for cmds in [cmd1, cmd2, cmd3]:
-            print(cmds)
+        for cmds in [cmd1, cmd2]:
+            print(util.cmd_to_str(cmds))
+        sysfs.show_knobs(knobs)
     else:
-        for cmds in [cmd1, cmd2, cmd3]:
-            out, errs = util.system_command(cmds)
+        # restarting ksm disturbs the running guests: only if needed
+        state = service_state("ksm")
+        cmds = []
+        if state is None or state[0] != wanted[0]:
+            cmds.append(cmd1)
+        if state is None or state[1] != wanted[1]:
+            cmds.append(cmd2)
+        if not cmds:
+            print("ksm service: "+" ".join(wanted)+" (unchanged)")
+        for cmd in cmds:
+            out, errs = host_command(cmd)
             if errs:
                 print(str(errs)+" "+str(out))
-        if todo == "enable":
-            print("KSM enabled")
-        else:
-            print("KSM disabled")
+        sysfs.show_results(apply_knobs(knobs))
+        if PLAN is False:
+            if todo == "enable":
+                print("KSM enabled")
+            else:
+                print("KSM disabled")
 
 def swappiness(number):
     """
     swappiness
     """
     util.print_summary("\nSwappiness")
-    #echo 35 > /proc/sys/vm/swappiness
     #/etc/systcl.conf
     #vm.swappiness = 35
-    cmd = "echo "+number+"> /proc/sys/vm/swappiness"
+    knobs = [(hostfacts.VM_PATH+"/swappiness", number)]
     if check_in_container() is True:
-        print(cmd)
+        sysfs.show_knobs(knobs)
     else:
-        out, errs = util.system_command(cmd)
-        if errs:
-            print(str(errs)+" "+str(out))
-        print(cmd)
+        sysfs.show_results(apply_knobs(knobs))
 
 def list_all_disk():
     """
-    list all disks available
+    list all block devices available
     """
-    context = pyudev.Context()
-    all_disk = []
-    for device in context.list_devices(MAJOR='8'):
-        if device.device_type == 'disk':
-            #print("{}, ({})".format(device.device_node, device.device_type))
-            onlydev = device.device_node.replace("/dev", "")
-            all_disk.append(onlydev)
-    return all_disk
+    return host_facts().get('disks')
 
-def manage_ioscheduler(scheduler):
-    """
-    manage ioscheduler
-    """
-    util.print_summary("\nIO scheduler")
-    listdisk = list_all_disk()
-    cmdstart = "echo "+scheduler+" > /sys/block"
-    cmdend = "/queue/scheduler"
+def manage_block_devices(scenario, storage_path=None):
+    """
+    scheduler of each block device by class (nvme, ssd, hdd, virtio, dm, md)
+    queue settings of the devices storing the VM images
+    """
+    import virtscenario.blockdev as blockdev
+    util.print_summary("\nIO scheduler and block devices queue")
+    disks = list_all_disk()
+    backing = None
+    # the path of an offline host can not be checked from here
+    if storage_path and OUTPUT_ROOT is None:
+        device = blockdev.device_of_path(storage_path)
+        if device is not None:
+            backing = blockdev.device_stack(device, disks)
+    knobs, devices = blockdev.plan_knobs(disks, scenario, backing)
+    blockdev.show_devices(devices)
     if check_in_container() is True:
-        for disk in listdisk:
-            print(cmdstart+disk+cmdend)
+        sysfs.show_knobs(knobs)
     else:
-        for disk in listdisk:
-            out, errs = util.system_command(cmdstart+disk+cmdend)
-            if errs:
-                print(str(errs)+" "+str(out))
-            print(cmdstart+disk+cmdend)
+        # all disks are independent, apply them concurrently
+        sysfs.show_results(apply_knobs(knobs))
         print("\nRecommended IO Scheduler inside VM guest is 'none'")
 
 def kvm_amd_sev(sev_info):
@@ -324,23 +551,23 @@ def kvm_amd_sev(sev_info):
     util.print_summary("Enabling sev if needed")
     check_libvirt_sev(sev_info)
     flag = "sev"
-    test_flag = check_cpu_flag(flag)
-    if test_flag <= -1:
+    if check_cpu_flag(flag) is False:
         util.print_error(" "+flag+" CPU flag not found...")
         util.print_error("WARNING: You can not do secure VM on this system (SEV)")
     else:
         util.print_ok("Found "+flag+" CPU flag")
-        test_sev = check_sev_enable()
-        if test_sev <= -1:
+        if check_sev_enable() is False:
             util.print_error(" SEV not enabled on this system")
             enable_sev()
             reprobe_kvm_amd_module()
         else:
             util.print_ok(" SEV enabled on this system")
 
-def hugepages():
+def hugepages(guests):
     """
     prepare system to use hugepages
+    guests: list of guests planned on this host (name, memory KiB, size kB, node)
+    the guests without hugepages (size None) are not counted
     https://documentation.suse.com/sles/15-SP4/single-html/SLES-virtualization-best-practices/#sec-vt-best-mem-huge-pages
     """
     #pdpe1gb pse
@@ -348,23 +575,103 @@ def hugepages():
     flaglist = ["pdpe1gb", "pse"]
     foundok = False
     for flag in flaglist:
-        test_flag = check_cpu_flag(flag)
-        if test_flag <= -1:
+        if check_cpu_flag(flag) is False:
             util.print_error(" "+flag+" CPU flag not found...")
         else:
             util.print_ok("Found "+flag+" CPU flag")
             foundok = True
     if foundok is True:
-        hugepages_enable()
+        hugepages_enable(hp.plan_pages(guests, host_facts()))
     else:
         util.print_error("There is no hugepages support on this system")
 
+def realtime(rt_guest):
+    """
+    kernel command line isolating the cpus of the real time guest, and
+    check no housekeeping thread will run on an isolated cpu
+    rt_guest: name, isolated cpus, pins (domain, element, cpus) of the guest
+    """
+    import virtscenario.realtime as rt
+    util.print_summary("\nReal time CPU isolation")
+    if rt_guest is None or not rt_guest['isolated']:
+        util.print_warning("No isolated cpu for this guest (no NUMA placement)")
+        return
+    facts = host_facts()
+    cmdline = rt.parse_cmdline(hostfacts.read_file(facts.path(rt.PROC_CMDLINE)))
+    isolated = rt_guest['isolated']
+    missing = rt.missing_params(cmdline, isolated)
+    if not missing:
+        print("isolcpus nohz_full rcu_nocbs: "+util.cpulist_to_str(isolated)+" (unchanged)")
+    else:
+        for param in missing:
+            util.print_warning(param['param']+": "+str(param['current'])+" -> "+param['wanted'])
+        print("Add to the kernel command line (reboot needed): "
+              +" ".join(param['param']+"="+param['wanted'] for param in missing))
+
+    util.print_summary("\nHousekeeping threads")
+    pins = list(rt_guest['pins'])
+    # the domains of an offline host are not known
+    if OUTPUT_ROOT is None:
+        import virtscenario.placement as placement
+        pins += rt.domains_pins(placement.domains_xml(), rt_guest['name'])
+    rt.show_conflicts(rt.housekeeping_conflicts(set(isolated) | rt.isolated_cpus(cmdline), pins))
+
+def transparent_hugepages(scenario):
+    """
+    transparent hugepages and khugepaged policy of the scenario
+    """
+    import virtscenario.thp as thp
+    util.print_summary("\nTransparent Huge Pages")
+    knobs = thp.plan_knobs(scenario)
+    if not knobs:
+        return
+    facts = host_facts()
+    toreport = thp.report(knobs, lambda path: sysfs.read_knob(facts.path(path)))
+    if check_in_container() is True:
+        sysfs.show_knobs(knobs)
+    else:
+        sysfs.show_results(apply_knobs(knobs))
+    util.print_recommended(toreport, "Host Settings")
+
+def scenario_tuning(scenario, guests, sev_info=None, storage_path=None, rt_guest=None,
+                    ksm_budget=None):
+    """
+    host tuning of a scenario
+    guests: memory of the guests, with their hugepages size (see hugepages())
+    storage_path: directory of the VM images
+    rt_guest: cpus of the real time guest (see realtime())
+    ksm_budget: fraction of one cpu for ksmd
+    """
+    if scenario == "computation":
+        hugepages(guests)
+        # enable/disable ksm | enable/disable merge across
+        manage_ksm("enable", "disable", guests, ksm_budget)
+        swappiness("0")
+    elif scenario == "desktop":
+        # no hugepages: the guest memory is merged and given back to the host
+        manage_ksm("enable", "enable", guests, ksm_budget)
+        swappiness("35")
+    elif scenario == "securevm":
+        kvm_amd_sev(sev_info or host_facts().sev_info())
+        manage_ksm("disable", "")
+        swappiness("0")
+    elif scenario == "softrtvm":
+        hugepages(guests)
+        # memory is not shared (nosharepages): scanning is useless
+        manage_ksm("disable", "")
+        swappiness("0")
+        realtime(rt_guest)
+    # madvise / never, compaction and khugepaged rate
+    transparent_hugepages(scenario)
+    # none / mq-deadline / bfq depending on the device class
+    manage_block_devices(scenario, storage_path)
+
 def host_end(filename, toreport, conffile):
     """
     end of host configuration
     """
     util.print_summary_ok("\nHost Configuration is done")
-    if len(toreport) != 6:
+    if any(toreport.values()):
         util.print_summary("\nComparison table between user and recommended settings")
         util.print_warning("You are over writing scenario setting!")
         print("     Overwrite are from "+conffile+"\n")
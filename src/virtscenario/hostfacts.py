@@ -0,0 +1,361 @@
+# Authors: Antoine Ginies <aginies@suse.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Host facts: probe the host only once per run
+"""
+
+import os
+import json
+from glob import glob
+from concurrent.futures import ThreadPoolExecutor
+import virtscenario.util as util
+import virtscenario.sev as sev
+
+CACHE_FILE = os.path.expanduser("~/.cache/virt-scenario/hostfacts.json")
+# increased when the format of a fact change: older cache files are ignored
+FACTS_VERSION = 2
+BOOT_ID = "/proc/sys/kernel/random/boot_id"
+CPUINFO = "/proc/cpuinfo"
+MEMINFO = "/proc/meminfo"
+NODE_PATH = "/sys/devices/system/node"
+CPU_PATH = "/sys/devices/system/cpu"
+KVM_AMD_SEV = "/sys/module/kvm_amd/parameters/sev"
+BLOCK_PATH = "/sys/block"
+VM_PATH = "/proc/sys/vm"
+# output of 'virsh domcapabilities' in a host snapshot
+DOMCAPABILITIES = "/virsh-domcapabilities.xml"
+# facts which do not change until next boot: stored in the cache file
+STATIC_FACTS = ['cpu_flags', 'in_container', 'cpu_topology', 'sev']
+# free memory, hugepages pools, hotplugged disks: read again on each run
+VOLATILE_FACTS = ['numa', 'memory', 'disks']
+
+def read_file(file, default=""):
+    """
+    return the content of a file, default if not readable
+    """
+    try:
+        with open(file) as file_h:
+            return file_h.read()
+    except OSError:
+        return default
+
+def parse_meminfo(data):
+    """
+    /proc/meminfo or nodeN/meminfo to a dict of kB
+    """
+    meminfo = {}
+    for line in data.splitlines():
+        if ':' not in line:
+            continue
+        key, value = line.split(':', 1)
+        # node meminfo: "Node 0 MemTotal"
+        key = key.split()[-1]
+        value = value.split()
+        if value and value[0].isdigit():
+            meminfo[key] = int(value[0])
+    return meminfo
+
+class HostFacts:
+    """
+    Snapshot of the host: cpu flags, container, NUMA, memory, disks, SEV
+    Each fact is collected the first time it is needed, the static ones
+    are stored in a cache file (valid until next boot or an explicit
+    invalidate())
+    root: read the facts from a host snapshot directory instead of /
+    """
+    def __init__(self, cachefile=CACHE_FILE, root="/"):
+        """
+        init, load the cache file if present
+        """
+        self.cachefile = cachefile
+        self.root = root
+        self.boot_id = read_file(self.path(BOOT_ID)).strip()
+        self.facts = {}
+        self.load()
+
+    def load(self):
+        """
+        load the static facts from the cache file (same boot and format only)
+        """
+        if self.cachefile is None:
+            return
+        try:
+            with open(self.cachefile) as file_h:
+                data = json.load(file_h)
+        except (OSError, ValueError):
+            return
+        if data.get('boot_id') == self.boot_id and data.get('version') == FACTS_VERSION:
+            facts = data.get('facts', {})
+            self.facts = {name: facts[name] for name in STATIC_FACTS if name in facts}
+
+    def save(self):
+        """
+        store the static facts in the cache file
+        """
+        if self.cachefile is None:
+            return
+        facts = {name: self.facts[name] for name in STATIC_FACTS if name in self.facts}
+        try:
+            os.makedirs(os.path.dirname(self.cachefile), exist_ok=True)
+            with open(self.cachefile, 'w') as file_h:
+                json.dump({'boot_id': self.boot_id, 'version': FACTS_VERSION,
+                           'facts': facts}, file_h)
+        except OSError:
+            pass
+
+    def path(self, file):
+        """
+        file of the host (live or snapshot)
+        """
+        if self.root == "/":
+            return file
+        return os.path.join(self.root, file.lstrip('/'))
+
+    def offline(self):
+        """
+        facts are read from a snapshot
+        """
+        return self.root != "/"
+
+    def invalidate(self, name=None):
+        """
+        forget one fact, or all of them (and remove the cache file)
+        """
+        if name is not None:
+            self.facts.pop(name, None)
+            self.save()
+            return
+        self.facts = {}
+        if self.cachefile is not None and os.path.isfile(self.cachefile):
+            os.remove(self.cachefile)
+
+    def refresh(self):
+        """
+        forget the volatile facts: they are read again when needed
+        """
+        for name in VOLATILE_FACTS:
+            self.facts.pop(name, None)
+
+    def get(self, name):
+        """
+        return a fact, collect it if needed
+        """
+        if name not in self.facts:
+            self.facts[name] = getattr(self, "collect_"+name)()
+            self.save()
+        return self.facts[name]
+
+    def collect_all(self):
+        """
+        collect all facts
+        """
+        todo = []
+        for name in ['cpu_flags', 'in_container', 'numa', 'cpu_topology', 'memory', 'disks', 'sev']:
+            if name not in self.facts:
+                todo.append(name)
+        # probes are independent (virsh, systemd-detect-virt...): run them concurrently
+        if todo:
+            with ThreadPoolExecutor(max_workers=len(todo)) as executor:
+                values = executor.map(lambda name: getattr(self, "collect_"+name)(), todo)
+            self.facts.update(zip(todo, values))
+            self.save()
+        return self.facts
+
+    def collect_cpu_flags(self):
+        """
+        CPU flags of the first processor block only
+        """
+        with open(self.path(CPUINFO)) as cpuinfo:
+            for line in cpuinfo:
+                if line.strip() == "":
+                    break
+                if line.startswith("flags"):
+                    return line.split(':', 1)[1].split()
+        return []
+
+    def collect_in_container(self):
+        """
+        running inside a container?
+        """
+        if self.offline():
+            return False
+        out, errs = util.system_command(["systemd-detect-virt", "-c"])
+        if errs:
+            print(errs)
+        return out.find("none") == -1
+
+    def collect_numa(self):
+        """
+        NUMA nodes: cpus and memory (kB)
+        """
+        nodes = []
+        for path in glob(self.path(NODE_PATH)+"/node[0-9]*"):
+            meminfo = parse_meminfo(read_file(path+"/meminfo"))
+            # hugepages pool of this node, by page size (kB)
+            hugepages = {}
+            for hpath in glob(path+"/hugepages/hugepages-*kB"):
+                size = os.path.basename(hpath)[len("hugepages-"):-len("kB")]
+                hugepages[size] = {
+                    'nr': int(read_file(hpath+"/nr_hugepages", "0").strip() or 0),
+                    'free': int(read_file(hpath+"/free_hugepages", "0").strip() or 0),
+                    }
+            nodes.append({
+                'id': int(os.path.basename(path)[4:]),
+                'cpus': util.parse_cpulist(read_file(path+"/cpulist")),
+                'mem_total': meminfo.get('MemTotal', 0),
+                'mem_free': meminfo.get('MemFree', 0),
+                'hugepages': hugepages,
+                })
+        return sorted(nodes, key=lambda node: node['id'])
+
+    def collect_cpu_topology(self):
+        """
+        package, core and thread siblings of each online cpu
+        """
+        topology = []
+        online = util.parse_cpulist(read_file(self.path(CPU_PATH)+"/online"))
+        for cpu in online:
+            path = self.path(CPU_PATH)+"/cpu"+str(cpu)+"/topology"
+            topology.append({
+                'cpu': cpu,
+                'package': int(read_file(path+"/physical_package_id", "0").strip() or 0),
+                'core': int(read_file(path+"/core_id", "0").strip() or 0),
+                'siblings': util.parse_cpulist(read_file(path+"/thread_siblings_list", str(cpu))),
+                })
+        return topology
+
+    def collect_memory(self):
+        """
+        host memory (kB)
+        """
+        meminfo = parse_meminfo(read_file(self.path(MEMINFO)))
+        return {
+            'mem_total': meminfo.get('MemTotal', 0),
+            'mem_available': meminfo.get('MemAvailable', 0),
+            'hugepagesize': meminfo.get('Hugepagesize', 0),
+            'hugepages_total': meminfo.get('HugePages_Total', 0),
+            }
+
+    def collect_disks(self):
+        """
+        all block devices (disks, dm, md...): major, rotational, available
+        schedulers, slaves and partitions, read from sysfs (live or snapshot)
+        """
+        all_disk = []
+        for path in sorted(glob(self.path(BLOCK_PATH)+"/*/dev")):
+            block = os.path.dirname(path)
+            name = os.path.basename(block)
+            major = read_file(path, "0:0").split(':')[0]
+            schedulers = read_file(block+"/queue/scheduler").replace('[', '').replace(']', '')
+            slaves = []
+            if os.path.isdir(block+"/slaves"):
+                slaves = sorted(os.listdir(block+"/slaves"))
+            all_disk.append({
+                'name': name,
+                'major': int(major) if major.isdigit() else 0,
+                'rotational': read_file(block+"/queue/rotational", "0").strip() == "1",
+                'schedulers': schedulers.split(),
+                'slaves': slaves,
+                'partitions': sorted(os.path.basename(os.path.dirname(part))
+                                     for part in glob(block+"/"+name+"*/partition")),
+                })
+        return all_disk
+
+    def collect_sev(self):
+        """
+        SEV capabilities from libvirt and the kvm_amd module
+        """
+        sev_info = sev.SevInfo()
+        if self.offline():
+            sev_info.host_detect(read_file(self.path(DOMCAPABILITIES), None))
+        else:
+            sev_info.host_detect()
+        data = dict(vars(sev_info))
+        data['kvm_amd_sev'] = read_file(self.path(KVM_AMD_SEV)).strip()
+        return data
+
+    def cpu_flag(self, flag):
+        """
+        is the CPU flag present
+        """
+        return flag in self.get('cpu_flags')
+
+    def in_container(self):
+        """
+        inside a container
+        """
+        return self.get('in_container')
+
+    def sev_info(self):
+        """
+        SevInfo object filled from the facts
+        """
+        sev_info = sev.SevInfo()
+        for key, value in self.get('sev').items():
+            if hasattr(sev_info, key):
+                setattr(sev_info, key, value)
+        return sev_info
+
+    def sev_enabled(self):
+        """
+        SEV enabled in the kvm_amd module
+        """
+        return self.get('sev')['kvm_amd_sev'] in ["Y", "1"]
+
+def capture(outdir):
+    """
+    store a snapshot of this host facts sources in outdir
+    (used to compute host tuning offline)
+    """
+    files = [BOOT_ID, CPUINFO, MEMINFO, KVM_AMD_SEV, CPU_PATH+"/online", "/proc/cmdline"]
+    files += glob(CPU_PATH+"/cpu[0-9]*/topology/physical_package_id")
+    files += glob(CPU_PATH+"/cpu[0-9]*/topology/core_id")
+    files += glob(CPU_PATH+"/cpu[0-9]*/topology/thread_siblings_list")
+    files += glob(NODE_PATH+"/node[0-9]*/cpulist")
+    files += glob(NODE_PATH+"/node[0-9]*/meminfo")
+    files += glob(NODE_PATH+"/node[0-9]*/hugepages/hugepages-*kB/*_hugepages")
+    files += glob(BLOCK_PATH+"/*/dev")
+    for knob in ['pages_to_scan', 'sleep_millisecs', 'max_page_sharing', 'merge_across_nodes',
+                 'pages_shared', 'advisor_mode', 'advisor_max_cpu', 'advisor_target_scan_time']:
+        files.append("/sys/kernel/mm/ksm/"+knob)
+    for knob in ['enabled', 'defrag', 'khugepaged/pages_to_scan', 'khugepaged/scan_sleep_millisecs',
+                 'khugepaged/max_ptes_none']:
+        files.append("/sys/kernel/mm/transparent_hugepage/"+knob)
+    # vm knobs compared to the scenario ones
+    for knob in ['swappiness', 'nr_hugepages']:
+        files.append(VM_PATH+"/"+knob)
+    files += glob(BLOCK_PATH+"/*/*/partition")
+    for knob in ['rotational', 'scheduler', 'nr_requests', 'read_ahead_kb', 'rq_affinity', 'nomerges']:
+        files += glob(BLOCK_PATH+"/*/queue/"+knob)
+    for file in files:
+        data = read_file(file, None)
+        if data is None:
+            continue
+        target = os.path.join(outdir, file.lstrip('/'))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'w') as file_h:
+            file_h.write(data)
+    # slaves are links to the lower devices: only their name is needed
+    for slave in glob(BLOCK_PATH+"/*/slaves/*"):
+        target = os.path.join(outdir, slave.lstrip('/'))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        open(target, 'w').close()
+    out, errs = sev.domain_capabilities()
+    if errs:
+        util.print_error(errs)
+    else:
+        with open(os.path.join(outdir, DOMCAPABILITIES.lstrip('/')), 'w') as file_h:
+            file_h.write(out)
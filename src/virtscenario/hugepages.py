@@ -0,0 +1,135 @@
+# Authors: Antoine Ginies <aginies@suse.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Hugepages pool sizing: pages needed by all guests planned on the host
+"""
+
+import virtscenario.util as util
+import virtscenario.sysfs as sysfs
+import virtscenario.hostfacts as hostfacts
+import virtscenario.placement as placement
+
+# page size in kB
+PAGE_2M = 2048
+PAGE_1G = 1048576
+
+def page_size(facts, memory_kib):
+    """
+    use 1G pages if the CPU support them and the memory is a multiple of 1G
+    """
+    if facts.cpu_flag("pdpe1gb") and memory_kib % PAGE_1G == 0:
+        return PAGE_1G
+    return PAGE_2M
+
+def nr_path(node, size):
+    """
+    sysfs file of the pool of one node
+    """
+    return hostfacts.NODE_PATH+"/node"+str(node)+"/hugepages/hugepages-"+str(size)+"kB/nr_hugepages"
+
+def plan_pages(guests, facts):
+    """
+    compute the pages needed per NUMA node and page size
+    guests: list of dict: name, memory (KiB), size (kB, None: no hugepages),
+    node (None: not pinned)
+    """
+    nodes = facts.get('numa')
+    free = {}
+    current = {}
+    for node in nodes:
+        free[node['id']] = placement.node_free_memory(node)
+        for size, pool in node.get('hugepages', {}).items():
+            current[(int(size), node['id'])] = (pool['nr'], pool['free'])
+    if not free:
+        free[0] = facts.get('memory')['mem_total']
+
+    need = {}
+    # biggest guests first, unpinned guests go on the node with most free memory
+    for guest in sorted(guests, key=lambda guest: guest['memory'], reverse=True):
+        if guest['size'] is None:
+            continue
+        node = guest.get('node')
+        if node is None:
+            node = max(free, key=free.get)
+        size = guest['size']
+        pages = -(-guest['memory'] // size)
+        need[(size, node)] = need.get((size, node), 0) + pages
+        free[node] = free.get(node, 0) - guest['memory']
+
+    plan = []
+    for (size, node), pages in sorted(need.items()):
+        nr_current, nr_free = current.get((size, node), (0, 0))
+        plan.append({
+            'node': node,
+            'size': size,
+            'pages': pages,
+            'current': nr_current,
+            # the pages used by the running guests stay used, and the pool
+            # is never shrunk
+            'target': max(nr_current, nr_current - nr_free + pages),
+            'allocated': None,
+            'path': nr_path(node, size),
+            })
+    return plan
+
+def plan_knobs(plan):
+    """
+    knobs to write for this plan
+    """
+    return [(pool['path'], pool['target']) for pool in plan if pool['target'] != pool['current']]
+
+def allocate(plan):
+    """
+    allocate all node pools, read them back to detect a shortfall
+    (memory fragmentation can prevent the kernel to allocate all pages)
+    """
+    results = sysfs.apply_knobs(plan_knobs(plan))
+    for pool in plan:
+        value = hostfacts.read_file(pool['path']).strip()
+        pool['allocated'] = int(value) if value.isdigit() else 0
+    return results
+
+def show_plan(plan):
+    """
+    show the pools needed and the allocation
+    """
+    print("{:>5s} {:>10s} {:>8s} {:>8s} {:>8s} {:>10s}".format("node", "size(kB)", "needed",
+                                                             "current", "target", "allocated"))
+    for pool in plan:
+        allocated = "-" if pool['allocated'] is None else str(pool['allocated'])
+        print("{:>5d} {:>10d} {:>8d} {:>8d} {:>8d} {:>10s}".format(pool['node'], pool['size'],
+                                                                  pool['pages'], pool['current'],
+                                                                  pool['target'], allocated))
+    for pool in plan:
+        if pool['allocated'] is not None and pool['allocated'] < pool['target']:
+            util.print_error(" node"+str(pool['node'])+": only "+str(pool['allocated'])+"/"
+                             +str(pool['target'])+" pages of "+str(pool['size'])+"kB (fragmentation)")
+            print(" Try: echo 1 > /proc/sys/vm/compact_memory, or reserve them at boot:")
+            print(" hugepagesz="+size_to_str(pool['size'])+" hugepages="+str(pool['target']))
+
+def size_to_str(size):
+    """
+    page size for the kernel command line
+    """
+    if size == PAGE_1G:
+        return "1G"
+    return str(size // 1024)+"M"
+
+def total_pages(plan, size):
+    """
+    total of pages of one size (all nodes)
+    """
+    return sum(pool['target'] for pool in plan if pool['size'] == size)
@@ -0,0 +1,119 @@
+# Authors: Antoine Ginies <aginies@suse.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+KSM scan rate sized from the guests memory and a CPU budget for ksmd
+https://docs.kernel.org/admin-guide/mm/ksm.html
+"""
+
+import virtscenario.util as util
+
+KSM_PATH = "/sys/kernel/mm/ksm"
+PAGE_SIZE = 4
+# ksmd cost per scanned page (s): ~2% of a cpu at the default 5000 pages/s
+PAGE_COST = 4e-6
+# default CPU budget of ksmd: fraction of one cpu
+CPU_BUDGET = 0.05
+# a full scan of all guests memory is wanted in this time (s)
+TARGET_SCAN_TIME = 600
+# longer than this, merged pages are found too late to help
+MAX_SCAN_TIME = 3600
+# kernel defaults
+MIN_PAGES_TO_SCAN = 100
+SLEEP_MILLISECS = 20
+MAX_SLEEP_MILLISECS = 1000
+MIN_PAGE_SHARING = 256
+MAX_PAGE_SHARING = 4096
+# can only be changed when no page is shared
+SHARED_ONLY_KNOBS = ['max_page_sharing', 'merge_across_nodes']
+
+def next_power_of_two(value):
+    """
+    smallest power of two >= value
+    """
+    power = 1
+    while power < value:
+        power *= 2
+    return power
+
+def plan_ksm(memory_kib, guests, nodes, merge_across, budget=None):
+    """
+    ksmd settings to scan memory_kib of guests memory
+    guests: number of guests, nodes: NUMA nodes
+    merge_across: merge pages of different NUMA nodes
+    budget: fraction of one cpu for ksmd (default CPU_BUDGET)
+    """
+    if budget is None:
+        budget = CPU_BUDGET
+    pages = max(1, memory_kib // PAGE_SIZE)
+    # pages/s needed for a full scan in TARGET_SCAN_TIME, limited by the budget
+    max_rate = budget / PAGE_COST
+    rate = min(max_rate, pages / TARGET_SCAN_TIME)
+
+    sleep = SLEEP_MILLISECS
+    pages_to_scan = int(rate * sleep / 1000)
+    if pages_to_scan < MIN_PAGES_TO_SCAN:
+        # small hosts: same batch, less wake up
+        pages_to_scan = MIN_PAGES_TO_SCAN
+        sleep = min(MAX_SLEEP_MILLISECS, max(SLEEP_MILLISECS, int(pages_to_scan * 1000 / max(rate, 1))))
+    rate = pages_to_scan * 1000 / sleep
+
+    # one stable page per max_page_sharing guests sharing it
+    sharing = guests if merge_across is True else -(-guests // max(nodes, 1))
+    max_page_sharing = min(MAX_PAGE_SHARING, max(MIN_PAGE_SHARING, next_power_of_two(sharing)))
+    return {
+        'memory': memory_kib,
+        'guests': guests,
+        'pages_to_scan': pages_to_scan,
+        'sleep_millisecs': sleep,
+        'max_page_sharing': max_page_sharing,
+        'merge_across_nodes': 1 if merge_across is True else 0,
+        'rate': rate,
+        'scan_time': pages / rate,
+        'cpu': rate * PAGE_COST,
+        'budget': budget,
+    }
+
+def plan_knobs(plan, advisor=False):
+    """
+    knobs of the plan, with the kernel advisor (6.7) pages_to_scan is
+    adjusted by the kernel to reach the scan time in the cpu budget
+    """
+    knobs = []
+    if advisor is True:
+        knobs.append((KSM_PATH+"/advisor_mode", "scan-time"))
+        knobs.append((KSM_PATH+"/advisor_max_cpu", max(1, int(round(plan['budget'] * 100)))))
+        knobs.append((KSM_PATH+"/advisor_target_scan_time", TARGET_SCAN_TIME))
+    else:
+        knobs.append((KSM_PATH+"/pages_to_scan", plan['pages_to_scan']))
+    knobs.append((KSM_PATH+"/sleep_millisecs", plan['sleep_millisecs']))
+    knobs.append((KSM_PATH+"/max_page_sharing", plan['max_page_sharing']))
+    knobs.append((KSM_PATH+"/merge_across_nodes", plan['merge_across_nodes']))
+    return knobs
+
+def show_plan(plan):
+    """
+    projected scan of all guests memory
+    """
+    print("Guests memory: {:.1f} GiB ({} guests)".format(plan['memory'] / 1024**2, plan['guests']))
+    print("pages_to_scan {} every {}ms: {:.1f} MiB/s, ~{:.1f}% of a cpu (budget {:.1f}%)".format(
+        plan['pages_to_scan'], plan['sleep_millisecs'], plan['rate'] * PAGE_SIZE / 1024,
+        plan['cpu'] * 100, plan['budget'] * 100))
+    line = "Projected full scan of the guests memory: {:.0f}s ({:.1f} min)".format(
+        plan['scan_time'], plan['scan_time'] / 60)
+    if plan['scan_time'] > MAX_SCAN_TIME:
+        util.print_warning(line+": increase the ksmd cpu budget")
+    else:
+        print(line)
@@ -0,0 +1,318 @@
+# Authors: Antoine Ginies <aginies@suse.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+libvirt API: one connection per URI reused for all calls
+libvirt-python is optional, callers fallback to virsh without it
+test:///default can be used without a running libvirtd
+"""
+
+import os
+import threading
+import xml.etree.ElementTree as ET
+import virtscenario.util as util
+
+# None: libvirt default URI (LIBVIRT_DEFAULT_URI or qemu:///system)
+URI = None
+# False: never use the API, always fallback to virsh
+USE_API = True
+# libvirt test driver: no libvirtd needed
+TEST_URI = "test:///default"
+# opened connections by URI (a libvirt connection is thread safe)
+CONNECTIONS = {}
+# URI which can not be opened: do not retry (and report) for each call
+FAILED = set()
+LOCK = threading.Lock()
+
+def forget_all():
+    """
+    a forked process can not use the parent connections
+    """
+    CONNECTIONS.clear()
+
+os.register_at_fork(after_in_child=forget_all)
+
+def available():
+    """
+    libvirt-python is installed (and allowed)
+    """
+    if USE_API is False:
+        return False
+    import importlib.util
+    return importlib.util.find_spec("libvirt") is not None
+
+def connect(uri=None, retry=False):
+    """
+    return the connection to uri, opened only once; None if not possible
+    retry: try again an URI which failed (explicit connect)
+    """
+    if not available():
+        return None
+    import libvirt
+    uri = uri or URI
+    with LOCK:
+        if retry is True:
+            FAILED.discard(uri)
+        if uri in FAILED:
+            return None
+        conn = CONNECTIONS.get(uri)
+        if conn is not None:
+            try:
+                if conn.isAlive() == 1:
+                    return conn
+            except libvirt.libvirtError:
+                pass
+        try:
+            conn = libvirt.open(uri)
+        except libvirt.libvirtError as exc:
+            util.print_error("Can't connect to libvirt "+str(uri)+": "+str(exc))
+            FAILED.add(uri)
+            return None
+        CONNECTIONS[uri] = conn
+        return conn
+
+def close_all():
+    """
+    close all connections
+    """
+    with LOCK:
+        for conn in CONNECTIONS.values():
+            try:
+                conn.close()
+            except Exception:
+                pass
+        CONNECTIONS.clear()
+        FAILED.clear()
+
+def domain_capabilities(uri=None):
+    """
+    domain capabilities XML (virsh domcapabilities), None if not available
+    """
+    conn = connect(uri)
+    if conn is None:
+        return None
+    import libvirt
+    try:
+        return conn.getDomainCapabilities(None, None, None, None, 0)
+    except libvirt.libvirtError as exc:
+        util.print_error("Can't get the domain capabilities: "+str(exc))
+        return None
+
+def xml_files(path):
+    """
+    all XML files of a directory, or the file
+    """
+    if os.path.isdir(path):
+        return [os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.endswith(".xml")]
+    return [path]
+
+def define_domains(files, uri=None):
+    """
+    define (persistent) all domains over one connection
+    return a list of result: file, name, uuid, error
+    """
+    conn = connect(uri)
+    if conn is None:
+        return None
+    import libvirt
+    results = []
+    for file in files:
+        result = {
+            'file': file,
+            'name': None,
+            'uuid': None,
+            'error': None,
+        }
+        try:
+            with open(file) as file_h:
+                dom = conn.defineXML(file_h.read())
+            result['name'] = dom.name()
+            result['uuid'] = dom.UUIDString()
+        except (OSError, libvirt.libvirtError) as exc:
+            result['error'] = str(exc)
+        results.append(result)
+    return results
+
+def show_define(results):
+    """
+    show the define results
+    """
+    util.print_summary("\nDefine the domains")
+    for res in results:
+        if res['error'] is None:
+            util.print_ok(res['name']+" defined ("+res['uuid']+")")
+        else:
+            util.print_error(res['file']+": "+res['error'])
+
+def list_domains(conn):
+    """
+    all domains (running and defined), None if libvirt fails
+    """
+    import libvirt
+    try:
+        return conn.listAllDomains(0)
+    except libvirt.libvirtError as exc:
+        util.print_error("Can't list the libvirt domains: "+str(exc))
+        return None
+
+def domains_xml(uri=None):
+    """
+    XML of all domains (running and defined), None if not available
+    a domain undefined meanwhile is skipped
+    """
+    conn = connect(uri)
+    if conn is None:
+        return None
+    import libvirt
+    domains = list_domains(conn)
+    if domains is None:
+        return None
+    xmls = []
+    for dom in domains:
+        try:
+            xmls.append(dom.XMLDesc(0))
+        except libvirt.libvirtError:
+            continue
+    return xmls
+
+def uses_hugepages(root):
+    """
+    the memory of the domain is backed by hugepages
+    """
+    return root.find("memoryBacking/hugepages") is not None
+
+def balloon_of(xml):
+    """
+    memballoon of a domain XML: model (None without balloon, or with a
+    memory backed by hugepages) and free page reporting
+    """
+    import virtscenario.xmlutil as xmlutil
+    root = xmlutil.from_string(xml)
+    # a freed hugetlbfs page goes back to the static pool, not to the host
+    if uses_hugepages(root) is True:
+        return None, False
+    balloon = root.find("devices/memballoon")
+    # libvirt adds a virtio balloon if none is defined
+    if balloon is None:
+        return "virtio", False
+    model = balloon.get('model')
+    return (None if model == "none" else model), balloon.get('freePageReporting') == "on"
+
+def reclaimable(dom):
+    """
+    memory (KiB) the balloon can take back from a running guest without
+    swapping it (stats period needed in the guest), 0 if not known
+    """
+    import libvirt
+    try:
+        stats = dom.memoryStats()
+    except libvirt.libvirtError:
+        return 0
+    return stats.get('usable', stats.get('unused', 0))
+
+def defined_usage(path=None):
+    """
+    resources of the domains defined in path (default /etc/libvirt/qemu),
+    without libvirt: not known as running, nothing reclaimable
+    """
+    import virtscenario.placement as placement
+    import virtscenario.xmlutil as xmlutil
+    path = path or placement.LIBVIRT_QEMU
+    util.print_warning("libvirt not available: only the domains defined in "+path)
+    usage = []
+    for xml in placement.domains_xml(path):
+        try:
+            root = xmlutil.from_string(xml)
+        except ET.ParseError:
+            continue
+        memory = root.find('memory')
+        balloon, reporting = balloon_of(xml)
+        usage.append({
+            'name': root.findtext('name', ""),
+            'active': False,
+            'hugepages': uses_hugepages(root),
+            'vcpu': int(root.findtext('vcpu', "1")),
+            'memory': 0 if memory is None else util.memory_to_kib(memory.text, memory.get('unit', 'KiB')),
+            'balloon': balloon,
+            'reporting': reporting,
+            'reclaimable': 0,
+            })
+    return usage
+
+def domains_usage(uri=None):
+    """
+    resources of all domains: name, active, backed by hugepages, vcpu,
+    memory (KiB), balloon model, free page reporting, reclaimable memory (KiB)
+    fallback to the defined domains files if libvirt is not available
+    """
+    conn = connect(uri)
+    if conn is None:
+        return defined_usage()
+    import libvirt
+    domains = list_domains(conn)
+    if domains is None:
+        return defined_usage()
+    usage = []
+    for dom in domains:
+        try:
+            # state, maxMem, memory, nrVirtCpu, cpuTime
+            info = dom.info()
+            active = dom.isActive() == 1
+            xml = dom.XMLDesc(0)
+            name = dom.name()
+        except libvirt.libvirtError:
+            # undefined meanwhile
+            continue
+        balloon, reporting = balloon_of(xml)
+        usage.append({
+            'name': name,
+            'active': active,
+            'hugepages': uses_hugepages(ET.fromstring(xml)),
+            'vcpu': info[3],
+            'memory': info[1],
+            'balloon': balloon,
+            'reporting': reporting,
+            'reclaimable': reclaimable(dom) if active and balloon is not None else 0,
+            })
+    return usage
+
+def show_usage(usage, cpus, memory):
+    """
+    domains resources compared to the host (cpus, memory KiB)
+    """
+    util.print_summary("\nDomains resources")
+    print("{:<30s} {:>7s} {:>6s} {:>12s} {:>10s} {:>14s}".format("name", "active", "vcpu", "memory(KiB)",
+                                                              "balloon", "reclaim(KiB)"))
+    for dom in sorted(usage, key=lambda dom: dom['name']):
+        balloon = dom['balloon'] or "none"
+        if dom['reporting'] is True:
+            balloon += "+fpr"
+        print("{:<30s} {:>7s} {:>6d} {:>12d} {:>10s} {:>14d}".format(dom['name'], str(dom['active']),
+                                                                dom['vcpu'], dom['memory'],
+                                                                balloon, dom['reclaimable']))
+    running = [dom for dom in usage if dom['active']]
+    for name, todo in [("defined", usage), ("running", running)]:
+        vcpu = sum(dom['vcpu'] for dom in todo)
+        mem = sum(dom['memory'] for dom in todo)
+        print("{:<8s} vcpu: {:>5d} ({:.2f} per host cpu) memory: {:>12d} KiB ({:.2f} of host)".format(
+            name, vcpu, vcpu / max(cpus, 1), mem, mem / max(memory, 1)))
+    # memory the running guests do not use: room for more guests
+    reclaim = sum(dom['reclaimable'] for dom in running)
+    mem = sum(dom['memory'] for dom in running)
+    print("reclaimable: {:>12d} KiB ({:.2f} of host), running memory after reclaim: {:.2f} of host".format(
+        reclaim, reclaim / max(memory, 1), (mem - reclaim) / max(memory, 1)))
+    print("free page reporting: {} of {} running domains".format(
+        sum(1 for dom in running if dom['reporting'] is True), len(running)))
@@ -19,41 +19,53 @@ Guest side definition
 """
 
 from cmd import Cmd
-import getpass
 import os
-import yaml
 import virtscenario.util as util
 import virtscenario.guest as guest
 import virtscenario.scenario as s
+import virtscenario.features as f
 import virtscenario.configuration as c
 import virtscenario.qemulist as qemulist
 import virtscenario.xmlutil as xmlutil
 import virtscenario.host as host
+import virtscenario.placement as placement
+import virtscenario.hugepages as hp
 
 def create_default_domain_xml(xmlfile):
     """
     create the VM domain XML
     """
-    cmd1 = "virt-install --print-xml --virt-type kvm --arch x86_64 --machine pc-q35-6.2 "
-    cmd2 = "--osinfo sles12sp5 --rng /dev/urandom --network test_net >" +xmlfile
-    util.system_command(cmd1+cmd2)
+    cmd = ["virt-install", "--print-xml", "--virt-type", "kvm", "--arch", "x86_64",
+           "--machine", "pc-q35-6.2", "--osinfo", "sles12sp5", "--rng", "/dev/urandom",
+           "--network", "test_net"]
+    out, errs = util.system_command(cmd)
+    if errs:
+        print(errs)
+    with open(xmlfile, 'w') as file_h:
+        file_h.write(out)
 
-def create_from_template(finalfile, xml_all):
+def create_from_template(finalfile, root):
     """
-    create the VM domain XML from all template input given
+    create the VM domain XML file from the domain tree
     """
     util.print_summary("\nCreate The XML VM configuration")
-    print(os.path.dirname(os.path.abspath(finalfile))+"/"+finalfile)
-    with open(finalfile, 'w') as file_h:
-        file_h.write(xml_all)
+    print(os.path.abspath(finalfile))
+    if xmlutil.write_xml(finalfile, root) is False:
+        print("Unchanged")
 
-def validate_xml(xmlfile):
+def validate_xml(root):
     """
-    validate the generated file
+    validate the generated domain
+    in process with the libvirt schema, fallback to virt-xml-validate
     """
-    cmd = "virt-xml-validate "+xmlfile
-    out, errs = util.system_command(cmd)
     util.print_summary("\nValidation of the XML file")
+    errors = xmlutil.validate_domain(root)
+    if errors is not None:
+        xmlutil.show_validation(root.findtext('name'), errors)
+        return
+    # the domain is sent on stdin, no need to read the file
+    cmd = ["virt-xml-validate", "/dev/stdin", "domain"]
+    out, errs = util.system_command(cmd, xmlutil.to_string(root))
     if errs:
         print(errs)
     print(out)
@@ -64,12 +76,10 @@ def create_xml_config(data):
     create the xml file
     """
     # final XML creation
-    # start the domain definition
-    xml_all = ""
-    # first line must be a warning, kvm by default
-    xml_all = "<!-- WARNING: THIS IS A GENERATED FILE FROM VIRT-SCENARIO -->\n"
-    xml_all += "<domain type='kvm'>\n"
-    xml_all += data.name+data.memory+data.vcpu+data.osdef+data.security
+    # start the domain definition, kvm by default
+    xml_all = "<domain type='kvm'>\n"
+    xml_all += data.name+data.memory+data.vcpu+data.cputune+data.numatune
+    xml_all += data.osdef+data.security
     xml_all += data.features+data.cpumode+data.clock+data.hugepages
     xml_all += data.ondef+data.power+data.iothreads
     # all below must be in devices section
@@ -78,18 +88,23 @@ def create_xml_config(data):
     xml_all += data.disk+data.network+data.CONSOLE
     xml_all += data.CHANNEL+data.inputmouse+data.inputkeyboard
     xml_all += data.GRAPHICS+data.video+data.RNG+data.watchdog
-    xml_all += data.usb+data.tpm
+    xml_all += data.usb+data.tpm+data.memballoon
     # close the device section
     xml_all += "</devices>\n"
     # close domain section
     xml_all += "</domain>\n"
 
-    # create the file from the template and setting
-    create_from_template(data.filename, xml_all)
+    # parse it once, all custom changes are done in memory
+    root = xmlutil.from_string(xml_all)
     if "loader" in data.custom:
-        xmlutil.add_loader_nvram(data.filename, qemulist.OVMF_PATH+"/ovmf-x86_64-smm-opensuse-code.bin", qemulist.OVMF_VARS+"/"+data.callsign+".VARS")
+        xmlutil.add_loader_nvram(root, qemulist.OVMF_PATH+"/ovmf-x86_64-smm-opensuse-code.bin", qemulist.OVMF_VARS+"/"+data.callsign+".VARS")
     ### if "XXXX" in data.custom:
 
+    # create the file from the template and setting (first line is a warning)
+    create_from_template(data.filename, root)
+    data.rendered = data.filename
+    return root
+
 def final_step_guest(data):
     """
     show setting from xml
@@ -97,11 +112,111 @@ def final_step_guest(data):
     validate the XML file
     """
     util.print_summary("Guest Section")
-    create_xml_config(data)
-    xmlutil.show_from_xml(data.filename)
-    validate_xml(data.filename)
+    root = create_xml_config(data)
+    if data.interactive is True:
+        xmlutil.show_from_xml(root)
+    validate_xml(root)
     util.print_summary_ok("Guest XML Configuration is done")
 
+# normalized configuration files, by path: (path, mtime, size), config
+CONFIG_CACHE = {}
+
+# available option in config.yaml file, all other ignored
+STORAGE_OPTIONS = ["disk_type", "disk_cache", "disk_target", "disk_bus", "path",
+                   "format", "unit", "capacity", "cluster_size",
+                   "lazy_refcounts", "preallocation", "compression_type",
+                   "encryption",
+                  ]
+# host section: ksm_cpu_budget in percent of one cpu for ksmd
+HOST_OPTIONS = ["ksm_cpu_budget"]
+
+def valid_budget(value):
+    """
+    a cpu budget is a percent of one cpu
+    """
+    try:
+        budget = float(value)
+    except (TypeError, ValueError):
+        return False
+    return 0 < budget <= 100
+
+def read_conffile(conffile):
+    """
+    parse and normalize the configuration file, the result is reused
+    by all scenarios until the file change (path, mtime and size)
+    """
+    key = util.file_key(conffile)
+    cached = CONFIG_CACHE.get(conffile)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    config = {
+        'emulator': None,
+        'keyboard': None,
+        'mouse': None,
+        'arch': None,
+        'storage': {},
+        'network': {},
+        'host': {},
+        'errors': [],
+        }
+    # parse all section of the yaml file
+    for item, value in (util.validate_file(conffile) or {}).items():
+        # check mathing section
+        if item == "emulator":
+            for dall in value:
+                for datai, valuei in dall.items():
+                    if datai == "emulator":
+                        config['emulator'] = valuei
+                    else:
+                        config['errors'].append("Unknow parameter in emulator section")
+        elif item == "input":
+            # Parse keyboard and mouse
+            for dall in value:
+                for datai, valuei in dall.items():
+                    if datai in ["keyboard", "mouse"]:
+                        config[datai] = valuei
+                    else:
+                        config['errors'].append("Unknow parameter in input section")
+        elif item == "architecture":
+            # Parse list os def sectopn
+            for dall in value:
+                for datai, valuei in dall.items():
+                    if datai == "arch":
+                        config['arch'] = valuei
+                    else:
+                        config['errors'].append("Unknow parameter in lisofdef section")
+        elif item == "STORAGE_DATA":
+            # Parse storage section
+            for dall in value:
+                for datai, valuei in dall.items():
+                    # check the option is the same and file it
+                    if datai in STORAGE_OPTIONS:
+                        config['storage'][datai] = valuei
+                    else:
+                        config['errors'].append("Unknow option for storage!")
+        elif item == "network":
+            # some guest OS have no virtio-net driver
+            for dall in value:
+                for datai, valuei in dall.items():
+                    if datai == "model":
+                        config['network']['model'] = valuei
+                    else:
+                        config['errors'].append("Unknow parameter in network section")
+        elif item == "host":
+            for dall in value:
+                for datai, valuei in dall.items():
+                    if datai not in HOST_OPTIONS:
+                        config['errors'].append("Unknow parameter in host section")
+                    elif valid_budget(valuei) is False:
+                        config['errors'].append("ksm_cpu_budget must be a percent of one cpu (0-100)")
+                    else:
+                        config['host'][datai] = valuei
+        else:
+            config['errors'].append("Unknow Section...")
+    CONFIG_CACHE[conffile] = (key, config)
+    return config
+
 def find_yaml_file():
     """ Show all yaml file in current path"""
     yaml_list = []
@@ -138,30 +253,14 @@ class MyPrompt(Cmd):
     vcpu = name = diskpath = memory = osdef = ondef = cpumode = power = watchdog = ""
     audio = usb = disk = features = clock = network = filename = tpm = iothreads = ""
     callsign = custom = security = video = controller = hugepages = toreport = ""
+    cputune = numatune = memballoon = ""
+    numa_node = hugepages_guest = rt_guest = None
     # prompt Cmd
     prompt = 'virt-scenario > '
-    introl = {}
-    introl[0] = "\n"+util.esc('32;1;1') +" virt-scenario "+util.esc(0)+ "Interactive Terminal!\n\n"
-    introl[1] = " Prepare a Libvirt XML guest config and the host to run a customized guest:\n"
-    introl[2] = util.esc('34;1;1')+" computation | desktop | securevm"+util.esc(0)+"\n"
-    introl[3] = "\n Possible User Settings:\n"
-    introl[4] = util.esc('34;1;1')+" name|vcpu|memory|machine|bootdev|diskpath|conf"+util.esc(0)+"\n"
-    introl[5] = "\n"+" Some settings which overwrite scenario settings can be done in: "+conffile+"\n"
-    introl[6] = util.esc('31;1;1')+"\n WARNING:"+util.esc(0)+" This is under Devel...\n"
-    introl[7] = " Source code: https://github.com/aginies/virt-scenario\n"
-    introl[8] = " Report bug: https://github.com/aginies/virt-scenario/issues\n"
+    # built in preloop(): not needed by the one-shot command line
     intro = ''
-    for line in range(9):
-        intro += introl[line]
-
-    # There is some Immutable in dict for the moment...
-    #IMMUT = immut.Immutable()
-    CONSOLE = guest.create_console()#IMMUT.console_data)
-    CHANNEL = guest.create_channel()#IMMUT.channel_data)
-    GRAPHICS = guest.create_graphics()#IMMUT.graphics_data)
-    MEMBALLOON = guest.create_memballoon()#IMMUT.memballoon_data)
-    RNG = guest.create_rng()#IMMUT.rng_data)
-    METADATA = guest.create_metadata()#IMMUT.metadata_data)
+    # fixed fragments, set in basic_config()
+    CONSOLE = CHANNEL = GRAPHICS = MEMBALLOON = RNG = METADATA = ""
 
     promptline = '_________________________________________\n'
     prompt = promptline +'> '
@@ -169,6 +268,20 @@ class MyPrompt(Cmd):
     # what kind of configuration should be done
     mode = "both"
     all_modes = ['guest', 'host', 'both']
+    # batch mode: no XML dump, no password prompt
+    interactive = True
+    # per guest STORAGE_DATA overwrite (batch manifest)
+    storage_override = {}
+    # pin vcpu and memory on a host NUMA node (computation)
+    numa_pinning = True
+    # placement computed by the NUMA planner for a set of guests (batch)
+    planned = None
+    # mac address set by the batch manifest (unique in it), None: from the name
+    macaddress = None
+    # why the last scenario could not be done (no XML written), None: done
+    failed = None
+    # XML file written by the guest part of the last scenario, None: not done
+    rendered = None
 
     dataprompt = {
         'name': None,
@@ -187,6 +300,24 @@ class MyPrompt(Cmd):
     })
 
 
+    def preloop(self):
+        """
+        intro of the interactive terminal
+        """
+        introl = {}
+        introl[0] = "\n"+util.esc('32;1;1') +" virt-scenario "+util.esc(0)+ "Interactive Terminal!\n\n"
+        introl[1] = " Prepare a Libvirt XML guest config and the host to run a customized guest:\n"
+        introl[2] = util.esc('34;1;1')+" computation | desktop | securevm | softrtvm"+util.esc(0)+"\n"
+        introl[3] = "\n Possible User Settings:\n"
+        introl[4] = util.esc('34;1;1')+" name|vcpu|memory|machine|bootdev|diskpath|conf"+util.esc(0)+"\n"
+        introl[5] = "\n"+" Some settings which overwrite scenario settings can be done in: "+self.conffile+"\n"
+        introl[6] = util.esc('31;1;1')+"\n WARNING:"+util.esc(0)+" This is under Devel...\n"
+        introl[7] = " Source code: https://github.com/aginies/virt-scenario\n"
+        introl[8] = " Report bug: https://github.com/aginies/virt-scenario/issues\n"
+        self.intro = ''
+        for line in range(9):
+            self.intro += introl[line]
+
     def check_user_settings(self, virtum):
         """
         Check if the user as set some stuff, if yes use it
@@ -199,6 +330,8 @@ class MyPrompt(Cmd):
 
         nameuser = self.dataprompt.get('name')
         if nameuser != None:
+            # callsign and filename are based on the scenario name
+            virtum.name['VM_name'] = nameuser
             self.name = guest.create_name({'VM_name': nameuser})
         else:
             self.name = guest.create_name(virtum.name)
@@ -226,6 +359,156 @@ class MyPrompt(Cmd):
             self.listosdef.update({'boot_dev': bootdevuser})
         self.osdef = guest.create_osdef(self.listosdef)
 
+    def guest_memory(self, virtum):
+        """
+        memory of the guest in KiB (user setting or scenario)
+        """
+        memoryuser = self.dataprompt.get('memory')
+        if memoryuser != None:
+            return util.memory_to_kib(memoryuser, 'Gib')
+        return util.memory_to_kib(virtum.memory['memory'], virtum.memory['current_mem_unit'])
+
+    def numa_placement(self, virtum):
+        """
+        pin vcpu and memory of the guest on one host NUMA node
+        """
+        vcpu = int(self.dataprompt.get('vcpu') or virtum.vcpu['vcpu'])
+        todo = self.planned
+        if todo is None:
+            todo = placement.find_placement(host.host_facts(), vcpu, self.guest_memory(virtum))
+        placement.show_placement(todo)
+        if todo is None:
+            return
+        # None: spanning several nodes (planner)
+        self.numa_node = todo['node']
+
+        data = c.BasicConfiguration()
+        self.cputune = guest.create_cputune(data.cputune(todo['vcpupin'], todo['emulatorpin']))
+        nodeset = todo.get('nodeset', str(todo['node']))
+        self.numatune = guest.create_numatune(data.numatune("strict", nodeset))
+        # show sibling threads to the guest
+        if todo['threads'] > 1:
+            topology = guest.create_cpu_topology({
+                'cores': vcpu // todo['threads'],
+                'threads': todo['threads'],
+                })
+            cpumode = dict(virtum.cpumode)
+            cpumode['extra'] = cpumode['extra']+topology
+            self.cpumode = guest.create_cpumode_pass(cpumode)
+
+    def rt_placement(self, virtum):
+        """
+        real time: each vcpu alone on an isolated host core with a fifo
+        scheduler, emulator and iothreads on the housekeeping cpus
+        return False if no core can be isolated
+        """
+        import virtscenario.realtime as rt
+        vcpu = int(self.dataprompt.get('vcpu') or virtum.vcpu['vcpu'])
+        todo = self.planned
+        if todo is None:
+            todo = placement.find_rt_placement(host.host_facts(), vcpu, self.guest_memory(virtum))
+        placement.show_placement(todo)
+        if todo is None:
+            return False
+        self.numa_node = todo['node']
+
+        iothreads = [todo['emulatorpin']] * f.iothreads_number(vcpu, 1)
+        data = c.BasicConfiguration()
+        self.cputune = guest.create_cputune(data.cputune(todo['vcpupin'], todo['emulatorpin'],
+                                                         iothreads, rt.VCPU_SCHED))
+        nodeset = todo.get('nodeset', str(todo['node']))
+        self.numatune = guest.create_numatune(data.numatune("strict", nodeset))
+        housekeeping = util.parse_cpulist(todo['emulatorpin'])
+        self.rt_guest = {
+            'name': self.callsign,
+            'isolated': todo['isolated'],
+            'pins': [(self.callsign, pin, housekeeping) for pin in rt.HOUSEKEEPING_PINS],
+            }
+        return True
+
+    def disk_config(self, virtum):
+        """
+        iothreads sized from vcpu and disks, each virtio disk bound to an
+        iothread with one queue per vcpu
+        """
+        vcpu = int(self.dataprompt.get('vcpu') or virtum.vcpu['vcpu'])
+        # only one disk per VM for the moment
+        disks = 1
+        iothreads = f.iothreads_number(vcpu, disks)
+        data = c.BasicConfiguration()
+        self.iothreads = guest.create_iothreads(data.iothreads(iothreads))
+        if self.STORAGE_DATA['disk_bus'] == "virtio":
+            self.STORAGE_DATA['iothread'] = f.disk_iothread(0, iothreads)
+            self.STORAGE_DATA['queues'] = vcpu
+        self.disk = guest.create_disk(self.STORAGE_DATA)
+
+    def network_config(self, virtum):
+        """
+        virtio with the vhost backend and one queue per vcpu, unless the
+        guest OS needs an other model (network section of the config file)
+        """
+        vcpu = int(self.dataprompt.get('vcpu') or virtum.vcpu['vcpu'])
+        network = dict(virtum.network)
+        network['mac_address'] = self.macaddress or util.stable_macaddress(self.callsign)
+        model = self.NETWORK_DATA.get('model') or network['type']
+        network['type'] = model
+        network['queues'] = vcpu if model == "virtio" else 1
+        self.network = guest.create_interface(network)
+
+        if model != virtum.network['type']:
+            rec_rate = f.net_packet_rate(virtum.network['type'], vcpu)
+            set_rate = f.net_packet_rate(model, network['queues'])
+            self.add_report("Net model",
+                            "vhost "+str(vcpu)+"q (~"+str(rec_rate)+"x e1000 pps)",
+                            model+" (~"+str(set_rate)+"x e1000 pps)")
+
+    def ksm_budget(self):
+        """
+        cpu budget of ksmd from the host section (percent), None: default
+        """
+        budget = self.HOST_DATA.get('ksm_cpu_budget')
+        if budget is None:
+            return None
+        return float(budget) / 100
+
+    def add_report(self, title, rec, userset):
+        """
+        add a line in the comparison table between user and recommended settings
+        """
+        lines = [line for line in self.toreport.values() if line]
+        lines.append({'title': title, 'rec': rec, 'set': userset})
+        self.toreport = dict(enumerate(lines, start=1))
+
+    def memory_config(self, virtum):
+        """
+        no hugepages backing: the memory of the guest can be merged (KSM)
+        and given back to the host (balloon free page reporting)
+        """
+        self.hugepages = ""
+        self.hugepages_guest = {
+            'name': self.callsign,
+            'memory': self.guest_memory(virtum),
+            'size': None,
+            'node': self.numa_node,
+            }
+
+    def hugepages_config(self, virtum, locked=False):
+        """
+        hugepages backing with the best page size for this guest
+        locked: not swapped nor shared (real time)
+        """
+        memory = self.guest_memory(virtum)
+        size = hp.page_size(host.host_facts(), memory)
+        data = c.BasicConfiguration()
+        self.hugepages = guest.create_hugepages(data.hugepages(size, "0", locked))
+        # used by the host to size the pools
+        self.hugepages_guest = {
+            'name': self.callsign,
+            'memory': memory,
+            'size': size,
+            'node': self.numa_node,
+            }
+
     def update_prompt(self, args):
         """
         update prompt with value set by user
@@ -287,6 +570,10 @@ class MyPrompt(Cmd):
         """
         init the basic configuration
         """
+        # each scenario is computed from the current free memory and disks
+        host.refresh_facts()
+        self.failed = None
+        self.rendered = None
         self.vcpu = ""
         self.memory = ""
         self.osdef = ""
@@ -309,6 +596,21 @@ class MyPrompt(Cmd):
         self.custom = ""
         self.security = ""
         self.video = ""
+        self.cputune = ""
+        self.numatune = ""
+        self.numa_node = None
+        self.hugepages_guest = None
+        self.rt_guest = None
+        self.memballoon = ""
+
+        # There is some Immutable in dict for the moment...
+        #IMMUT = immut.Immutable()
+        self.CONSOLE = guest.create_console()#IMMUT.console_data)
+        self.CHANNEL = guest.create_channel()#IMMUT.channel_data)
+        self.GRAPHICS = guest.create_graphics()#IMMUT.graphics_data)
+        self.MEMBALLOON = guest.create_memballoon()#IMMUT.memballoon_data)
+        self.RNG = guest.create_rng()#IMMUT.rng_data)
+        self.METADATA = guest.create_metadata()#IMMUT.metadata_data)
 
         # prefile STORAGE_DATA in case of...
         self.STORAGE_DATA = {
@@ -327,6 +629,10 @@ class MyPrompt(Cmd):
             'encryption': '',
             #'password': '',
         }
+        # network model to use instead of the recommended one
+        self.NETWORK_DATA = {}
+        # host tuning settings
+        self.HOST_DATA = {}
         # This dict is the recommended settings for storage
         self.STORAGE_DATA_REC = {}
 
@@ -337,55 +643,23 @@ class MyPrompt(Cmd):
         self.inputkeyboard = guest.create_input(data.input("keyboard", "virtio"))
         self.inputmouse = guest.create_input(data.input("mouse", "virtio"))
 
-        # Using config.yaml to file some VAR
-        with open(self.conffile) as file:
-            config = yaml.full_load(file)
-            # parse all section of the yaml file
-            for item, value in config.items():
-                # check mathing section
-                if item == "emulator":
-                    for dall in value:
-                        for datai, valuei in dall.items():
-                            if datai == "emulator":
-                                self.emulator = guest.create_emulator(data.emulator(valuei))
-                            else:
-                                util.print_error("Unknow parameter in emulator section")
-                elif item == "input":
-                    # Parse keyboard and mouse
-                    for dall in value:
-                        for datai, valuei in dall.items():
-                            if datai == "keyboard":
-                                self.inputkeyboard = guest.create_input(data.input("keyboard", valuei))
-                            elif datai == "mouse":
-                                self.inputmouse = guest.create_input(data.input("mouse", valuei))
-                            else:
-                                util.print_error("Unknow parameter in input section")
-                elif item == "architecture":
-                    # Parse list os def sectopn
-                    for dall in value:
-                        for datai, valuei in dall.items():
-                            if datai == "arch":
-                                self.listosdef.update({'arch': valuei})
-                            else:
-                                util.print_error("Unknow parameter in lisofdef section")
-                elif item == "STORAGE_DATA":
-                    # available option in config.yaml file, all other ignored
-                    storage_dict = ["disk_type", "disk_cache", "disk_target", "disk_bus", "path",
-                                    "format", "unit", "capacity", "cluster_size",
-                                    "lazy_refcounts", "preallocation", "compression_type",
-                                    "encryption",
-                                   ]
-                    # Parse storage section
-                    for dall in value:
-                        for datai, valuei in dall.items():
-                            # check the option is the same and file it
-                            if datai in storage_dict:
-                                self.STORAGE_DATA[datai] = valuei
-                                #print("DEBUG "+datai+":"+str(valuei))
-                            else:
-                                util.print_error("Unknow option for storage!")
-                else:
-                    util.print_error("Unknow Section...")
+        # Using config.yaml to file some VAR (parsed once per file change)
+        config = read_conffile(self.conffile)
+        for error in config['errors']:
+            util.print_error(error)
+        if config['emulator'] is not None:
+            self.emulator = guest.create_emulator(data.emulator(config['emulator']))
+        if config['keyboard'] is not None:
+            self.inputkeyboard = guest.create_input(data.input("keyboard", config['keyboard']))
+        if config['mouse'] is not None:
+            self.inputmouse = guest.create_input(data.input("mouse", config['mouse']))
+        if config['arch'] is not None:
+            self.listosdef.update({'arch': config['arch']})
+        self.STORAGE_DATA.update(config['storage'])
+        self.NETWORK_DATA.update(config['network'])
+        self.HOST_DATA.update(config['host'])
+        # batch manifest overwrite the configuration file
+        self.STORAGE_DATA.update(self.storage_override)
         #return self
 
     def check_storage(self):
@@ -448,9 +722,14 @@ class MyPrompt(Cmd):
         # ask for password in case of encryption on
         if self.STORAGE_DATA['encryption'] == "on":
             self.STORAGE_DATA['encryption'] = self.STORAGE_DATA_REC['encryption']
-            # Ask for the disk password
-            password = getpass.getpass("Please enter password to encrypt the VM image: ")
-            self.STORAGE_DATA['password'] = password
+            # Ask for the disk password (could be already set by a batch manifest)
+            if self.STORAGE_DATA.get('password') is None:
+                if self.interactive is True:
+                    import getpass
+                    password = getpass.getpass("Please enter password to encrypt the VM image: ")
+                    self.STORAGE_DATA['password'] = password
+                else:
+                    util.print_error("No password set to encrypt the VM image")
 
         # DISKCACHE
         if self.STORAGE_DATA['disk_cache'] != self.STORAGE_DATA_REC['disk_cache']:
@@ -503,13 +782,12 @@ class MyPrompt(Cmd):
         """
         Execute a system command
         """
-        out, errs = util.system_command(args)
+        # this is a user shell command line, output is shown as it comes
+        out, errs = util.system_command(["/bin/sh", "-c", args], timeout=None, stream=print)
         if errs:
-            print(errs)
+            util.print_error(errs)
         if not out:
             util.print_error(' No output... seems weird...')
-        else:
-            print(out)
 
     def help_shell(self):
         """
@@ -529,6 +807,28 @@ class MyPrompt(Cmd):
         virtual_memory = psutil.virtual_memory()
         util.print_data("Total Memory present", str(util.bytes_to_gb(virtual_memory.total))+"Gb")
 
+    def do_hostfacts(self, args):
+        """
+        show the cached host facts, refresh to probe the host again
+        """
+        facts = host.host_facts()
+        if args == "refresh":
+            facts.invalidate()
+        for name, value in facts.collect_all().items():
+            util.print_data(name, str(value))
+
+    def complete_hostfacts(self, text, line, begidx, endidx):
+        """
+        auto completion for hostfacts
+        """
+        return [f for f in ['refresh'] if f.startswith(text)]
+
+    def help_hostfacts(self):
+        """
+        help hostfacts
+        """
+        print("Show host facts (static ones cached until next boot), 'hostfacts refresh' to probe again")
+
     def help_info(self):
         """
         show help on info
@@ -559,14 +859,15 @@ class MyPrompt(Cmd):
             self.power = guest.create_power(computation.power)
             self.ondef = guest.create_ondef(computation.ondef)
             self.watchdog = guest.create_watchdog(computation.watchdog)
-            self.network = guest.create_interface(computation.network)
             self.features = guest.create_features(computation.features)
             self.clock = guest.create_clock(computation.clock)
             self.video = guest.create_video(computation.video)
-            self.iothreads = guest.create_iothreads(computation.iothreads)
             self.controller = guest.create_controller(self.listosdef)
+            self.memballoon = guest.create_memballoon(computation.memballoon)
             self.custom = ["loader",]
-            self.hugepages = guest.create_hugepages()
+            if self.numa_pinning is True:
+                self.numa_placement(computation)
+            self.hugepages_config(computation)
 
             self.STORAGE_DATA['storage_name'] = self.callsign
             self.STORAGE_DATA_REC['path'] = self.diskpath['path']
@@ -577,7 +878,8 @@ class MyPrompt(Cmd):
             self.STORAGE_DATA_REC['format'] = "raw"
             self.filename = self.callsign+".xml"
             self.check_storage()
-            self.disk = guest.create_disk(self.STORAGE_DATA)
+            self.disk_config(computation)
+            self.network_config(computation)
 
             if self.mode != "host" or self.mode == "both":
                 final_step_guest(self)
@@ -585,14 +887,11 @@ class MyPrompt(Cmd):
             if self.mode != "guest" or self.mode == "both":
                 util.print_summary("Host Section")
                 # Create the Virtual Disk image
-                host.create_storage_image(self.STORAGE_DATA)
+                host.create_storage_image(self.STORAGE_DATA, "computation")
                 # Prepare the host system
-                host.hugepages()
-                # enable/disable ksm | enable/disable merge across
-                host.manage_ksm("enable", "disable")
-                host.swappiness("0")
-                # mq-deadline / kyber / bfq / none
-                host.manage_ioscheduler("mq-deadline")
+                host.scenario_tuning("computation", [self.hugepages_guest],
+                                     storage_path=self.STORAGE_DATA['path'],
+                                     ksm_budget=self.ksm_budget())
                 host.host_end(self.filename, self.toreport, self.conffile)
 
     def help_desktop(self):
@@ -618,16 +917,15 @@ class MyPrompt(Cmd):
             self.cpumode = guest.create_cpumode_pass(desktop.cpumode)
             self.power = guest.create_power(desktop.power)
             self.ondef = guest.create_ondef(desktop.ondef)
-            self.network = guest.create_interface(desktop.network)
             self.audio = guest.create_audio(desktop.audio)
             self.usb = guest.create_usb(desktop.usb)
             self.tpm = guest.create_tpm(desktop.tpm)
             self.features = guest.create_features(desktop.features)
             self.clock = guest.create_clock(desktop.clock)
             self.video = guest.create_video(desktop.video)
-            self.iothreads = guest.create_iothreads(desktop.iothreads)
             self.controller = guest.create_controller(self.listosdef)
-            self.hugepages = guest.create_hugepages()
+            self.memballoon = guest.create_memballoon(desktop.memballoon)
+            self.memory_config(desktop)
 
             self.STORAGE_DATA['storage_name'] = self.callsign
             self.STORAGE_DATA_REC['path'] = self.diskpath['path']
@@ -638,7 +936,8 @@ class MyPrompt(Cmd):
             self.STORAGE_DATA_REC['format'] = "qcow2"
             self.filename = desktop.name['VM_name']+".xml"
             self.check_storage()
-            self.disk = guest.create_disk(self.STORAGE_DATA)
+            self.disk_config(desktop)
+            self.network_config(desktop)
 
             if self.mode != "host" or self.mode == "both":
                 final_step_guest(self)
@@ -646,14 +945,11 @@ class MyPrompt(Cmd):
             if self.mode != "guest" or self.mode == "both":
                 util.print_summary("Host Section")
                 # Create the Virtual Disk image
-                host.create_storage_image(self.STORAGE_DATA)
+                host.create_storage_image(self.STORAGE_DATA, "desktop")
                 # Prepare the host system
-                host.hugepages()
-                # enable/disable ksm | enable/disable merge across
-                host.manage_ksm("enable", "enable")
-                host.swappiness("35")
-                # mq-deadline / kyber / bfq / none
-                host.manage_ioscheduler("mq-deadline")
+                host.scenario_tuning("desktop", [self.hugepages_guest],
+                                     storage_path=self.STORAGE_DATA['path'],
+                                     ksm_budget=self.ksm_budget())
                 host.host_end(self.filename, self.toreport, self.conffile)
 
     def help_securevm(self):
@@ -671,13 +967,13 @@ class MyPrompt(Cmd):
 
             # SEV information
             sev_info = host.sev_info()
-            # do not create the SEV xml config if this is not supported...
-            if sev_info.sev_supported is True:
-                self.security = guest.create_security(securevm.security)
 
             # BasicConfiguration
             scenario = s.Scenarios()
             securevm = scenario.secure_vm(sev_info)
+            # do not create the SEV xml config if this is not supported...
+            if sev_info.sev_supported is True:
+                self.security = guest.create_security(securevm.security)
             # Check user setting
             self.check_user_settings(securevm)
 
@@ -686,11 +982,9 @@ class MyPrompt(Cmd):
             self.cpumode = guest.create_cpumode_pass(securevm.cpumode)
             self.power = guest.create_power(securevm.power)
             self.ondef = guest.create_ondef(securevm.ondef)
-            self.network = guest.create_interface(securevm.network)
             self.tpm = guest.create_tpm(securevm.tpm)
             self.features = guest.create_features(securevm.features)
             self.clock = guest.create_clock(securevm.clock)
-            self.iothreads = guest.create_iothreads(securevm.iothreads)
             self.video = guest.create_video(securevm.video)
             self.controller = guest.create_controller(self.listosdef)
             self.custom = ["loader",]
@@ -704,7 +998,8 @@ class MyPrompt(Cmd):
             self.STORAGE_DATA_REC['format'] = "qcow2"
             self.STORAGE_DATA['storage_name'] = self.callsign
             self.check_storage()
-            self.disk = guest.create_disk(self.STORAGE_DATA)
+            self.disk_config(securevm)
+            self.network_config(securevm)
 
             # no hugepages
             self.hugepages = ""
@@ -717,15 +1012,176 @@ class MyPrompt(Cmd):
             if self.mode != "guest" or self.mode == "both":
                 util.print_summary("Host Section")
                 # Create the Virtual Disk image
-                host.create_storage_image(self.STORAGE_DATA)
+                host.create_storage_image(self.STORAGE_DATA, "securevm")
+                # Prepare the host system
+                host.scenario_tuning("securevm", [], sev_info, self.STORAGE_DATA['path'])
+                host.host_end(self.filename, self.toreport, self.conffile)
+
+    def help_softrtvm(self):
+        """
+        show some help on soft real time scenario
+        """
+        print("Will prepare a Guest XML config and the host for a soft Real Time VM")
+
+    def do_softrtvm(self, args):
+        """
+        soft real time
+        """
+        if self.check_conffile() is not False:
+            self.basic_config()
+            scenario = s.Scenarios()
+            softrtvm = scenario.soft_rt_vm()
+            # Check user setting
+            self.check_user_settings(softrtvm)
+
+            self.callsign = softrtvm.name['VM_name']
+            self.name = guest.create_name(softrtvm.name)
+            self.cpumode = guest.create_cpumode_pass(softrtvm.cpumode)
+            self.power = guest.create_power(softrtvm.power)
+            self.ondef = guest.create_ondef(softrtvm.ondef)
+            self.features = guest.create_features(softrtvm.features)
+            self.clock = guest.create_clock(softrtvm.clock)
+            self.video = guest.create_video(softrtvm.video)
+            self.controller = guest.create_controller(self.listosdef)
+            self.memballoon = guest.create_memballoon(softrtvm.memballoon)
+            self.custom = ["loader",]
+            # without isolated cores this is not a real time guest: no XML
+            if self.numa_pinning is False or self.rt_placement(softrtvm) is False:
+                self.failed = "No core can be isolated for the real time guest"
+                util.print_error(self.failed+" (pinning disabled or no NUMA node can host it)")
+                return
+            self.hugepages_config(softrtvm, locked=True)
+
+            self.STORAGE_DATA['storage_name'] = self.callsign
+            self.STORAGE_DATA_REC['path'] = self.diskpath['path']
+            # no allocation while the guest runs
+            self.STORAGE_DATA_REC['preallocation'] = "full"
+            self.STORAGE_DATA_REC['encryption'] = "off"
+            self.STORAGE_DATA_REC['disk_cache'] = "none"
+            self.STORAGE_DATA_REC['lazy_refcounts'] = "on"
+            self.STORAGE_DATA_REC['format'] = "raw"
+            self.filename = self.callsign+".xml"
+            self.check_storage()
+            self.disk_config(softrtvm)
+            self.network_config(softrtvm)
+
+            if self.mode != "host" or self.mode == "both":
+                final_step_guest(self)
+
+            if self.mode != "guest" or self.mode == "both":
+                util.print_summary("Host Section")
+                # Create the Virtual Disk image
+                host.create_storage_image(self.STORAGE_DATA, "softrtvm")
                 # Prepare the host system
-                host.kvm_amd_sev(sev_info)
-                host.manage_ksm("disable", "")
-                host.swappiness("0")
-                # mq-deadline / kyber / bfq / none
-                host.manage_ioscheduler("mq-deadline")
+                host.scenario_tuning("softrtvm", [self.hugepages_guest],
+                                     storage_path=self.STORAGE_DATA['path'], rt_guest=self.rt_guest)
                 host.host_end(self.filename, self.toreport, self.conffile)
 
+    def do_batch(self, args):
+        """
+        render all guests from a manifest file
+        """
+        import virtscenario.batch as batch
+        if os.path.isfile(args) is False:
+            util.print_error("Please select a manifest file")
+        elif self.check_conffile() is not False:
+            guests = batch.load_manifest(args)
+            if guests is not None:
+                batch.run_batch(guests, self.conffile, os.getcwd())
+
+    def help_batch(self):
+        """
+        help about batch
+        """
+        print("Render all guests XML config from a manifest file (in parallel)")
+
+    def complete_batch(self, text, line, begidx, endidx):
+        """
+        auto completion to find yaml file in current path
+        """
+        return self.complete_conf(text, line, begidx, endidx)
+
+    def do_validate(self, args):
+        """
+        validate an XML file or all XML files in a directory
+        """
+        if os.path.isdir(args):
+            util.print_summary("\nValidation of "+args)
+            for file, errors in xmlutil.validate_dir(args).items():
+                xmlutil.show_validation(file, errors)
+        elif os.path.isfile(args):
+            xmlutil.show_validation(*xmlutil.validate_file(args))
+        else:
+            util.print_error("Please select an XML file or a directory")
+
+    def help_validate(self):
+        """
+        help about validate
+        """
+        print("Validate an XML file, or all XML files in a directory, with the libvirt schema")
+
+    def do_connect(self, args):
+        """
+        select the libvirt URI
+        """
+        import virtscenario.libvirtconn as libvirtconn
+        if libvirtconn.available() is False:
+            util.print_error("libvirt-python is not installed")
+            return
+        libvirtconn.URI = args or None
+        if libvirtconn.connect(retry=True) is not None:
+            util.print_ok("Connected to "+str(libvirtconn.URI or "default URI"))
+
+    def help_connect(self):
+        """
+        help about connect
+        """
+        print("Select the libvirt URI (ie: qemu:///system, test:///default), default URI without argument")
+
+    def do_define(self, args):
+        """
+        define the last XML file, a file or all XML files in a directory
+        """
+        import virtscenario.libvirtconn as libvirtconn
+        path = args or self.filename
+        if not path or os.path.exists(path) is False:
+            util.print_error("Please select an XML file or a directory")
+            return
+        results = libvirtconn.define_domains(libvirtconn.xml_files(path))
+        if results is None:
+            util.print_error("No libvirt connection, use: virsh define "+path)
+            return
+        libvirtconn.show_define(results)
+
+    def help_define(self):
+        """
+        help about define
+        """
+        print("Define the last generated XML file, a file or all XML files in a directory, through libvirt")
+
+    def complete_define(self, text, line, begidx, endidx):
+        """
+        auto completion to find xml file in current path
+        """
+        return [f for f in os.listdir('.') if f.startswith(text) and (f.endswith(".xml") or os.path.isdir(f))]
+
+    def do_domains(self, args):
+        """
+        resources of all domains compared to the host
+        """
+        import virtscenario.libvirtconn as libvirtconn
+        usage = libvirtconn.domains_usage()
+        facts = host.host_facts()
+        cpus = len(facts.get('cpu_topology'))
+        libvirtconn.show_usage(usage, cpus, facts.get('memory')['mem_total'])
+
+    def help_domains(self):
+        """
+        help about domains
+        """
+        print("Show vcpu and memory of all libvirt domains compared to the host resources,")
+        print("and the memory the balloon of the running domains can reclaim")
+
     def do_name(self, args):
         """
         define the machine name
@@ -902,7 +1358,8 @@ class MyPrompt(Cmd):
         file = args
         if os.path.isfile(file):
             Cmd.file = file
-            util.validate_file(Cmd.file)
+            # parse it now, scenarios will reuse the result
+            read_conffile(Cmd.file)
             self.conffile = file
         else:
             util.print_error("File " +file +" Doesnt exist!")
@@ -0,0 +1,192 @@
+# Authors: Antoine Ginies <aginies@suse.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+NUMA placement: pin vCPU and memory of a guest on one host NUMA node
+"""
+
+import os
+import xml.etree.ElementTree as ET
+import virtscenario.util as util
+import virtscenario.libvirtconn as libvirtconn
+
+# defined libvirt domains
+LIBVIRT_QEMU = "/etc/libvirt/qemu"
+# cores of each node kept for the host and the emulator / iothreads,
+# shared by all guests of the node
+HOUSEKEEPING_CORES = 1
+
+def domains_xml(path=None):
+    """
+    XML of all domains from libvirt, else of the defined ones in path
+    """
+    if path is None:
+        xmls = libvirtconn.domains_xml()
+        if xmls is not None:
+            return xmls
+        path = LIBVIRT_QEMU
+    xmls = []
+    if not os.path.isdir(path):
+        return xmls
+    for files in os.listdir(path):
+        if not files.endswith(".xml"):
+            continue
+        try:
+            with open(os.path.join(path, files)) as file_h:
+                xmls.append(file_h.read())
+        except OSError:
+            continue
+    return xmls
+
+def pinned_cpus(path=None):
+    """
+    host cpus already used by the vcpupin of all domains (running and
+    defined); the emulator and iothreads share the housekeeping cpus
+    """
+    used = set()
+    for xml in domains_xml(path):
+        try:
+            root = ET.fromstring(xml)
+        except ET.ParseError:
+            continue
+        for pin in root.findall("./cputune/vcpupin[@cpuset]"):
+            used.update(util.parse_cpulist(pin.get('cpuset')))
+    return used
+
+def node_cores(node, topology, used):
+    """
+    free cores of a node, each core is the list of its sibling threads
+    a core with one thread used is not free
+    """
+    cores = []
+    seen = set()
+    nodecpus = set(node['cpus'])
+    for cpu in topology:
+        if cpu['cpu'] not in nodecpus or cpu['cpu'] in seen:
+            continue
+        siblings = [sib for sib in cpu['siblings'] if sib in nodecpus]
+        seen.update(siblings)
+        if used.isdisjoint(siblings):
+            cores.append(sorted(siblings))
+    return cores
+
+def node_free_memory(node):
+    """
+    free memory of the node (kB), including free hugepages
+    """
+    free = node['mem_free']
+    for size, pool in node.get('hugepages', {}).items():
+        free += int(size) * pool['free']
+    return free
+
+def find_placement(facts, vcpu, memory_kib, used=None):
+    """
+    choose a NUMA node with enough free cores and memory, the first
+    cores of the node are kept for the housekeeping (emulator, iothreads)
+    and the core of cpu 0 never runs a vcpu
+    return None if no node can host the guest
+    """
+    if used is None:
+        used = pinned_cpus()
+    topology = facts.get('cpu_topology')
+    best = None
+    for node in facts.get('numa'):
+        cores = node_cores(node, topology, used)
+        housekeeping = sorted(cpu for core in cores[:HOUSEKEEPING_CORES] for cpu in core)
+        cores = [core for core in cores[HOUSEKEEPING_CORES:] if 0 not in core]
+        threads = sum(len(core) for core in cores)
+        free_mem = node_free_memory(node)
+        if threads < vcpu or free_mem < memory_kib:
+            continue
+        # best fit: the smallest number of free threads, then most free memory
+        score = (threads, -free_mem)
+        if best is None or score < best[0]:
+            best = (score, node, cores, housekeeping)
+    if best is None:
+        return None
+
+    _, node, cores, housekeeping = best
+    # keep sibling threads together: fill cores one by one
+    vcpupin = []
+    for core in cores:
+        for cpu in core:
+            if len(vcpupin) < vcpu:
+                vcpupin.append(cpu)
+    threads_per_core = max(len(core) for core in cores)
+    return {
+        'node': node['id'],
+        'vcpupin': vcpupin,
+        # no housekeeping core: the emulator shares the vcpus
+        'emulatorpin': util.cpulist_to_str(housekeeping or vcpupin),
+        'threads': threads_per_core if vcpu % threads_per_core == 0 else 1,
+    }
+
+def find_rt_placement(facts, vcpu, memory_kib, used=None):
+    """
+    real time: one full core per vcpu (its sibling threads stay idle), on
+    a NUMA node keeping some cpus for the housekeeping (emulator, iothreads)
+    the core of cpu 0 is never isolated; if all the cpus of the node are
+    isolated the housekeeping is done by the cpus of the other nodes
+    return None if no node can host the guest
+    """
+    if used is None:
+        used = pinned_cpus()
+    topology = facts.get('cpu_topology')
+    nodes = facts.get('numa')
+    best = None
+    for node in nodes:
+        cores = [core for core in node_cores(node, topology, used) if 0 not in core]
+        free_mem = node_free_memory(node)
+        if len(cores) < vcpu or free_mem < memory_kib:
+            continue
+        # housekeeping on the lowest cpus
+        chosen = cores[len(cores)-vcpu:]
+        isolated = sorted(cpu for core in chosen for cpu in core)
+        housekeeping = [cpu for cpu in node['cpus'] if cpu not in isolated]
+        remote = not housekeeping
+        if remote is True:
+            housekeeping = sorted(cpu for other in nodes if other is not node
+                                  for cpu in other['cpus'])
+            if not housekeeping:
+                continue
+        # local housekeeping first
+        score = (remote, len(cores), -free_mem)
+        if best is None or score < best[0]:
+            best = (score, node, chosen, isolated, housekeeping)
+    if best is None:
+        return None
+
+    _, node, chosen, isolated, housekeeping = best
+    return {
+        'node': node['id'],
+        'vcpupin': [core[0] for core in chosen],
+        'isolated': isolated,
+        'emulatorpin': util.cpulist_to_str(housekeeping),
+        'threads': 1,
+    }
+
+def show_placement(placement):
+    """
+    show the placement
+    """
+    util.print_summary("\nNUMA placement")
+    if placement is None:
+        util.print_warning("No NUMA node can host this guest, no pinning")
+        return
+    print("NUMA node: "+placement.get('nodeset', str(placement['node'])))
+    print("vCPU pinning: "+util.cpulist_to_str(placement['vcpupin']))
+    print("emulator pinning: "+placement['emulatorpin'])
+    if 'isolated' in placement:
+        print("isolated cpus: "+util.cpulist_to_str(placement['isolated']))
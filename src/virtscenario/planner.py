@@ -0,0 +1,358 @@
+# Authors: Antoine Ginies <aginies@suse.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+NUMA planner: place a set of guests on the NUMA nodes of one host
+best fit decreasing over the cores, the memory and the hugepages pools
+"""
+
+import virtscenario.util as util
+import virtscenario.placement as placement
+import virtscenario.hugepages as hp
+
+# scenarios backed by hugepages (see hugepages_config())
+HUGEPAGES_SCENARIOS = ['computation', 'softrtvm']
+# scenarios with one isolated core per vcpu, never spanning nodes
+REALTIME_SCENARIOS = ['softrtvm']
+# scenarios pinned on their planned cpus, the others float on all host
+# cpus: only their memory is counted
+PINNED_SCENARIOS = ['computation', 'softrtvm']
+# cores of each node kept for the host and the emulator / iothreads
+HOUSEKEEPING_CORES = placement.HOUSEKEEPING_CORES
+
+# vcpu, memory (KiB) of each scenario, created once
+SCENARIO_RESOURCES = {}
+
+def scenario_resources(scenario):
+    """
+    default vcpu and memory (KiB) of a scenario guest
+    """
+    if scenario not in SCENARIO_RESOURCES:
+        import virtscenario.scenario as s
+        import virtscenario.sev as sev
+        if scenario == "securevm":
+            virtum = s.Scenarios().secure_vm(sev.SevInfo())
+        elif scenario == "softrtvm":
+            virtum = s.Scenarios().soft_rt_vm()
+        else:
+            virtum = getattr(s.Scenarios(), scenario)()
+        memory = util.memory_to_kib(virtum.memory['memory'], virtum.memory['current_mem_unit'])
+        SCENARIO_RESOURCES[scenario] = (int(virtum.vcpu['vcpu']), memory)
+    return SCENARIO_RESOURCES[scenario]
+
+def guest_requests(entries, facts, scenario="computation"):
+    """
+    resources of the guests of a batch manifest: name, scenario, vcpu,
+    memory (KiB), hugepage size (kB, None: no hugepages), realtime, pinned
+    """
+    requests = []
+    for entry in entries:
+        todo = entry.get('scenario', scenario)
+        vcpu, memory = scenario_resources(todo)
+        if entry.get('vcpu') is not None:
+            vcpu = int(entry['vcpu'])
+        if entry.get('memory') is not None:
+            memory = util.memory_to_kib(entry['memory'], 'Gib')
+        requests.append({
+            'name': entry.get('name', todo),
+            'scenario': todo,
+            'vcpu': vcpu,
+            'memory': memory,
+            'size': hp.page_size(facts, memory) if todo in HUGEPAGES_SCENARIOS else None,
+            'realtime': todo in REALTIME_SCENARIOS,
+            'pinned': todo in PINNED_SCENARIOS,
+            })
+    return requests
+
+def host_nodes(facts, used, housekeeping):
+    """
+    free capacity of each node: cores (list of sibling threads), memory
+    not in a hugepages pool (kB), free pages of each pool
+    """
+    topology = facts.get('cpu_topology')
+    nodes = []
+    for node in facts.get('numa'):
+        cores = placement.node_cores(node, topology, used)
+        pages = {}
+        for size, pool in node.get('hugepages', {}).items():
+            pages[int(size)] = pool['free']
+        nodes.append({
+            'id': node['id'],
+            'housekeeping': sorted(cpu for core in cores[:housekeeping] for cpu in core),
+            'cores': cores[housekeeping:],
+            'total_cores': max(1, len(cores) - housekeeping),
+            'mem_free': node['mem_free'],
+            'total_mem': max(1, placement.node_free_memory(node)),
+            'pages': pages,
+            # pages to add in the pools (taken from mem_free)
+            'grow': {},
+            })
+    return nodes
+
+def cores_needed(guest, threads):
+    """
+    cores of a guest: a real time vcpu is alone on its core, the others
+    fill the sibling threads of a core
+    """
+    if guest['realtime'] is True:
+        return guest['vcpu']
+    return -(-guest['vcpu'] // threads)
+
+def memory_fits(node, guest, memory):
+    """
+    memory (kB) of the guest fits in the node: from the free pages of the
+    pool, then from the free memory (the pool is increased)
+    """
+    size = guest['size']
+    if size is None:
+        return node['mem_free'] >= memory
+    pages = -(-memory // size)
+    return node['pages'].get(size, 0) + node['mem_free'] // size >= pages
+
+def take_memory(node, guest, memory):
+    """
+    use the memory (kB) of the guest on the node
+    """
+    size = guest['size']
+    if size is None:
+        node['mem_free'] -= memory
+        return
+    pages = -(-memory // size)
+    pool = min(pages, node['pages'].get(size, 0))
+    node['pages'][size] = node['pages'].get(size, 0) - pool
+    grow = pages - pool
+    if grow:
+        node['grow'][size] = node['grow'].get(size, 0) + grow
+        node['mem_free'] -= grow * size
+
+def node_memory(node, guest):
+    """
+    memory (kB) the guest can use on the node
+    """
+    if guest['size'] is None:
+        return node['mem_free']
+    size = guest['size']
+    return (node['pages'].get(size, 0) + node['mem_free'] // size) * size
+
+def free_cores(node, guest):
+    """
+    free cores of the node for the guest: the core of cpu 0 (the first
+    one, taken last) is never isolated for a real time guest
+    """
+    free = len(node['cores'])
+    if guest['realtime'] is True and free and 0 in node['cores'][0]:
+        free -= 1
+    return free
+
+def best_node(nodes, guest, cores):
+    """
+    best fit: the node left with the smallest free share of cores and memory
+    """
+    best = None
+    for node in nodes:
+        if free_cores(node, guest) < cores or not memory_fits(node, guest, guest['memory']):
+            continue
+        score = ((len(node['cores']) - cores) / node['total_cores']
+                 + (node_memory(node, guest) - guest['memory']) / node['total_mem'])
+        if best is None or score < best[0]:
+            best = (score, node)
+    return None if best is None else best[1]
+
+def spanning_nodes(nodes, guest, cores):
+    """
+    nodes for a guest which does not fit in one node: the nodes with the
+    most free cores first, None if all nodes together can not host it
+    """
+    todo = sorted(nodes, key=lambda node: len(node['cores']), reverse=True)
+    span = []
+    span_cores = span_mem = 0
+    for node in todo:
+        if span_cores >= cores and span_mem >= guest['memory']:
+            break
+        if not node['cores'] and node_memory(node, guest) == 0:
+            continue
+        span.append(node)
+        span_cores += len(node['cores'])
+        span_mem += node_memory(node, guest)
+    if span_cores < cores or span_mem < guest['memory']:
+        return None
+    return span
+
+def place(guest, span, cores, threads):
+    """
+    take the cores and the memory of the guest on its nodes
+    """
+    vcpupin = []
+    isolated = []
+    nodes = []
+    memory = guest['memory']
+    for node in span:
+        used = False
+        # the last cores first: the first one of node 0 has cpu 0
+        while node['cores'] and len(vcpupin) < guest['vcpu'] and cores > 0:
+            core = node['cores'].pop()
+            cores -= 1
+            used = True
+            if guest['realtime'] is True:
+                # the sibling threads stay idle
+                vcpupin.append(core[0])
+                isolated += core
+            else:
+                vcpupin += core[:guest['vcpu'] - len(vcpupin)]
+        if memory > 0:
+            part = min(memory, node_memory(node, guest))
+            if part > 0:
+                take_memory(node, guest, part)
+                memory -= part
+                used = True
+        if used is True:
+            nodes.append(node)
+    housekeeping = sorted(cpu for node in nodes for cpu in node['housekeeping'])
+    ids = sorted(node['id'] for node in nodes)
+    result = {
+        'node': ids[0] if len(ids) == 1 else None,
+        'nodeset': util.cpulist_to_str(ids),
+        'vcpupin': vcpupin,
+        # no housekeeping core: the emulator shares the vcpus
+        'emulatorpin': util.cpulist_to_str(housekeeping or vcpupin),
+        'threads': threads if guest['realtime'] is False and guest['vcpu'] % threads == 0 else 1,
+        'spanning': len(ids) > 1,
+    }
+    if guest['realtime'] is True:
+        result['isolated'] = sorted(isolated)
+    return result
+
+def float_memory(nodes, guest):
+    """
+    memory of a guest not pinned, taken on the nodes with the most free
+    memory; False if all nodes together can not host it
+    """
+    if sum(node['mem_free'] for node in nodes) < guest['memory']:
+        return False
+    memory = guest['memory']
+    for node in sorted(nodes, key=lambda node: node['mem_free'], reverse=True):
+        part = min(memory, node['mem_free'])
+        node['mem_free'] -= part
+        memory -= part
+        if memory == 0:
+            break
+    return True
+
+def plan_guests(facts, guests, used=None, housekeeping=HOUSEKEEPING_CORES):
+    """
+    place all guests (see guest_requests()) on the host NUMA nodes
+    biggest guests first (dominant share of cores or memory), on the node
+    they fill the most; the guests left span several nodes (never a real
+    time one); the guests which are not pinned only use the memory left
+    used: host cpus already pinned (default: all libvirt domains)
+    """
+    if used is None:
+        used = set() if facts.offline() else placement.pinned_cpus()
+    nodes = host_nodes(facts, used, housekeeping)
+    threads = max([len(core) for node in nodes for core in node['cores']] or [1])
+    all_cores = max(1, sum(node['total_cores'] for node in nodes))
+    all_mem = max(1, sum(node['total_mem'] for node in nodes))
+
+    def weight(guest):
+        """
+        real time guests first (most constrained), then by dominant share
+        """
+        share = max(cores_needed(guest, threads) / all_cores, guest['memory'] / all_mem)
+        return (guest['realtime'] is False, -share)
+
+    # first pass: each guest on one node, the guests which do not fit
+    # in one node span several nodes in a second pass
+    planned = []
+    for guest in sorted(guests, key=weight):
+        result = dict(guest)
+        if guest['pinned'] is False:
+            result['placement'] = None
+            planned.append(result)
+            continue
+        node = best_node(nodes, guest, cores_needed(guest, threads))
+        if node is None:
+            result['placement'] = None
+        else:
+            result['placement'] = place(guest, [node], cores_needed(guest, threads), threads)
+        planned.append(result)
+    for result in planned:
+        if result['placement'] is not None or result['realtime'] is True or result['pinned'] is False:
+            continue
+        cores = cores_needed(result, threads)
+        span = spanning_nodes(nodes, result, cores)
+        if span is not None:
+            result['placement'] = place(result, span, cores, threads)
+    floating = 0
+    for result in planned:
+        if result['pinned'] is False and float_memory(nodes, result) is True:
+            result['floating'] = True
+            floating += 1
+
+    placed = [guest for guest in planned if guest['placement'] is not None]
+    spanning = sum(1 for guest in placed if guest['placement']['spanning'] is True)
+    return {
+        'guests': planned,
+        'nodes': nodes,
+        'placed': len(placed),
+        'spanning': spanning,
+        'floating': floating,
+        'unplaced': len(planned) - len(placed) - floating,
+    }
+
+def plan_placements(plan):
+    """
+    placement of each guest by name (None: not placed)
+    """
+    return {guest['name']: guest['placement'] for guest in plan['guests']}
+
+def show_plan(plan, guests=True):
+    """
+    per guest pinning, leftover capacity of each node, spanning ratio
+    """
+    util.print_summary("\nNUMA plan")
+    if guests is True:
+        print("{:<24s} {:<12s} {:>5s} {:>10s} {:>7s} {:>6s} {:<16s} {:<10s}".format(
+            "name", "scenario", "vcpu", "mem(MiB)", "hp(kB)", "nodes", "vcpupin", "emulator"))
+        for guest in plan['guests']:
+            todo = guest['placement']
+            line = "{:<24s} {:<12s} {:>5d} {:>10d} {:>7s} ".format(
+                guest['name'], guest['scenario'], guest['vcpu'], guest['memory'] // 1024,
+                str(guest['size'] or "-"))
+            if guest.get('floating') is True:
+                print(line+"{:>6s}".format("-")+" floating (not pinned)")
+            elif todo is None:
+                print(line+"{:>6s}".format("-")+" not placed")
+            else:
+                print(line+"{:>6s} {:<16s} {:<10s}".format(todo['nodeset'],
+                                                          util.cpulist_to_str(todo['vcpupin']),
+                                                          todo['emulatorpin']))
+
+    print("\n{:>5s} {:>11s} {:>12s} {:>20s} {:>20s} {:<12s}".format(
+        "node", "free cores", "free(MiB)", "free pages", "pool increase", "housekeeping"))
+    for node in plan['nodes']:
+        pages = ",".join(str(node['pages'][size])+"x"+hp.size_to_str(size)
+                         for size in sorted(node['pages']) if node['pages'][size]) or "-"
+        grow = ",".join(str(node['grow'][size])+"x"+hp.size_to_str(size)
+                        for size in sorted(node['grow'])) or "-"
+        print("{:>5d} {:>11d} {:>12d} {:>20s} {:>20s} {:<12s}".format(
+            node['id'], len(node['cores']), node['mem_free'] // 1024, pages, grow,
+            util.cpulist_to_str(node['housekeeping']) or "-"))
+
+    nospan = plan['placed'] - plan['spanning']
+    print("\nplaced: {} of {} guests, spanning/non spanning: {}/{} ({:.3f}), floating: {}".format(
+        plan['placed'], plan['placed'] + plan['floating'] + plan['unplaced'], plan['spanning'],
+        nospan, plan['spanning'] / max(nospan, 1), plan['floating']))
+    if plan['unplaced']:
+        util.print_warning(str(plan['unplaced'])+" guests do not fit on this host")
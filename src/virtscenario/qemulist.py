@@ -19,6 +19,8 @@ Qemu list of options and other VAR
 
 OVMF_PATH = "/usr/share/qemu"
 OVMF_VARS = "/var/lib/libvirt/qemu/nvram"
+# libvirt RelaxNG schemas (domain.rng)
+LIBVIRT_SCHEMAS = "/usr/share/libvirt/schemas"
 
 # qemu-system-x86_64 -machine help
 LIST_MACHINETYPE = ['microvm', 'xenfv-4.2', 'xenfv', 'xenfv-3.1', 'pc', 'pc-i440fx-6.2',
@@ -0,0 +1,123 @@
+# Authors: Antoine Ginies <aginies@suse.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Real time host: CPU isolation on the kernel command line, and check that
+no housekeeping thread (emulator, iothread) runs on an isolated cpu
+https://docs.kernel.org/admin-guide/kernel-parameters.html
+"""
+
+import xml.etree.ElementTree as ET
+import virtscenario.util as util
+
+PROC_CMDLINE = "/proc/cmdline"
+# no load balancing and no managed irq on the isolated cpus
+ISOLCPUS_FLAGS = "managed_irq,domain"
+KERNEL_PARAMS = ['isolcpus', 'nohz_full', 'rcu_nocbs']
+# vcpu scheduler: above all normal threads, below the kernel threads
+VCPU_SCHED = {
+    'scheduler': "fifo",
+    'priority': 1,
+}
+# threads of a domain which must not run on an isolated cpu
+HOUSEKEEPING_PINS = ['emulatorpin', 'iothreadpin']
+
+def parse_cmdline(data):
+    """
+    kernel command line to a dict, parameter without value is ""
+    """
+    params = {}
+    for item in data.split():
+        key, _, value = item.partition('=')
+        params[key] = value
+    return params
+
+def param_cpus(value):
+    """
+    cpus of a parameter value, without the flags (isolcpus=domain,2-5)
+    """
+    cpulist = [item for item in value.split(',') if item and item[0].isdigit()]
+    return set(util.parse_cpulist(','.join(cpulist)))
+
+def missing_params(cmdline, isolated):
+    """
+    parameters which do not cover all isolated cpus
+    the wanted value keep the cpus already set (other real time guests)
+    """
+    missing = []
+    for param in KERNEL_PARAMS:
+        current = param_cpus(cmdline.get(param, ""))
+        if set(isolated) <= current:
+            continue
+        wanted = util.cpulist_to_str(current | set(isolated))
+        if param == "isolcpus":
+            wanted = ISOLCPUS_FLAGS+","+wanted
+        missing.append({
+            'param': param,
+            'current': cmdline.get(param),
+            'wanted': wanted,
+            })
+    return missing
+
+def isolated_cpus(cmdline):
+    """
+    cpus already isolated by the kernel command line
+    """
+    return param_cpus(cmdline.get("isolcpus", ""))
+
+def domains_pins(xmls, skip=None):
+    """
+    housekeeping pinning of all domains: list of (domain, element, cpus)
+    skip: the domain being prepared (its previous definition)
+    """
+    pins = []
+    for xml in xmls:
+        try:
+            root = ET.fromstring(xml)
+        except ET.ParseError:
+            continue
+        name = root.findtext('name')
+        if name == skip:
+            continue
+        for tag in HOUSEKEEPING_PINS:
+            for pin in root.findall("./cputune/"+tag):
+                pins.append((name, tag, util.parse_cpulist(pin.get('cpuset', ""))))
+    return pins
+
+def housekeeping_conflicts(isolated, pins):
+    """
+    housekeeping pinning landing on an isolated cpu
+    """
+    conflicts = []
+    for name, tag, cpus in pins:
+        overlap = set(cpus) & set(isolated)
+        if overlap:
+            conflicts.append({
+                'name': name,
+                'pin': tag,
+                'cpus': util.cpulist_to_str(overlap),
+                })
+    return conflicts
+
+def show_conflicts(conflicts):
+    """
+    show the housekeeping threads on isolated cpus
+    """
+    if not conflicts:
+        util.print_ok("No housekeeping thread on an isolated cpu")
+        return
+    for conflict in conflicts:
+        util.print_error(str(conflict['name'])+": "+conflict['pin']+" on isolated cpus "
+                         +conflict['cpus'])
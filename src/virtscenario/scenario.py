@@ -17,7 +17,6 @@
 Scenario definition
 """
 
-import virtscenario.util as util
 import virtscenario.configuration as c
 import virtscenario.features as f
 
@@ -50,6 +49,7 @@ class Scenarios():
         self.video = None
         self.usb = None
         self.security = None
+        self.memballoon = None
 
     def computation(self):
         """
@@ -62,15 +62,16 @@ class Scenarios():
         self.watchdog = c.BasicConfiguration.watchdog(self, "i6300esb", "poweroff")
         self.ondef = c.BasicConfiguration.ondef(self, "restart", "restart", "restart")
         self.features = c.BasicConfiguration.features(self, "<acpi/><apic/>")
-        self.iothreads = c.BasicConfiguration.iothreads(self, "4")
         self.video = c.BasicConfiguration.video(self, "qxl")
-        # Set some expected features
+        # Set some expected features (iothreads are sized in storage_perf)
         f.Features.cpu_perf(self)
         f.Features.features_perf(self)
         f.Features.memory_perf(self)
         f.Features.storage_perf(self)
         f.Features.network_perf(self)
         f.Features.clock_perf(self)
+        # the memory of the guest is never taken back
+        self.memballoon = c.BasicConfiguration.memballoon(self, "none")
         return self
 
     def desktop(self):
@@ -97,15 +98,15 @@ class Scenarios():
         #diskdata = f.Disk("file", "none", "vda", "virtio", "/tmp", self.name['VM_name'], "qcow2")
         #self.disk = c.ComplexConfiguration.disk(self, diskdata)
 
-        self.iothreads = c.BasicConfiguration.iothreads(self, "4")
+        self.iothreads = c.BasicConfiguration.iothreads(self, f.iothreads_number(self.vcpu['vcpu'], 1))
         # network
-        macaddress = util.macaddress()
-        self.network = c.ComplexConfiguration.network(self, macaddress, "default", "e1000")
+        f.Features.network_perf(self)
 
         # Set some expected features
         f.Features.features_perf(self)
         f.Features.clock_perf(self)
         f.Features.video_perf(self)
+        f.Features.memory_density(self)
         return self
 
     def testing_os(self):
@@ -139,11 +140,10 @@ class Scenarios():
 
         self.cpumode = c.BasicConfiguration.cpumode_pass(self, "off", "")
         self.power = c.BasicConfiguration.power(self, "no", "no")
-        self.iothreads = c.BasicConfiguration.iothreads(self, "2")
+        self.iothreads = c.BasicConfiguration.iothreads(self, f.iothreads_number(self.vcpu['vcpu'], 1))
         self.video = c.BasicConfiguration.video(self, "qxl")
         # network
-        macaddress = util.macaddress()
-        self.network = c.ComplexConfiguration.network(self, macaddress, "default", "e1000")
+        f.Features.network_perf(self, "on")
 
         # Set some expected features
         f.Features.features_perf(self)
@@ -154,6 +154,14 @@ class Scenarios():
     def soft_rt_vm(self):
         """
         soft Real Time VM
+        vcpu on isolated host cores (fifo), housekeeping threads elsewhere,
+        locked memory, no balloon
         """
         self.name = c.BasicConfiguration.name(self, "soft_rt_vm")
+        self.osdef = c.BasicConfiguration.osdef(self, "x86_64", "pc-q35-6.2", "hd")
+        self.ondef = c.BasicConfiguration.ondef(self, "destroy", "restart", "destroy")
+        self.video = c.BasicConfiguration.video(self, "virtio")
+        f.Features.realtime_perf(self)
+        f.Features.storage_perf(self)
+        f.Features.network_perf(self)
         return self
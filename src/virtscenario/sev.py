@@ -36,6 +36,17 @@ SEV_POLICY_DOMAIN = 0x10
 # The guest must not be transmitted to another platform that is not SEV capable when set.
 SEV_POLICY_SEV = 0x20
 
+def domain_capabilities():
+    """
+    domain capabilities XML: libvirt API if available, else virsh
+    return xmldata, errs
+    """
+    import virtscenario.libvirtconn as libvirtconn
+    xmldata = libvirtconn.domain_capabilities()
+    if xmldata is not None:
+        return xmldata, ""
+    return util.system_command(["virsh", "domcapabilities"])
+
 class SevNotSupported(BaseException):
     """
     SEV is not supported
@@ -66,16 +77,20 @@ class SevInfo:
         """
         return self.sev_supported
 
-    def host_detect(self):
+    def host_detect(self, xmldata=""):
         """
         Detect SEV features from the 'virsh domcapabilities' XML outout
+        xmldata: output already captured (host snapshot), None if not available
         """
 
         try:
-            xmldata, errs = util.system_command("virsh domcapabilities")
-            if errs:
-                print(errs)
+            if xmldata is None:
                 return
+            if xmldata == "":
+                xmldata, errs = domain_capabilities()
+                if errs:
+                    print(errs)
+                    return
             root = ET.fromstring(xmldata)
             feature_list = root.findall("./features/sev[@supported='yes']")
             if len(feature_list) == 0:
@@ -0,0 +1,119 @@
+# Authors: Antoine Ginies <aginies@suse.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Write sysfs / procfs knobs directly (no shell)
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import virtscenario.util as util
+
+def write_knob(path, value, create=False):
+    """
+    write one knob, return a result dict with timing
+    create: the file could not exist (output tree of an offline host)
+    """
+    result = {
+        'path': path,
+        'value': str(value),
+        'ok': True,
+        'error': None,
+    }
+    start = time.perf_counter()
+    try:
+        flags = os.O_WRONLY | os.O_TRUNC
+        if create is True:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            flags |= os.O_CREAT
+        fdknob = os.open(path, flags, 0o644)
+        try:
+            os.write(fdknob, str(value).encode('UTF-8'))
+        finally:
+            os.close(fdknob)
+    except OSError as exc:
+        result['ok'] = False
+        result['error'] = exc.strerror
+    result['time'] = time.perf_counter() - start
+    return result
+
+def apply_knobs(knobs, jobs=16, create=False):
+    """
+    write all independent knobs concurrently
+    knobs: list of (path, value)
+    """
+    if not knobs:
+        return []
+    with ThreadPoolExecutor(max_workers=min(jobs, len(knobs))) as executor:
+        return list(executor.map(lambda knob: write_knob(knob[0], knob[1], create), knobs))
+
+def read_knob(path):
+    """
+    current value of a knob, None if not readable
+    for a list of choices ("[mq-deadline] kyber none") the selected one
+    """
+    try:
+        with open(path) as file_h:
+            value = file_h.read().strip()
+    except OSError:
+        return None
+    if '[' in value and ']' in value:
+        return value[value.index('[')+1:value.index(']')]
+    return value
+
+def diff_knobs(knobs, read=read_knob):
+    """
+    compare the desired value of the knobs with the current one
+    knobs: list of (path, value), read: function returning the current value
+    """
+    diff = []
+    for path, value in knobs:
+        current = read(path)
+        diff.append({
+            'path': path,
+            'current': current,
+            'value': str(value),
+            'change': current != str(value),
+            })
+    return diff
+
+def show_diff(diff):
+    """
+    show current -> desired value of each knob
+    """
+    for knob in diff:
+        if knob['change'] is True:
+            util.print_warning(knob['path']+": "+str(knob['current'])+" -> "+knob['value'])
+        else:
+            print(knob['path']+": "+knob['value']+" (unchanged)")
+
+def show_knobs(knobs):
+    """
+    show what should be done (ie: inside a container)
+    """
+    for path, value in knobs:
+        print("echo "+str(value)+" > "+path)
+
+def show_results(results):
+    """
+    show result of each knob
+    """
+    for res in results:
+        timing = " ({:.3f}ms)".format(res['time']*1000)
+        if res['ok'] is True:
+            print(res['path']+" = "+res['value']+timing)
+        else:
+            util.print_error(res['path']+" = "+res['value']+": "+str(res['error'])+timing)
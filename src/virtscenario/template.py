@@ -67,6 +67,28 @@ MEMORY_TEMPLATE = """
 CPU_TEMPLATE = """
   <vcpu placement='static'>${vcpu}</vcpu>"""
 
+CPUTUNE_TEMPLATE = """
+  <cputune>${vcpupin}
+    <emulatorpin cpuset='${emulatorpin}'/>${iothreadpin}${vcpusched}
+  </cputune>"""
+
+VCPUPIN_TEMPLATE = """
+    <vcpupin vcpu='${vcpu}' cpuset='${cpuset}'/>"""
+
+IOTHREADPIN_TEMPLATE = """
+    <iothreadpin iothread='${iothread}' cpuset='${cpuset}'/>"""
+
+VCPUSCHED_TEMPLATE = """
+    <vcpusched vcpus='${vcpus}' scheduler='${scheduler}' priority='${priority}'/>"""
+
+NUMATUNE_TEMPLATE = """
+  <numatune>
+    <memory mode='${mode}' nodeset='${nodeset}'/>
+  </numatune>"""
+
+CPU_TOPOLOGY_TEMPLATE = """
+    <topology sockets='1' dies='1' cores='${cores}' threads='${threads}'/>"""
+
 OS_TEMPLATE = """
   <os>
     <type arch='${arch}' machine='${machine}'>hvm</type>
@@ -78,6 +100,18 @@ HUGEPAGES_TEMPLATE = """
     <hugepages/>
   </memoryBacking>"""
 
+HUGEPAGES_PAGE_TEMPLATE = """
+  <memoryBacking>
+    <hugepages>
+      <page size='${size}' unit='KiB' nodeset='${nodeset}'/>
+    </hugepages>${options}
+  </memoryBacking>"""
+
+# memory never swapped nor merged by KSM (real time)
+MEMORYBACKING_LOCKED = """
+    <nosharepages/>
+    <locked/>"""
+
 # virt-install --features help
 FEATURES_TEMPLATE = """
   <features>
@@ -120,6 +154,15 @@ DISK_TEMPLATE = """
       <!--<address type='pci' domain='0x0000' bus='0x06' slot='0x00' function='0x0'/>-->
     </disk>"""
 
+# virtio-blk: disk bound to an iothread, one queue per vcpu
+DISK_VIRTIO_TEMPLATE = """
+    <disk type='${disk_type}' device='disk'>
+      <driver name='qemu' type='${format}' cache='${disk_cache}' iothread='${iothread}' queues='${queues}'/>
+      <source file='${source_file}'/>
+      <target dev='${disk_target}' bus='${disk_bus}'/>
+      <!--<address type='pci' domain='0x0000' bus='0x06' slot='0x00' function='0x0'/>-->
+    </disk>"""
+
 DISK_PHYS_TEMPLATE = """
     <pool type='disk'>
       <name>${name}</name>
@@ -137,6 +180,17 @@ INTERFACE_TEMPLATE = """
       <!--<address type='pci' domain='0x0000' bus='0x01' slot='0x00' function='0x0'/>-->
     </interface>"""
 
+# vhost kernel backend, multiqueue (tx_queue_size is only for vhost-user)
+# options: iommu='on' for a guest with encrypted memory (SEV)
+INTERFACE_VIRTIO_TEMPLATE = """
+    <interface type='network'>
+      <mac address='${mac_address}'/>
+      <source network='${network}'/>
+      <model type='virtio'/>
+      <driver name='vhost' queues='${queues}' rx_queue_size='${rx_queue_size}'${options}/>
+      <!--<address type='pci' domain='0x0000' bus='0x01' slot='0x00' function='0x0'/>-->
+    </interface>"""
+
 CONSOLE_TEMPLATE = """
     <console type='pty'>
       <target type='virtio' port='0'/>
@@ -177,12 +231,18 @@ WATCHDOG_TEMPLATE = """
       <!--<address type='pci' domain='0x0000' bus='0x10' slot='0x00' function='0x0'/>-->
     </watchdog>"""
 
+MEMBALLOON_NONE_TEMPLATE = """
+    <memballoon model='none'/>"""
+
 MEMBALLOON_TEMPLATE = """
-    <memballoon model='virtio'>
-      <!--<address type='pci' domain='0x0000' bus='0x09' slot='0x00' function='0x0'/>-->
+    <memballoon model='${model}'${options}>
+      <!--<address type='pci' domain='0x0000' bus='0x09' slot='0x00' function='0x0'/>-->${stats}
       <driver iommu='on'/>
     </memballoon>"""
 
+MEMBALLOON_STATS_TEMPLATE = """
+      <stats period='${period}'/>"""
+
 RNG_TEMPLATE = """
     <rng model='virtio'>
       <backend model='random'>/dev/urandom</backend>
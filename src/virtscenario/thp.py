@@ -0,0 +1,96 @@
+# Authors: Antoine Ginies <aginies@suse.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Transparent hugepages policy of each scenario
+https://docs.kernel.org/admin-guide/mm/transhuge.html
+"""
+
+THP_PATH = "/sys/kernel/mm/transparent_hugepage"
+KHUGEPAGED_PATH = THP_PATH+"/khugepaged"
+
+# QEMU madvise() the guest RAM: 'madvise' gives THP to the guests only
+# defrag 'madvise' (kernel default) compacts memory at page fault: stalls
+# 'defer' lets kcompactd do it, khugepaged collapses the pages later
+# None: not changed
+THP_PROFILES = {
+    'computation': {
+        'enabled': "madvise",
+        # long running guests: pay the compaction once at start
+        'defrag': "madvise",
+        'pages_to_scan': 4096,
+        'scan_sleep_millisecs': 10000,
+        'max_ptes_none': 511,
+    },
+    'desktop': {
+        'enabled': "madvise",
+        # interactive guests: no stall, collapse faster in background
+        'defrag': "defer",
+        'pages_to_scan': 4096,
+        'scan_sleep_millisecs': 1000,
+        # do not fill back memory freed by the balloon or merged by KSM
+        'max_ptes_none': 64,
+    },
+    'securevm': {
+        'enabled': "madvise",
+        'defrag': "defer+madvise",
+        'pages_to_scan': None,
+        'scan_sleep_millisecs': None,
+        'max_ptes_none': None,
+    },
+    # memory is backed by locked static hugepages: no compaction and no
+    # khugepaged thread disturbing the isolated cpus
+    'softrtvm': {
+        'enabled': "never",
+        'defrag': "never",
+        'pages_to_scan': None,
+        'scan_sleep_millisecs': None,
+        'max_ptes_none': None,
+    },
+}
+
+# knob: file, title in the comparison table
+THP_KNOBS = [
+    ('enabled', THP_PATH+"/enabled", "THP enabled"),
+    ('defrag', THP_PATH+"/defrag", "THP defrag"),
+    ('pages_to_scan', KHUGEPAGED_PATH+"/pages_to_scan", "khugepaged pages"),
+    ('scan_sleep_millisecs', KHUGEPAGED_PATH+"/scan_sleep_millisecs", "khugepaged sleep ms"),
+    ('max_ptes_none', KHUGEPAGED_PATH+"/max_ptes_none", "khugepaged ptes_none"),
+]
+
+def plan_knobs(scenario):
+    """
+    THP knobs of the scenario, [] for an unknown one
+    """
+    profile = THP_PROFILES.get(scenario)
+    if profile is None:
+        return []
+    return [(path, profile[name]) for name, path, _ in THP_KNOBS if profile[name] is not None]
+
+def report(knobs, read):
+    """
+    comparison table (see util.print_recommended) of the recommended
+    and current value of each knob, read: function returning the current value
+    """
+    titles = {path: title for _, path, title in THP_KNOBS}
+    toreport = {}
+    for number, (path, value) in enumerate(knobs, start=1):
+        current = read(path)
+        toreport[number] = {
+            'title': titles[path],
+            'rec': str(value),
+            'set': "-" if current is None else current,
+            }
+    return toreport
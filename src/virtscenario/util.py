@@ -17,19 +17,104 @@
 Util
 """
 
+import os
+import shlex
 import subprocess
-import yaml
+import threading
+import uuid
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 
-def system_command(cmd):
+# deadline (seconds) for a command, None for long running one
+DEFAULT_TIMEOUT = 60
+
+def read_pipe(pipe, lines, stream, keep=True):
+    """
+    read a pipe line by line until the end (no pipe full deadlock)
+    keep: store the streamed lines too
+    """
+    for line in iter(pipe.readline, ''):
+        if stream is None or keep is True:
+            lines.append(line)
+        if stream is not None:
+            stream(line.rstrip('\n'))
+    pipe.close()
+
+def write_pipe(pipe, data):
+    """
+    send data to the command stdin
+    """
+    try:
+        pipe.write(data)
+        pipe.close()
+    except (BrokenPipeError, ValueError):
+        pass
+
+def run_command(cmd, stdin=None, timeout=DEFAULT_TIMEOUT, stream=None):
+    """
+    Launch a command (argv list, no shell)
+    stdin: optional data to send to the command
+    timeout: real deadline, the command is killed after it
+    stream: optional function called for each stdout/stderr line as it comes
+    (the streamed stderr lines are already shown: not in errs)
+    return returncode, out, errs
+    """
+    if isinstance(cmd, str):
+        cmd = shlex.split(cmd)
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                stdin=subprocess.DEVNULL if stdin is None else subprocess.PIPE,
+                                encoding='UTF-8', errors='replace')
+    except OSError as exc:
+        return 127, "", cmd[0]+": "+exc.strerror+"\n"
+
+    out = []
+    errs = []
+    threads = [threading.Thread(target=read_pipe, args=(proc.stdout, out, stream)),
+               threading.Thread(target=read_pipe, args=(proc.stderr, errs, stream, False))]
+    if stdin is not None:
+        threads.append(threading.Thread(target=write_pipe, args=(proc.stdin, stdin)))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    try:
+        returncode = proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        returncode = proc.wait()
+        errs.append(cmd[0]+": killed after "+str(timeout)+"s\n")
+    for thread in threads:
+        thread.join(timeout=1)
+    return returncode, ''.join(out), ''.join(errs)
+
+def system_command(cmd, stdin=None, timeout=DEFAULT_TIMEOUT, stream=None):
     """
-    Launch a system command
+    Launch a system command (argv list, no shell)
+    return out, errs (errs is set if the command failed)
     """
-    proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    proc.wait()
-    out, errs = proc.communicate(timeout=2)
-    out = str(out, 'UTF-8')
+    returncode, out, errs = run_command(cmd, stdin, timeout, stream)
+    if returncode != 0 and not errs:
+        errs = cmd_to_str(cmd)+": exit code "+str(returncode)
     return out, errs
 
+def run_commands(cmds, jobs=None, timeout=DEFAULT_TIMEOUT):
+    """
+    run independent commands concurrently
+    return the list of (out, errs) in the same order
+    """
+    if not cmds:
+        return []
+    with ThreadPoolExecutor(max_workers=jobs or len(cmds)) as executor:
+        return list(executor.map(lambda cmd: system_command(cmd, timeout=timeout), cmds))
+
+def cmd_to_str(cmd):
+    """
+    argv to a printable command line
+    """
+    if isinstance(cmd, str):
+        return cmd
+    return ' '.join(shlex.quote(arg) for arg in cmd)
+
 def esc(code):
     """
     Better layout with some color
@@ -53,12 +138,12 @@ def print_warning(text):
     formated_text = "\n     "+esc('31;1;1') +text.upper()+esc(0)+"\n"
     print(formated_text)
 
-def print_recommended(toreport):
+def print_recommended(toreport, current="User Settings"):
     """
-    recommended VS user setting
+    recommended VS user setting (or the current one of the host)
     """
     print("####################################################################################")
-    print("#{:^20s}|{:^30s}|{:^30s}#".format("Parameter", "Recommended", "User Settings"))
+    print("#{:^20s}|{:^30s}|{:^30s}#".format("Parameter", "Recommended", current))
     print("####################################################################################")
     total = len(toreport)+1
     for number in range(1, int(total)):
@@ -100,6 +185,22 @@ def print_data(data, value):
     formated_text = "\n"+esc('101;1;1')+data+" "+esc(0)+" "+value.rstrip()
     print(formated_text.strip())
 
+def stable_uuid(name):
+    """
+    uuid of a guest, always the same for a name
+    """
+    return str(uuid.uuid5(uuid.uuid5(uuid.NAMESPACE_DNS, "virt-scenario"), name))
+
+def stable_macaddress(name, retry=0):
+    """
+    mac address of a guest (qemu 52:54:00 prefix), always the same for a name
+    only 24 bits: retry gives an other address for the same name (collision)
+    """
+    if retry:
+        name += "#"+str(retry)
+    digest = hashlib.sha256(name.encode('UTF-8')).hexdigest().upper()
+    return "52:54:00:"+digest[0:2]+":"+digest[2:4]+":"+digest[4:6]
+
 def macaddress():
     """
     generate a mac address
@@ -129,14 +230,68 @@ def bytes_to_gb(bytes):
     gib = round(gib, 2)
     return gib
 
-def validate_file(file):
+def parse_cpulist(cpulist):
+    """
+    convert a sysfs cpu list (0-3,8,10-11) to a list of int
+    """
+    cpus = []
+    for item in cpulist.strip().split(','):
+        if item == "":
+            continue
+        if '-' in item:
+            first, last = item.split('-')
+            cpus.extend(range(int(first), int(last)+1))
+        else:
+            cpus.append(int(item))
+    return cpus
+
+def cpulist_to_str(cpus):
+    """
+    convert a list of cpu to a cpuset string (0-3,8,10-11)
+    """
+    ranges = []
+    for cpu in sorted(set(cpus)):
+        if ranges and cpu == ranges[-1][1]+1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(str(first) if first == last else str(first)+"-"+str(last)
+                    for first, last in ranges)
+
+def memory_to_kib(value, unit):
     """
-    validate the yaml file
+    convert a libvirt memory value to KiB
     """
+    unit = str(unit).lower()
+    factor = {'b': 1/1024, 'bytes': 1/1024, 'k': 1, 'kb': 1, 'kib': 1,
+              'm': 1024, 'mb': 1024, 'mib': 1024, 'g': 1024**2, 'gb': 1024**2,
+              'gib': 1024**2, 't': 1024**3, 'tb': 1024**3, 'tib': 1024**3}
+    return int(float(value) * factor.get(unit, 1))
+
+def file_key(file):
+    """
+    identify a version of a file: path, mtime, size
+    """
+    stat = os.stat(file)
+    return (os.path.realpath(file), stat.st_mtime_ns, stat.st_size)
+
+def load_yaml(file):
+    """
+    parse a yaml file, with the libyaml C loader if available
+    """
+    import yaml
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
     with open(file, 'r') as stream:
-        try:
-            yaml.load(stream, Loader=yaml.FullLoader)
-        except yaml.YAMLError as exc:
-            print(exc)
-            print_error(' Please fix the Yaml file... exiting')
-            exit(1)
+        return yaml.load(stream, Loader=loader)
+
+def validate_file(file):
+    """
+    validate the yaml file, return its content
+    """
+    import yaml
+    try:
+        return load_yaml(file)
+    except yaml.YAMLError as exc:
+        print(exc)
+        print_error(' Please fix the Yaml file... exiting')
+        exit(1)
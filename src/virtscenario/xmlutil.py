@@ -17,8 +17,12 @@
 parse VM xml file
 """
 
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import xml.etree.ElementTree as ET
 import virtscenario.util as util
+import virtscenario.qemulist as qemulist
 
 #Element.iter(‘tag’) -Iterates over all the child elements(Sub-tree elements)
 #Element.findall(‘tag’) -Finds only elements with a tag which are direct children of
@@ -35,13 +39,135 @@ import virtscenario.util as util
 #Element.pop() -delete a particular attribute.
 #Element.remove() -to delete a complete tag.
 
-def add_loader_nvram(file, loader_file, nvram_file):
+WARNING_HEADER = "<!-- WARNING: THIS IS A GENERATED FILE FROM VIRT-SCENARIO -->\n"
+
+def from_string(xml_all):
     """
-    add an element in the Tree
+    parse the concatenated templates, return the root element (domain)
+    """
+    return ET.fromstring(xml_all)
+
+def to_string(root):
+    """
+    serialize the domain with the warning header
     """
-    tree = ET.parse(file)
-    root = tree.getroot()
+    return WARNING_HEADER+ET.tostring(root, encoding='unicode')+"\n"
+
+def write_xml(file, root):
+    """
+    write the domain in the file in one go, only if it changes
+    (keep the mtime of an unchanged guest)
+    """
+    data = to_string(root)
+    try:
+        with open(file) as file_h:
+            if file_h.read() == data:
+                return False
+    except OSError:
+        pass
+    with open(file, 'w') as file_h:
+        file_h.write(data)
+    return True
+
+# compiled RelaxNG schemas, loaded only once; the lxml error_log of a
+# validator can not be shared between threads: validations are serialized
+SCHEMAS = {}
+SCHEMA_LOCK = threading.Lock()
+# threads parsing the files of a directory
+VALIDATE_JOBS = 4
 
+def get_schema(name="domain"):
+    """
+    the libvirt RelaxNG schema (need lxml), compiled only once
+    return None if this is not possible
+    """
+    with SCHEMA_LOCK:
+        if name not in SCHEMAS:
+            SCHEMAS[name] = load_schema(name)
+        return SCHEMAS[name]
+
+def load_schema(name):
+    """
+    compile one libvirt RelaxNG schema, None if not possible
+    """
+    schema = None
+    rngfile = qemulist.LIBVIRT_SCHEMAS+"/"+name+".rng"
+    try:
+        from lxml import etree
+        if os.path.isfile(rngfile):
+            schema = etree.RelaxNG(etree.parse(rngfile))
+    except ImportError:
+        pass
+    except Exception as exc:
+        util.print_error("Can not load "+rngfile+": "+str(exc))
+    return schema
+
+def validate_domain(root):
+    """
+    validate the domain tree against the cached schema
+    return None if no schema available, else the list of errors
+    """
+    schema = get_schema("domain")
+    if schema is None:
+        return None
+    from lxml import etree
+    return schema_errors(schema, etree.fromstring(ET.tostring(root)))
+
+def schema_errors(schema, doc):
+    """
+    list of errors of a lxml document
+    """
+    with SCHEMA_LOCK:
+        if schema.validate(doc) is True:
+            return []
+        return [str(error) for error in schema.error_log]
+
+def validate_file(file):
+    """
+    validate an XML domain file
+    """
+    schema = get_schema("domain")
+    if schema is None:
+        return file, None
+    from lxml import etree
+    try:
+        errors = schema_errors(schema, etree.parse(file))
+    except (etree.XMLSyntaxError, OSError) as exc:
+        errors = [str(exc)]
+    return file, errors
+
+def validate_dir(path, jobs=None):
+    """
+    validate all XML files of a directory concurrently (at most
+    VALIDATE_JOBS threads by default)
+    return a dict: file -> errors (None if no schema available)
+    """
+    all_files = []
+    for files in sorted(os.listdir(path)):
+        if files.endswith(".xml"):
+            all_files.append(os.path.join(path, files))
+    if not all_files:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(jobs or VALIDATE_JOBS, len(all_files))) as executor:
+        return dict(executor.map(validate_file, all_files))
+
+def show_validation(file, errors):
+    """
+    show validation result of one file
+    """
+    if errors is None:
+        util.print_error(file+": no libvirt schema available (lxml, "+qemulist.LIBVIRT_SCHEMAS+")")
+    elif errors:
+        util.print_error(file+" fails to validate")
+        for error in errors:
+            print("  "+error)
+    else:
+        util.print_ok(file+" validates")
+
+def add_loader_nvram(root, loader_file, nvram_file):
+    """
+    add an element in the Tree
+    """
     osdef = root.find('os')
     # python >= 3.9
     #ET.indent(root, space='    ', level=0)
@@ -54,7 +180,7 @@ def add_loader_nvram(file, loader_file, nvram_file):
     nvram = ET.SubElement(osdef, 'nvram')
     nvram.text = nvram_file
     nvram.tail = "\n  "
-    ET.ElementTree(root).write(file)
+    return root
 
 def show_tag(root, child):
     """
@@ -85,14 +211,12 @@ def show_attrib_text(dev):
         #for key, value in sube.items():
         #    util.print_data(key, value)
 
-def show_from_xml(file):
+def show_from_xml(root):
     """
-    show all data from the XML file
+    show all data from the XML domain
     """
     # show all the XML file
     # print(ET.tostring(root, encoding='utf8').decode('utf8'))
-    tree = ET.parse(file)
-    root = tree.getroot()
     for child in root:
         if child.tag not in ["devices", "pm", "os", "features", "clock"]:
             util.print_title(child.tag.upper())